@@ -1,13 +1,34 @@
+import asyncio
+import signal
+
 from fastapi import (
     FastAPI,
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from routers import model_router
-from tools.connect import get_port
+from routers import (
+    admin_router,
+    export_router,
+    model_router,
+    storage_router,
+    task_router,
+)
+from tools.connect import check_model_server, get_port, get_workers
+from tools.ingest_io import install_spool_file
+from tools.hot_models import HOT_MODELS
+from tools.ingest_journal import get_ingest_journal
+from tools.metrics import watch_event_loop_lag
+from tools.model_handler import recover_ingests
+from tools.model_servers import MODEL_SERVERS
+from tools.settings import SETTINGS_LOG, get_settings, make_folders
+from tools.state_backend import get_state_backend, reload_on_signal
+from tools.storage_gc import STORAGE_GC
+from tools.webhooks import get_webhook_outbox
 
 app = FastAPI()
+# Uploads are admitted on their length before their body is spooled.
+app.add_middleware(model_router.UploadAdmission)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -16,9 +37,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.include_router(model_router.router)
+app.include_router(task_router.router)
+app.include_router(storage_router.router)
+app.include_router(export_router.router)
+app.include_router(admin_router.router)
 # app.include_router(ws_router.router)
 
 
+@app.on_event("startup")
+async def start_background_workers():
+    # Invalid settings fail the startup, they are served from memory afterwards.
+    SETTINGS_LOG.info(f"Settings : {get_settings().public()}")
+    make_folders(get_settings())
+    try:
+        await asyncio.to_thread(check_model_server)
+    except Exception as e:
+        SETTINGS_LOG.warning(f"Model server not reachable yet. Details : {e}")
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_on_signal)
+    except (AttributeError, NotImplementedError, RuntimeError) as e:
+        # No SIGHUP on Windows, nor off the main thread (embedded servers).
+        SETTINGS_LOG.warning(f"Reload on SIGHUP unavailable. Details : {e}")
+    # Spool uploads next to the models so they can be linked into place.
+    install_spool_file()
+    # Take over the locks of crashed workers and prune old tasks.
+    get_state_backend().start()
+    STORAGE_GC.start()
+    # Resume or clean up the ingests of instances that stopped mid-way.
+    get_ingest_journal().start(recover_ingests)
+    # Send the completion callbacks still in the outbox, then the new ones.
+    get_webhook_outbox().start()
+    # Check the health and load of the model servers that creates are placed on.
+    MODEL_SERVERS.start()
+    # Keep the HOT_MODELS and the most used ones loaded on the model servers.
+    HOT_MODELS.start()
+    app.state.event_loop_lag = asyncio.create_task(watch_event_loop_lag())
+
+
 @app.get("/", tags=["Test model handler alive"])
 async def check_alive():
     return JSONResponse(
@@ -30,6 +85,5 @@ async def check_alive():
 if __name__ == "__main__":
     import uvicorn
 
-    # num_workers = multiprocessing.cpu_count() *2  # CPU 核心數 * 2
-    # num_workers = multiprocessing.cpu_count()
-    uvicorn.run("app:app", host="0.0.0.0", port=get_port())
+    # Workers share locks and tasks through STATE_BACKEND=sqlite.
+    uvicorn.run("app:app", host="0.0.0.0", port=get_port(), workers=get_workers())
@@ -0,0 +1,118 @@
+import asyncio
+import hmac
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Header, Query, Response, status
+from fastapi.responses import JSONResponse
+
+from tools.connect import get_admin_token
+from tools.profiler import PROFILER, ProfileRunning
+from tools.settings import get_settings
+from tools.state_backend import reload_workers
+from utils import ResponseErrorHandler, config_logger
+
+router = APIRouter()
+
+ADMIN_LOG = config_logger(
+    file_name="admin.log",
+    write_mode="a",
+    level="info",
+    logger_name="admin_router_logger",
+)
+
+
+def error_response(status_code: int, loc: str, message: str, input: dict):
+    error_handler = ResponseErrorHandler()
+    error_handler.add(
+        type=error_handler.ERR_VALIDATE,
+        loc=[loc],
+        msg=message,
+        input=input,
+    )
+    return Response(
+        status_code=status_code,
+        content=json.dumps(error_handler.errors),
+        media_type="application/json",
+    )
+
+
+def check_admin(token: Optional[str]):
+    # Returns an error response unless the request carries ADMIN_TOKEN.
+    admin_token = get_admin_token()
+    if admin_token is None:
+        return error_response(
+            status.HTTP_403_FORBIDDEN,
+            ResponseErrorHandler.LOC_REQUEST,
+            "Admin endpoints are disabled, set ADMIN_TOKEN to enable them.",
+            dict(),
+        )
+    if token is None or not hmac.compare_digest(token, admin_token):
+        return error_response(
+            status.HTTP_401_UNAUTHORIZED,
+            ResponseErrorHandler.LOC_REQUEST,
+            "Invalid admin token.",
+            dict(),
+        )
+    return None
+
+
+@router.post("/admin/profile", tags=["Admin"])
+async def profile(
+    seconds: float = Query(default=10, gt=0, le=300),
+    interval: float = Query(default=0.01, ge=0.001, le=1),
+    slow_callback: float = Query(default=0.1, gt=0),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    # Samples every thread of this worker and reports event loop stalls.
+    rejection = check_admin(x_admin_token)
+    if rejection is not None:
+        return rejection
+    ADMIN_LOG.info(f"Start profile for {seconds} seconds.")
+    try:
+        content = await PROFILER.profile(seconds, interval, slow_callback)
+    except ProfileRunning as e:
+        return error_response(
+            status.HTTP_409_CONFLICT,
+            ResponseErrorHandler.LOC_REQUEST,
+            str(e),
+            {"seconds": seconds},
+        )
+    return JSONResponse(status_code=200, content=content)
+
+
+@router.get("/admin/settings", tags=["Admin"])
+async def settings(x_admin_token: Optional[str] = Header(default=None)):
+    rejection = check_admin(x_admin_token)
+    if rejection is not None:
+        return rejection
+    return JSONResponse(status_code=200, content=get_settings().public())
+
+
+@router.post("/admin/settings/reload", tags=["Admin"])
+async def reload(x_admin_token: Optional[str] = Header(default=None)):
+    # Same as SIGHUP: this worker reloads, the others on their next heartbeat.
+    rejection = check_admin(x_admin_token)
+    if rejection is not None:
+        return rejection
+    try:
+        content = await asyncio.to_thread(reload_workers)
+    except ValueError as e:
+        ADMIN_LOG.error(f"Reload settings failed. Details : {e}")
+        return error_response(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ResponseErrorHandler.LOC_BODY,
+            f"Invalid settings, the running ones are kept. Details : {e}",
+            dict(),
+        )
+    except OSError as e:
+        # SETTINGS_FILE missing or unreadable.
+        ADMIN_LOG.error(f"Reload settings failed. Details : {e}")
+        return error_response(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ResponseErrorHandler.LOC_BODY,
+            f"Settings could not be read, the running ones are kept. Details : {e}",
+            dict(),
+        )
+    ADMIN_LOG.info(f"Reload settings. Details : {content}")
+    return JSONResponse(status_code=200, content=content)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import JSONResponse
+
+from tools.model_export import (
+    EXPORT_LOG,
+    ExportNotFound,
+    ModelExport,
+    SegmentsResponse,
+    segments_size,
+)
+from tools.model_registry import get_model_registry
+from utils import ResponseErrorHandler
+
+router = APIRouter()
+
+
+def export_error(e: Exception, input: dict) -> Response:
+    error_handler = ResponseErrorHandler()
+    if isinstance(e, ExportNotFound):
+        error_handler.add(
+            type=error_handler.ERR_VALIDATE,
+            loc=[error_handler.LOC_QUERY],
+            msg=str(e),
+            input=input,
+        )
+        status_code = status.HTTP_404_NOT_FOUND
+    else:
+        EXPORT_LOG.error(f"Export model error. Details : {e!r}")
+        error_handler.add(
+            type=error_handler.ERR_UNEXPECTED,
+            loc=[error_handler.LOC_UNEXPECTED],
+            msg=f"Export model error. Details : {e}",
+            input=input,
+        )
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    return Response(
+        status_code=status_code,
+        content=json.dumps(error_handler.errors),
+        media_type="application/json",
+    )
+
+
+@router.get("/model/{model}/files/", tags=["Export model"])
+async def get_model_files(model: str):
+    # What an export serves: each file and the archive, with their ETags.
+    export = None
+    try:
+        export = ModelExport(model)
+
+        def manifest():
+            files = [
+                {
+                    "name": name,
+                    "size": export.size(name),
+                    "sha256": export.digest(name)[0],
+                }
+                for name in export.names()
+            ]
+            segments, etag = export.archive()
+            return files, {"size": segments_size(segments), "etag": etag}
+
+        files, archive = await asyncio.to_thread(manifest)
+        content = {
+            "model": model,
+            "base": await asyncio.to_thread(get_model_registry().base_of, model),
+            "files": files,
+            "archive": archive,
+        }
+        return JSONResponse(status_code=200, content=content)
+    except Exception as e:
+        return export_error(e, {"model": model})
+    finally:
+        if export is not None:
+            export.close()
+
+
+@router.api_route(
+    "/model/{model}/files/{name:path}", methods=["GET", "HEAD"], tags=["Export model"]
+)
+async def export_model_file(model: str, name: str, request: Request):
+    export = None
+    try:
+        export = ModelExport(model)
+        segments, etag = await asyncio.to_thread(export.file, name)
+        return SegmentsResponse(
+            segments,
+            etag,
+            kind="file",
+            media_type="application/octet-stream",
+            filename=name.rsplit("/", 1)[-1],
+            request_headers=request.headers,
+            on_close=export.close,
+        )
+    except Exception as e:
+        if export is not None:
+            export.close()
+        return export_error(e, {"model": model, "name": name})
+
+
+@router.api_route(
+    "/model/{model}/archive/", methods=["GET", "HEAD"], tags=["Export model"]
+)
+async def export_model_archive(model: str, request: Request):
+    export = None
+    try:
+        export = ModelExport(model)
+        segments, etag = await asyncio.to_thread(export.archive)
+        return SegmentsResponse(
+            segments,
+            etag,
+            kind="archive",
+            media_type="application/zip",
+            filename=f"{model}.zip",
+            request_headers=request.headers,
+            on_close=export.close,
+        )
+    except Exception as e:
+        if export is not None:
+            export.close()
+        return export_error(e, {"model": model})
@@ -1,13 +1,41 @@
+import io
 import json
+from typing import List, Optional
+
+import httpx
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from fastapi import APIRouter, Depends, Form, Response, UploadFile, status
-from fastapi.responses import StreamingResponse
-
-from schema import CreateModel, DeleteModel
+from schema import CreateModel, DeleteModel, SyncModel
 from schema.main import DeployModel, UploadModel
+from tools.connect import (
+    get_peer_url,
+    get_replication_fanout,
+    get_warmup_keep_alive,
+    get_warmup_on_deploy,
+    get_webhook_secret,
+)
+from tools.disk_admission import AdmissionTimeout, DiskAdmission, InsufficientStorage
+from tools.eviction import MODEL_EVICTOR
+from tools.hot_models import HOT_MODELS
 from tools.model_handler import MODEL_STATUS, ModelOperator
-from utils import ResponseErrorHandler, config_logger
-from utils.background_excutor import TaskExecutor
+from tools.model_registry import get_model_registry
+from tools.model_servers import MODEL_SERVERS
+from tools.replication import SyncError, plan_sync
+from tools.settings import KEEP_ALIVE_PATTERN
+from tools.task_lanes import LANE_BULK, LANE_INTERACTIVE, get_lane
+from utils import ResponseErrorHandler, config_logger, get_uuid
 
 router = APIRouter()
 
@@ -20,15 +48,203 @@ TASK_LOG = config_logger(
 )
 
 
+class UploadAdmission:
+    """Reserves the body of an upload before FastAPI spools it.
+
+    The multipart form is read before the endpoint runs, so the upload is
+    first admitted on its ``Content-Length`` and rejected with ``507`` or
+    ``429`` before any byte reaches the volume. A body without a length is
+    only admitted by its endpoint, once spooled.
+    """
+
+    PATHS = ("/upload/", "/deploy/", "/deploy/batch/")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.PATHS:
+            await self.app(scope, receive, send)
+            return
+        size = Request(scope).headers.get("content-length", "")
+        if scope["method"] != "POST" or not size.isdigit():
+            await self.app(scope, receive, send)
+            return
+        uuid = get_uuid()
+        rejection = await admit_size(uuid, "request body", int(size))
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        scope.setdefault("state", {})["body_reservation"] = uuid
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            DiskAdmission().release(uuid)
+
+
+async def admit_upload(uuid: str, file: UploadFile, request: Request):
+    # Reserve the space of an ingest, returns an error response on rejection.
+    # The spooled body is on the volume by now, so its reservation is given
+    # back for the one the central directory of the zip gives.
+    body_reservation = getattr(request.state, "body_reservation", None)
+    if body_reservation is not None:
+        DiskAdmission().release(body_reservation)
+    return await admit_size(uuid, file.filename, DiskAdmission.estimate(file))
+
+
+async def admit_size(uuid: str, name: str, size: int):
+    error_handler = ResponseErrorHandler()
+    admission = DiskAdmission(make_room=MODEL_EVICTOR.make_room)
+    try:
+        await admission.admit(uuid, name, size)
+        return None
+    except InsufficientStorage as e:
+        status_code, headers = status.HTTP_507_INSUFFICIENT_STORAGE, None
+        message = str(e)
+    except AdmissionTimeout as e:
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        headers = {"Retry-After": str(e.retry_after)}
+        message = str(e)
+
+    TASK_LOG.warning(f"'{uuid}' Reject upload. Details : {message}")
+    error_handler.add(
+        type=error_handler.ERR_INTERNAL,
+        loc=[error_handler.ERR_INTERNAL],
+        msg=message,
+        input={"model": name},
+    )
+    return Response(
+        status_code=status_code,
+        content=json.dumps(error_handler.errors),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def detach_upload(file: UploadFile) -> UploadFile:
+    # FastAPI closes the form when the response ends, which is early when the
+    # client disconnects. The task gets its own UploadFile and closes it.
+    detached = UploadFile(
+        file=file.file, size=file.size, filename=file.filename, headers=file.headers
+    )
+    file.file = io.BytesIO()
+    return detached
+
+
+def check_callback_url(callback_url: Optional[str]):
+    # Raises a validation error unless the callback can be sent and signed.
+    if callback_url is None:
+        return
+    error_handler = ResponseErrorHandler()
+    try:
+        url = httpx.URL(callback_url)
+        valid = url.scheme in ("http", "https") and bool(url.host)
+    except httpx.InvalidURL:
+        valid = False
+    if not valid:
+        message = "'callback_url' must be an http or https URL."
+    elif get_webhook_secret() is None:
+        message = "Callbacks are disabled, set WEBHOOK_SECRET to enable them."
+    else:
+        return
+    error_handler.add(
+        type=error_handler.ERR_VALIDATE,
+        loc=[error_handler.LOC_QUERY],
+        msg=message,
+        input={"callback_url": callback_url},
+    )
+    raise RequestValidationError(error_handler.errors)
+
+
+def accepted(operator: ModelOperator):
+    # The result is posted to the callback, the events stay available.
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "task_uuid": operator.uuid,
+            "callback_url": operator.callback_url,
+            "events": f"/task/{operator.uuid}/events",
+        },
+    )
+
+
+def with_callback(operator: ModelOperator, callback_url: Optional[str]):
+    if callback_url is not None:
+        operator.callback_url = callback_url
+        operator.streamed = False
+
+
+def with_warmup(
+    operator: ModelOperator, warmup: Optional[bool], keep_alive: Optional[str]
+):
+    # Unless the request says, a keep_alive asks for a warmup, else the setting.
+    if warmup is None:
+        warmup = keep_alive is not None or get_warmup_on_deploy()
+    if warmup:
+        operator.keep_alive = keep_alive or get_warmup_keep_alive()
+
+
+def resolve_base(operator: ModelOperator, base: str, model: str) -> str:
+    # Base folder of an adapter deploy, given by name or by "sha256:<digest>"
+    # of the archive it was deployed from.
+    error_handler = ResponseErrorHandler()
+    folder = base
+    if base.startswith("sha256:"):
+        folder = get_model_registry().find_digest(base.removeprefix("sha256:"))
+    if folder is None:
+        msg = f"No model folder was deployed from '{base}'."
+    elif folder == model:
+        msg = f"'{model}' cannot be its own base."
+    elif operator.base_model_file(folder) is None:
+        msg = f"'{folder}' has no base model to build on."
+    else:
+        return folder
+    error_handler.add(
+        type=error_handler.ERR_VALIDATE,
+        loc=[error_handler.LOC_BODY, "base"],
+        msg=msg,
+        input={"base": base},
+    )
+    raise RequestValidationError(error_handler.errors)
+
+
+def progress_stream(operator: ModelOperator, cancel_on_disconnect: bool = False):
+    # Stream the task messages. With cancel_on_disconnect, the task is
+    # cancelled once its last progress stream (this one or /task/{uuid}/events)
+    # is closed by the client.
+    state = operator.state
+    state.add_subscriber(operator.uuid, 1)
+
+    async def event_generator():
+        try:
+            async for status_code, message in operator.get_status():
+                yield json.dumps({"status": status_code, "message": message}) + "\n"
+        finally:
+            # No await here, the response task is being cancelled on disconnect.
+            remaining = state.add_subscriber(operator.uuid, -1)
+            if cancel_on_disconnect and remaining == 0 and operator.alive:
+                TASK_LOG.warning(f"'{operator.uuid}' Client disconnected, cancel.")
+                operator.cancel()
+                state.request_cancel(operator.uuid)
+
+    return StreamingResponse(
+        content=event_generator(),
+        media_type="application/json",
+    )
+
+
 @router.get("/model/", tags=["Get models list"])
 async def get_models(
     # stream: bool = Query(default=True, description="Enable streaming response"),
+    merged: bool = False,
 ):
-    task_executor = TaskExecutor(max_workers=10)
+    task_executor = get_lane(LANE_INTERACTIVE)
     error_handler = ResponseErrorHandler()
     try:
         operator = ModelOperator()
-        task_executor.run_in_background(task=operator.get_model_list)
+        task_executor.run_in_background(
+            operator.run, operator.get_model_list, merged=merged
+        )
         TASK_LOG.info(f"Start get model ({operator.uuid})")
 
         async def event_generator():
@@ -55,31 +271,68 @@ async def get_models(
         )
 
 
+@router.get("/model/hot/", tags=["Get models list"])
+async def get_hot_models():
+    # Last check of the hot models scheduler, as seen by this worker.
+    return JSONResponse(status_code=200, content=HOT_MODELS.status())
+
+
+@router.get("/model/servers/", tags=["Get models list"])
+async def get_model_server_pool():
+    # Health and load of the model server pool, as seen by this worker.
+    return JSONResponse(status_code=200, content=MODEL_SERVERS.status())
+
+
 @router.post("/upload/", tags=["Upload data"])
-async def upload(model: UploadFile):
-    task_executor = TaskExecutor(max_workers=10)
+async def upload(
+    request: Request,
+    model: UploadFile,
+    cancel_on_disconnect: bool = False,
+    callback_url: Optional[str] = None,
+):
+    task_executor = get_lane(LANE_BULK)
     request_body = UploadModel(model=model)
+    check_callback_url(callback_url)
     error_handler = ResponseErrorHandler()
     operator = ModelOperator()
+    operator.cancel_on_disconnect = cancel_on_disconnect
+    with_callback(operator, callback_url)
     try:
         filename = request_body.model.filename
         file = request_body.model
         print(filename)
-        task_executor.run_in_background(operator.save_model, model=filename, file=file)
+        if not MODEL_STATUS.acquire(filename, operator.uuid):
+            error_handler.add(
+                type=error_handler.ERR_INTERNAL,
+                loc=[error_handler.ERR_INTERNAL],
+                msg=f"{filename} is being processed.",
+                input={},
+            )
+            TASK_LOG.info(f"{filename} is being processed.")
+            return Response(
+                status_code=status.HTTP_409_CONFLICT,
+                content=json.dumps(error_handler.errors),
+                media_type="application/json",
+            )
+        rejection = await admit_upload(operator.uuid, file, request)
+        if rejection is not None:
+            MODEL_STATUS.release(filename, operator.uuid)
+            return rejection
+        task_executor.run_in_background(
+            operator.run,
+            operator.save_model,
+            model=filename,
+            file=detach_upload(file),
+        )
 
         # TASK_LOG.info(
         #     f"Start upload model ({operator.uuid}): model : {filename.replace('.zip', '')}"
         # )
         TASK_LOG.info(f"Start upload model ({operator.uuid}): ")
 
-        async def event_generator():
-            async for status_code, message in operator.get_status():
-                yield json.dumps({"status": status_code, "message": message}) + "\n"
-
-        return StreamingResponse(
-            content=event_generator(),
-            media_type="application/json",
-        )
+        if operator.callback_url:
+            return accepted(operator)
+        return progress_stream(operator, cancel_on_disconnect)
 
     except Exception as e:
         TASK_LOG.error(f"'{operator.uuid}' Upload model error. Details :{e}")
@@ -99,13 +352,32 @@ async def upload(model: UploadFile):
 @router.delete("/model/", tags=["Delete Innodisk Model."])
 def delete_model(
     request: DeleteModel = Depends(),
+    callback_url: Optional[str] = None,
 ):
-    task_executor = TaskExecutor(max_workers=10)
+    task_executor = get_lane(LANE_INTERACTIVE)
+    check_callback_url(callback_url)
     error_handler = ResponseErrorHandler()
     try:
         model = request.model
         operator = ModelOperator()
-        if model in MODEL_STATUS:
+        with_callback(operator, callback_url)
+        adapters = get_model_registry().adapters().get(model)
+        if adapters:
+            error_handler.add(
+                type=error_handler.ERR_INTERNAL,
+                loc=[error_handler.ERR_INTERNAL],
+                msg=f"Model '{model}' is the base of {adapters} and cannot be deleted.",
+                input={},
+            )
+            TASK_LOG.info(
+                f"Failed Delete model ({operator.uuid}): model : {model} is the base of {adapters}."
+            )
+            return Response(
+                status_code=status.HTTP_409_CONFLICT,
+                content=json.dumps(error_handler.errors),
+                media_type="application/json",
+            )
+        if not MODEL_STATUS.acquire(model, operator.uuid):
             error_handler.add(
                 type=error_handler.ERR_INTERNAL,
                 loc=[error_handler.ERR_INTERNAL],
@@ -122,11 +394,15 @@ def delete_model(
             )
 
         task_executor.run_in_background(
+            operator.run,
             operator.delete_model,
             model=model,
+            delete_on_ollama=request.delete_on_ollama,
         )
 
         TASK_LOG.info(f"Start Delete model ({operator.uuid}): model : {model}.")
+        if operator.callback_url:
+            return accepted(operator)
 
         async def event_generator():
             async for status_code, message in operator.get_status():
@@ -155,15 +431,37 @@ def delete_model(
 @router.post("/model/create/", tags=["Create Model on Ollama"])
 def create_model(
     request: CreateModel,
+    cancel_on_disconnect: bool = False,
+    callback_url: Optional[str] = None,
+    warmup: Optional[bool] = None,
+    keep_alive: Optional[str] = Query(default=None, pattern=KEEP_ALIVE_PATTERN),
 ):
-    task_executor = TaskExecutor(max_workers=10)
+    task_executor = get_lane(LANE_BULK)
+    check_callback_url(callback_url)
     error_handler = ResponseErrorHandler()
     try:
         model = request.model
 
         model_name_on_ollama = request.model_name_on_ollama
         operator = ModelOperator()
+        operator.cancel_on_disconnect = cancel_on_disconnect
+        with_callback(operator, callback_url)
+        with_warmup(operator, warmup, keep_alive)
+        if not MODEL_STATUS.acquire(model, operator.uuid):
+            error_handler.add(
+                type=error_handler.ERR_INTERNAL,
+                loc=[error_handler.ERR_INTERNAL],
+                msg=f"{model} is being processed.",
+                input={},
+            )
+            TASK_LOG.info(f"{model} is being processed.")
+            return Response(
+                status_code=status.HTTP_409_CONFLICT,
+                content=json.dumps(error_handler.errors),
+                media_type="application/json",
+            )
         task_executor.run_in_background(
+            operator.run,
             operator.create_model,
             model=model,
             model_name_on_ollama=model_name_on_ollama,
@@ -173,14 +471,9 @@ def create_model(
             f"Start create model ({operator.uuid}): model : {model} , model name on ollama : {model_name_on_ollama}"
         )
 
-        async def event_generator():
-            async for status_code, message in operator.get_status():
-                yield json.dumps({"status": status_code, "message": message}) + "\n"
-
-        return StreamingResponse(
-            content=event_generator(),
-            media_type="application/json",
-        )
+        if operator.callback_url:
+            return accepted(operator)
+        return progress_stream(operator, cancel_on_disconnect)
 
     except Exception as e:
         TASK_LOG.error(f"'{operator.uuid}' Create model error. Details : {e}")
@@ -198,17 +491,32 @@ def create_model(
 
 
 @router.post("/deploy/", tags=["Deploy model"])
-async def deploy(model: UploadFile = Form(...), model_name_on_ollama: str = Form(...)):
-    task_executor = TaskExecutor(max_workers=10)
+async def deploy(
+    request: Request,
+    model: UploadFile = Form(...),
+    model_name_on_ollama: str = Form(...),
+    base: Optional[str] = Form(default=None),
+    cancel_on_disconnect: bool = False,
+    callback_url: Optional[str] = None,
+    warmup: Optional[bool] = None,
+    keep_alive: Optional[str] = Query(default=None, pattern=KEEP_ALIVE_PATTERN),
+):
+    task_executor = get_lane(LANE_BULK)
     request_body = DeployModel(model=model, model_name_on_ollama=model_name_on_ollama)
+    check_callback_url(callback_url)
     error_handler = ResponseErrorHandler()
     operator = ModelOperator()
+    if base is not None:
+        base = resolve_base(operator, base, model.filename.replace(".zip", ""))
+    operator.cancel_on_disconnect = cancel_on_disconnect
+    with_callback(operator, callback_url)
+    with_warmup(operator, warmup, keep_alive)
     try:
         filename = request_body.model.filename
         file = request_body.model
         model_name_on_ollama = request_body.model_name_on_ollama
 
-        if filename in MODEL_STATUS:
+        if not MODEL_STATUS.acquire(filename, operator.uuid):
             error_handler.add(
                 type=error_handler.ERR_INTERNAL,
                 loc=[error_handler.ERR_INTERNAL],
@@ -221,33 +529,245 @@ async def deploy(model: UploadFile = Form(...), model_name_on_ollama: str = Form
                 content=json.dumps(error_handler.errors),
                 media_type="application/json",
             )
+        rejection = await admit_upload(operator.uuid, file, request)
+        if rejection is not None:
+            MODEL_STATUS.release(filename, operator.uuid)
+            return rejection
 
         task_executor.run_in_background(
+            operator.run,
             operator.deploy,
             filename=filename,
             model_name_on_ollama=model_name_on_ollama,
-            file=file,
+            file=detach_upload(file),
+            base=base,
         )
 
         TASK_LOG.info(
-            f"Start Deploy model ({operator.uuid}): model : {filename} , model name on ollama : {model_name_on_ollama}"
+            f"Start Deploy model ({operator.uuid}): model : {filename} , model name on ollama : {model_name_on_ollama} , base : {base}"
         )
 
-        async def event_generator():
-            async for status_code, message in operator.get_status():
-                yield json.dumps({"status": status_code, "message": message}) + "\n"
+        if operator.callback_url:
+            return accepted(operator)
+        return progress_stream(operator, cancel_on_disconnect)
 
-        return StreamingResponse(
-            content=event_generator(),
+    except Exception as e:
+        TASK_LOG.error(f"'{operator.uuid}' Deploy model error. Details :{e}")
+        error_handler.add(
+            type=error_handler.ERR_UNEXPECTED,
+            loc=[error_handler.LOC_UNEXPECTED],
+            msg=f"'{operator.uuid}' Deploy model error. Details :{e}",
+            input=dict(),
+        )
+        return Response(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content=json.dumps(error_handler.errors),
             media_type="application/json",
         )
 
+
+@router.post("/deploy/batch/", tags=["Deploy model"])
+async def deploy_batch(
+    request: Request,
+    model_names_on_ollama: List[str] = Form(...),
+    models: List[UploadFile] = File(default=[]),
+    references: List[str] = Form(default=[]),
+    cancel_on_disconnect: bool = False,
+    warmup: Optional[bool] = None,
+    keep_alive: Optional[str] = Query(default=None, pattern=KEEP_ALIVE_PATTERN),
+):
+    # Names are given for the uploaded zips first, then for the references
+    # (folders already uploaded, only created on the model server).
+    task_executor = get_lane(LANE_BULK)
+    error_handler = ResponseErrorHandler()
+    operator = ModelOperator()
+    operator.cancel_on_disconnect = cancel_on_disconnect
+    if len(model_names_on_ollama) != len(models) + len(references):
+        error_handler.add(
+            type=error_handler.ERR_VALIDATE,
+            loc=[error_handler.LOC_BODY],
+            msg="Give one 'model_names_on_ollama' per model and reference.",
+            input={"model_names_on_ollama": model_names_on_ollama},
+        )
+        raise RequestValidationError(error_handler.errors)
+    deploys = [
+        DeployModel(model=file, model_name_on_ollama=name)
+        for file, name in zip(models, model_names_on_ollama)
+    ]
+    creates = [
+        CreateModel(model=reference, model_name_on_ollama=name)
+        for reference, name in zip(references, model_names_on_ollama[len(models) :])
+    ]
+
+    jobs = []
+    try:
+        for request_body in deploys:
+            filename = request_body.model.filename
+            item = ModelOperator()
+            with_warmup(item, warmup, keep_alive)
+            if not MODEL_STATUS.acquire(filename, item.uuid):
+                error_handler.add(
+                    type=error_handler.ERR_INTERNAL,
+                    loc=[error_handler.ERR_INTERNAL],
+                    msg=f"{filename} is being processed.",
+                    input={},
+                )
+                TASK_LOG.info(f"{filename} is being processed.")
+                return Response(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content=json.dumps(error_handler.errors),
+                    media_type="application/json",
+                )
+            jobs.append(
+                (
+                    item,
+                    item.deploy,
+                    {
+                        "filename": filename,
+                        "model_name_on_ollama": request_body.model_name_on_ollama,
+                        "file": detach_upload(request_body.model),
+                    },
+                )
+            )
+            rejection = await admit_upload(item.uuid, jobs[-1][2]["file"], request)
+            if rejection is not None:
+                return rejection
+
+        for request_body in creates:
+            item = ModelOperator()
+            with_warmup(item, warmup, keep_alive)
+            jobs.append(
+                (
+                    item,
+                    item.create_model,
+                    {
+                        "model": request_body.model,
+                        "model_name_on_ollama": request_body.model_name_on_ollama,
+                    },
+                )
+            )
+
+        task_executor.run_in_background(operator.run, operator.deploy_batch, jobs=jobs)
+        TASK_LOG.info(
+            f"Start batch deploy ({operator.uuid}): {len(deploys)} models , {len(creates)} references"
+        )
+        jobs = []
+
+        return progress_stream(operator, cancel_on_disconnect)
+
     except Exception as e:
-        TASK_LOG.error(f"'{operator.uuid}' Deploy model error. Details :{e}")
+        TASK_LOG.error(f"'{operator.uuid}' Batch deploy error. Details :{e}")
         error_handler.add(
             type=error_handler.ERR_UNEXPECTED,
             loc=[error_handler.LOC_UNEXPECTED],
-            msg=f"'{operator.uuid}' Deploy model error. Details :{e}",
+            msg=f"'{operator.uuid}' Batch deploy error. Details :{e}",
+            input=dict(),
+        )
+        return Response(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content=json.dumps(error_handler.errors),
+            media_type="application/json",
+        )
+    finally:
+        # Items of a rejected batch give back their locks and reservations.
+        for item, task, kwargs in jobs:
+            if task == item.deploy:
+                MODEL_STATUS.release(kwargs["filename"], item.uuid)
+                kwargs["file"].file.close()
+            item.state.release_space(item.uuid)
+
+
+@router.post("/model/sync/", tags=["Deploy model"])
+async def sync_model(
+    request: SyncModel,
+    cancel_on_disconnect: bool = False,
+    callback_url: Optional[str] = None,
+    warmup: Optional[bool] = None,
+    keep_alive: Optional[str] = Query(default=None, pattern=KEEP_ALIVE_PATTERN),
+):
+    # Pull a model folder from another handler, then create it and seed the
+    # targets from this node.
+    task_executor = get_lane(LANE_BULK)
+    check_callback_url(callback_url)
+    error_handler = ResponseErrorHandler()
+    if request.targets and not get_peer_url():
+        error_handler.add(
+            type=error_handler.ERR_VALIDATE,
+            loc=[error_handler.LOC_BODY],
+            msg="Set PEER_URL to seed 'targets' from this handler.",
+            input={"targets": request.targets},
+        )
+        raise RequestValidationError(error_handler.errors)
+    operator = ModelOperator()
+    operator.cancel_on_disconnect = cancel_on_disconnect
+    with_callback(operator, callback_url)
+    with_warmup(operator, warmup, keep_alive)
+    model = request.model
+    locked = []
+    try:
+        plan = await plan_sync(request.peer, model)
+        folders = [model]
+        if plan["base_plan"] is not None:
+            folders.append(plan["base_plan"]["model"])
+        for folder in folders:
+            if not MODEL_STATUS.acquire(folder, operator.uuid):
+                error_handler.add(
+                    type=error_handler.ERR_INTERNAL,
+                    loc=[error_handler.ERR_INTERNAL],
+                    msg=f"{folder} is being processed.",
+                    input={},
+                )
+                TASK_LOG.info(f"{folder} is being processed.")
+                return Response(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content=json.dumps(error_handler.errors),
+                    media_type="application/json",
+                )
+            locked.append(folder)
+        rejection = await admit_size(operator.uuid, model, plan["size"])
+        if rejection is not None:
+            return rejection
+
+        task_executor.run_in_background(
+            operator.run,
+            operator.sync_model,
+            model=model,
+            peer=request.peer,
+            plan=plan,
+            model_name_on_ollama=request.model_name_on_ollama,
+            targets=request.targets,
+            fanout=request.fanout or get_replication_fanout(),
+            seed_url=get_peer_url(),
+        )
+        locked = []
+        TASK_LOG.info(
+            f"Start sync model ({operator.uuid}): model : {model} , peer : {request.peer} , "
+            f"{plan['size']} bytes to fetch , {len(request.targets)} targets"
+        )
+
+        if operator.callback_url:
+            return accepted(operator)
+        return progress_stream(operator, cancel_on_disconnect)
+
+    except SyncError as e:
+        TASK_LOG.warning(f"'{operator.uuid}' Sync model rejected. Details : {e}")
+        error_handler.add(
+            type=error_handler.ERR_INTERNAL,
+            loc=[error_handler.ERR_INTERNAL],
+            msg=str(e),
+            input={"model": model, "peer": request.peer},
+        )
+        return Response(
+            status_code=e.status_code,
+            content=json.dumps(error_handler.errors),
+            media_type="application/json",
+        )
+    except Exception as e:
+        TASK_LOG.error(f"'{operator.uuid}' Sync model error. Details :{e}")
+        error_handler.add(
+            type=error_handler.ERR_UNEXPECTED,
+            loc=[error_handler.LOC_UNEXPECTED],
+            msg=f"'{operator.uuid}' Sync model error. Details :{e}",
             input=dict(),
         )
         return Response(
@@ -255,3 +775,9 @@ async def deploy(model: UploadFile = Form(...), model_name_on_ollama: str = Form
             content=json.dumps(error_handler.errors),
             media_type="application/json",
         )
+    finally:
+        # A request rejected before its task started gives its locks back.
+        for folder in locked:
+            MODEL_STATUS.release(folder, operator.uuid)
+        if locked:
+            operator.state.release_space(operator.uuid)
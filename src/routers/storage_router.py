@@ -0,0 +1,59 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Query, Response, status
+from fastapi.responses import JSONResponse
+
+from tools.connect import get_disk_eviction
+from tools.disk_admission import DiskAdmission
+from tools.eviction import MODEL_EVICTOR
+from utils import ResponseErrorHandler
+
+router = APIRouter()
+
+
+@router.get("/storage/", tags=["Get storage status"])
+async def get_storage():
+    error_handler = ResponseErrorHandler()
+    try:
+        content = await asyncio.to_thread(DiskAdmission().status)
+        return JSONResponse(status_code=200, content=content)
+    except Exception as e:
+        error_handler.add(
+            type=error_handler.ERR_UNEXPECTED,
+            loc=[error_handler.LOC_UNEXPECTED],
+            msg=f"Get storage status error. Details : {e}",
+            input=dict(),
+        )
+        return Response(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content=json.dumps(error_handler.errors),
+            media_type="application/json",
+        )
+
+
+@router.get("/storage/eviction/", tags=["Get storage status"])
+async def get_eviction_plan(
+    size: int = Query(default=0, ge=0),
+    model: Optional[str] = None,
+):
+    # Dry run: what a deploy of size bytes would evict, nothing is deleted.
+    error_handler = ResponseErrorHandler()
+    try:
+        needed = await asyncio.to_thread(DiskAdmission().shortfall, size)
+        plan = await MODEL_EVICTOR.plan(needed, model)
+        content = {"size": size, "eviction": get_disk_eviction(), **plan}
+        return JSONResponse(status_code=200, content=content)
+    except Exception as e:
+        error_handler.add(
+            type=error_handler.ERR_UNEXPECTED,
+            loc=[error_handler.LOC_UNEXPECTED],
+            msg=f"Get eviction plan error. Details : {e}",
+            input={"size": size, "model": model},
+        )
+        return Response(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content=json.dumps(error_handler.errors),
+            media_type="application/json",
+        )
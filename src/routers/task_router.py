@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from tools.metrics import REGISTRY
+from tools.stage_limiter import STAGE_LIMITER
+from tools.state_backend import TASK_FINISHED, get_state_backend
+from tools.task_lanes import lane_metrics
+from utils import ResponseErrorHandler
+
+router = APIRouter()
+
+POLL_INTERVAL = 0.5
+
+
+def task_not_found(uuid: str):
+    error_handler = ResponseErrorHandler()
+    error_handler.add(
+        type=error_handler.ERR_VALIDATE,
+        loc=[error_handler.LOC_QUERY],
+        msg=f"Task '{uuid}' not exist.",
+        input={"uuid": uuid},
+    )
+    return Response(
+        status_code=status.HTTP_404_NOT_FOUND,
+        content=json.dumps(error_handler.errors),
+        media_type="application/json",
+    )
+
+
+@router.get("/lanes/", tags=["Get task status"])
+async def get_lanes():
+    # Load of the priority lanes and stage limits of this worker.
+    return JSONResponse(
+        status_code=200,
+        content={"lanes": lane_metrics(), "stages": STAGE_LIMITER.status()},
+    )
+
+
+@router.get("/metrics", tags=["Get task status"])
+async def get_metrics():
+    # Prometheus text format, for this worker process only.
+    content = await asyncio.to_thread(REGISTRY.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/task/{uuid}", tags=["Get task status"])
+async def get_task(uuid: str):
+    task = await asyncio.to_thread(get_state_backend().get_task, uuid)
+    if task is None:
+        return task_not_found(uuid)
+    return JSONResponse(status_code=200, content=task)
+
+
+@router.get("/task/{uuid}/events", tags=["Get task status"])
+async def get_task_events(uuid: str):
+    # Works for tasks started on any worker sharing the same state backend.
+    state = get_state_backend()
+    if await asyncio.to_thread(state.get_task, uuid) is None:
+        return task_not_found(uuid)
+
+    state.add_subscriber(uuid, 1)
+
+    async def event_generator():
+        last_seq = 0
+        task = None
+        try:
+            while True:
+                task = await asyncio.to_thread(state.get_task, uuid)
+                events = await asyncio.to_thread(state.get_events, uuid, last_seq)
+                for last_seq, message in events:
+                    yield json.dumps(
+                        {"status": message["status"], "message": message["message"]}
+                    ) + "\n"
+                if task["status"] in TASK_FINISHED and not events:
+                    break
+                if not events:
+                    await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            # Same rule as the stream of the request that started the task.
+            remaining = state.add_subscriber(uuid, -1)
+            if (
+                remaining == 0
+                and task is not None
+                and task["details"].get("cancel_on_disconnect")
+            ):
+                state.request_cancel(uuid)
+
+    return StreamingResponse(
+        content=event_generator(),
+        media_type="application/json",
+    )
+
+
+@router.delete("/task/{uuid}", tags=["Cancel task"])
+async def cancel_task(uuid: str):
+    # The task stops at its next checkpoint, on whichever worker runs it.
+    state = get_state_backend()
+    task = await asyncio.to_thread(state.get_task, uuid)
+    if task is None:
+        return task_not_found(uuid)
+    if not await asyncio.to_thread(state.request_cancel, uuid):
+        error_handler = ResponseErrorHandler()
+        error_handler.add(
+            type=error_handler.ERR_VALIDATE,
+            loc=[error_handler.LOC_QUERY],
+            msg=f"Task '{uuid}' already {task['status']}.",
+            input={"uuid": uuid},
+        )
+        return Response(
+            status_code=status.HTTP_409_CONFLICT,
+            content=json.dumps(error_handler.errors),
+            media_type="application/json",
+        )
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=task)
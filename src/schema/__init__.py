@@ -1 +1 @@
-from .main import CreateModel, DeleteModel, UploadModel
+from .main import CreateModel, DeleteModel, SyncModel, UploadModel
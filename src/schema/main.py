@@ -1,5 +1,5 @@
 import os
-from typing import Dict
+from typing import Dict, List, Optional
 
 from fastapi import UploadFile
 from fastapi.exceptions import RequestValidationError
@@ -32,6 +32,7 @@ class ResponseFormat(BaseModel):
 # For Delete model
 class DeleteModel(BaseModel):
     model: str
+    delete_on_ollama: bool = True
 
     @model_validator(mode="after")
     def check_file(self: "DeleteModel") -> "DeleteModel":
@@ -49,7 +50,7 @@ class DeleteModel(BaseModel):
 
         root_path = get_models_folder()
         model_path = os.path.join(root_path, self.model)
-        if not os.path.isdir(model_path):
+        if self.model.startswith(".") or not os.path.isdir(model_path):
             error_handler.add(
                 type=error_handler.ERR_VALIDATE,
                 loc=[error_handler.LOC_BODY],
@@ -81,7 +82,7 @@ class CreateModel(BaseModel):
 
         root_path = get_models_folder()
         model_path = os.path.join(root_path, self.model)
-        if not os.path.isdir(model_path):
+        if self.model.startswith(".") or not os.path.isdir(model_path):
             error_handler.add(
                 type=error_handler.ERR_VALIDATE,
                 loc=[error_handler.LOC_BODY],
@@ -153,3 +154,37 @@ class UploadModel(BaseModel):
                 )
                 raise RequestValidationError(error_handler.errors)
         return self
+
+
+# For Sync model
+class SyncModel(BaseModel):
+    model: str
+    peer: str
+    model_name_on_ollama: Optional[str] = None
+    targets: List[str] = []
+    fanout: Optional[int] = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_schema(self: "SyncModel") -> "SyncModel":
+        error_handler = ResponseErrorHandler()
+
+        if not self.model or self.model.startswith(".") or "/" in self.model:
+            error_handler.add(
+                type=error_handler.ERR_VALIDATE,
+                loc=[error_handler.LOC_BODY],
+                msg="Model name is invalid or missing.",
+                input={"model": self.model},
+            )
+            raise RequestValidationError(error_handler.errors)
+        for url in [self.peer, *self.targets]:
+            if not url.startswith(("http://", "https://")):
+                error_handler.add(
+                    type=error_handler.ERR_VALIDATE,
+                    loc=[error_handler.LOC_BODY],
+                    msg=f"'{url}' must be an http(s) url of a handler.",
+                    input={"url": url},
+                )
+                raise RequestValidationError(error_handler.errors)
+        self.peer = self.peer.rstrip("/") + "/"
+        self.targets = [target.rstrip("/") + "/" for target in self.targets]
+        return self
@@ -0,0 +1,440 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from argparse import SUPPRESS, ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+MB = 1024 * 1024
+SRC_PATH = Path(__file__).resolve().parents[1]
+SCENARIOS = ["upload", "create", "list", "deploy", "delete"]
+SAMPLE_INTERVAL = 0.1
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-d",
+        "--dir",
+        default=None,
+        type=str,
+        help="Folder under which the run's UPLOAD_DIR is created and removed afterwards. Default: system temp folder",
+    )
+    args.add_argument(
+        "-s",
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        type=str,
+        help=f"Comma separated scenarios, always run in this order. 'create' and 'delete' use the folders of 'upload'. Default: {','.join(SCENARIOS)}",
+    )
+    args.add_argument(
+        "--size",
+        default=64,
+        type=int,
+        help="Size in MB of each synthetic archive. Default: 64",
+    )
+    args.add_argument(
+        "--members",
+        default=1,
+        type=int,
+        help="GGUF members per archive. 'create' and 'deploy' need 1 or 2 (base and lora). Default: 1",
+    )
+    args.add_argument(
+        "-n",
+        "--requests",
+        default=4,
+        type=int,
+        help="Requests per scenario. Default: 4",
+    )
+    args.add_argument(
+        "-c",
+        "--concurrency",
+        default=2,
+        type=int,
+        help="Requests in flight at once. Default: 2",
+    )
+    args.add_argument(
+        "--port",
+        default=5055,
+        type=int,
+        help="Port of the model handler under test. Default: 5055",
+    )
+    args.add_argument(
+        "--ollama_port",
+        default=11435,
+        type=int,
+        help="Port of the fake Ollama server. Default: 11435",
+    )
+    args.add_argument(
+        "--latency",
+        default=0.0,
+        type=float,
+        help="Seconds the fake Ollama adds before every response. Default: 0",
+    )
+    args.add_argument(
+        "--create_steps",
+        default=10,
+        type=int,
+        help="Progress lines streamed by the fake '/api/create'. Default: 10",
+    )
+    args.add_argument(
+        "--step_interval",
+        default=0.01,
+        type=float,
+        help="Seconds between two progress lines of the fake '/api/create'. Default: 0.01",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Write the JSON report to this file. Default: stdout only",
+    )
+
+    return parser
+
+
+def make_archive(path: Path, size: int, members: int):
+    # Stored, not deflated: random data does not compress anyway.
+    names = ["model.gguf"] + [f"lora_{index}.gguf" for index in range(1, members)]
+    sizes = [size // members] * members
+    sizes[0] += size - sum(sizes)
+    block = os.urandom(MB)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zip_ref:
+        for name, member_size in zip(names, sizes):
+            with zip_ref.open(name, "w", force_zip64=True) as member:
+                written = 0
+                while written < member_size:
+                    chunk = block[: min(MB, member_size - written)]
+                    member.write(chunk)
+                    written += len(chunk)
+
+
+def percentile(values: list, ratio: float) -> float:
+    # Nearest rank.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(int(len(ordered) * ratio + 0.5) - 1, 0))]
+
+
+class ProcessSampler:
+    """Samples the CPU time, RSS, threads and open FDs of a process and its children."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_rss = 0
+        self.peak_fds = 0
+        self.running = False
+        self.thread = None
+
+    def pids(self) -> list:
+        pids, index = [self.pid], 0
+        while index < len(pids):
+            for task in Path(f"/proc/{pids[index]}/task").glob("*"):
+                try:
+                    pids += [
+                        int(pid) for pid in (task / "children").read_text().split()
+                    ]
+                except OSError:
+                    pass
+            index += 1
+        return pids
+
+    def cpu_seconds(self) -> float:
+        total = 0
+        for pid in self.pids():
+            try:
+                fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+                total += int(fields[11]) + int(fields[12])  # utime, stime
+            except OSError:
+                pass
+        return total / CLOCK_TICKS
+
+    def rss_bytes(self) -> int:
+        total = 0
+        for pid in self.pids():
+            try:
+                for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return total
+
+    def threads(self) -> int:
+        total = 0
+        for pid in self.pids():
+            try:
+                for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                    if line.startswith("Threads:"):
+                        total += int(line.split()[1])
+            except OSError:
+                pass
+        return total
+
+    def open_fds(self) -> int:
+        total = 0
+        for pid in self.pids():
+            try:
+                total += len(os.listdir(f"/proc/{pid}/fd"))
+            except OSError:
+                pass
+        return total
+
+    def start(self):
+        self.peak_rss = self.rss_bytes()
+        self.peak_fds = self.open_fds()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def _loop(self):
+        while self.running:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            self.peak_fds = max(self.peak_fds, self.open_fds())
+            time.sleep(SAMPLE_INTERVAL)
+
+
+def stream_request(client: httpx.Client, method: str, url: str, **kwargs) -> dict:
+    # Latency is until the final progress message, not the response headers.
+    start = time.perf_counter()
+    last = None
+    with client.stream(method, url, **kwargs) as response:
+        for line in response.iter_lines():
+            if line.strip():
+                last = json.loads(line)
+        ok = response.status_code == 200
+    if last is not None and last.get("status") != 200:
+        ok = False
+    return {"ok": ok, "latency": time.perf_counter() - start, "last": last}
+
+
+def run_scenario(sampler: ProcessSampler, requests: list, concurrency: int, size: int):
+    # requests: callables taking an httpx.Client.
+    cpu_before = sampler.cpu_seconds()
+    sampler.start()
+    start = time.perf_counter()
+    with httpx.Client(timeout=None) as client, ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda request: request(client), requests))
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    cpu = sampler.cpu_seconds() - cpu_before
+
+    latencies = [result["latency"] for result in results]
+    report = {
+        "requests": len(results),
+        "errors": sum(not result["ok"] for result in results),
+        "seconds": round(elapsed, 3),
+        "p50_seconds": round(percentile(latencies, 0.5), 4),
+        "p99_seconds": round(percentile(latencies, 0.99), 4),
+        "cpu_seconds_per_stream": round(cpu / max(len(results), 1), 4),
+        "peak_rss_mb": round(sampler.peak_rss / MB, 1),
+        "peak_open_fds": sampler.peak_fds,
+        "open_fds_after": sampler.open_fds(),
+    }
+    if size:
+        report["throughput_mb_s"] = round(size * len(results) / elapsed, 2)
+    errors = [result["last"] for result in results if not result["ok"]]
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def wait_alive(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"'{url}' exited with code {process.returncode}.")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"'{url}' is not alive after {timeout} seconds.")
+
+
+@contextmanager
+def running_handler(args):
+    """Run the handler and a fake Ollama server on a temporary UPLOAD_DIR.
+
+    Yields the work folder, where the handler writes its logs, and the
+    handler process. Everything is stopped and removed on exit.
+    """
+    root = Path(tempfile.mkdtemp(prefix="model_handler_bench_", dir=args.dir))
+    upload_dir = root / "models"
+    work_dir = root / "work"
+    for folder in (upload_dir, work_dir):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    env = dict(
+        os.environ,
+        UPLOAD_DIR=str(upload_dir),
+        MODEL_SERVER_IP="127.0.0.1",
+        MODEL_SERVER_PORT=str(args.ollama_port),
+        MODEL_HANDLER_PORT=str(args.port),
+    )
+    ollama = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).with_name("fake_ollama.py")),
+            f"--port={args.ollama_port}",
+            f"--latency={args.latency}",
+            f"--create_steps={args.create_steps}",
+            f"--step_interval={args.step_interval}",
+        ],
+        cwd=work_dir,
+    )
+    handler = None
+    try:
+        wait_alive(f"http://127.0.0.1:{args.ollama_port}/", ollama)
+        handler = subprocess.Popen(
+            [sys.executable, str(SRC_PATH / "app.py")],
+            cwd=work_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        wait_alive(f"http://127.0.0.1:{args.port}/", handler)
+        yield work_dir, handler
+    finally:
+        for process in (handler, ollama):
+            if process is not None:
+                process.terminate()
+                process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(args, scenarios: list):
+    with running_handler(args) as (work_dir, handler):
+        archive = work_dir / "archive.zip"
+        make_archive(archive, args.size * MB, args.members)
+        size = archive.stat().st_size / MB
+        base_url = f"http://127.0.0.1:{args.port}"
+        sampler = ProcessSampler(handler.pid)
+
+        def post_archive(path: str, filename: str, data: dict = None):
+            def request(client: httpx.Client):
+                with open(archive, "rb") as file:
+                    return stream_request(
+                        client,
+                        "POST",
+                        base_url + path,
+                        files={"model": (filename, file, "application/zip")},
+                        data=data,
+                    )
+
+            return request
+
+        def call(method: str, path: str, **kwargs):
+            return lambda client: stream_request(
+                client, method, base_url + path, **kwargs
+            )
+
+        indexes = range(args.requests)
+        plans = {
+            "upload": (
+                [post_archive("/upload/", f"bench_u{index}.zip") for index in indexes],
+                size,
+            ),
+            "create": (
+                [
+                    call(
+                        "POST",
+                        "/model/create/",
+                        json={
+                            "model": f"bench_u{index}",
+                            "model_name_on_ollama": f"bench_c{index}",
+                        },
+                    )
+                    for index in indexes
+                ],
+                0,
+            ),
+            "list": ([call("GET", "/model/") for _ in indexes], 0),
+            "deploy": (
+                [
+                    post_archive(
+                        "/deploy/",
+                        f"bench_d{index}.zip",
+                        {"model_name_on_ollama": f"bench_d{index}"},
+                    )
+                    for index in indexes
+                ],
+                size,
+            ),
+            "delete": (
+                [
+                    call("DELETE", "/model/", params={"model": f"bench_u{index}"})
+                    for index in indexes
+                ],
+                0,
+            ),
+        }
+
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "archive_mb": round(size, 2),
+            "members": args.members,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "ollama_latency": args.latency,
+            "create_steps": args.create_steps,
+            "scenarios": {},
+        }
+        for scenario in SCENARIOS:
+            if scenario in scenarios:
+                requests, scenario_size = plans[scenario]
+                report["scenarios"][scenario] = run_scenario(
+                    sampler, requests, args.concurrency, scenario_size
+                )
+        return report
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {sorted(unknown)}")
+    if args.members > 2 and {"create", "deploy"} & set(scenarios):
+        raise SystemExit("'create' and 'deploy' need archives of 1 or 2 members.")
+    print(f"""The parameter you set is like below:\n \
+    * scenarios : {scenarios} \n \
+    * size : {args.size} MB \n \
+    * members : {args.members} \n \
+    * requests : {args.requests} \n \
+    * concurrency : {args.concurrency} \n \
+    * ollama latency : {args.latency} s \n \n \n """)
+    report = main(args, scenarios)
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,174 @@
+import ctypes
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.ingest_io import IngestWriter  # noqa: E402
+
+MB = 1024 * 1024
+PAGE_SIZE = mmap.PAGESIZE
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-d",
+        "--dir",
+        default=tempfile.gettempdir(),
+        type=str,
+        help="Folder on the volume to benchmark. Default: system temp folder",
+    )
+    args.add_argument(
+        "--hot_size",
+        default=512,
+        type=int,
+        help="Size in MB of the 'hot' file standing in for a served model. Default: 512",
+    )
+    args.add_argument(
+        "--ingest_size",
+        default=2048,
+        type=int,
+        help="Size in MB of the ingested file. Use more than the free RAM to see evictions. Default: 2048",
+    )
+    args.add_argument(
+        "-m",
+        "--modes",
+        default="buffered,dontneed,direct",
+        type=str,
+        help="Comma separated ingest io modes to compare. Default: buffered,dontneed,direct",
+    )
+    args.add_argument(
+        "--sync_bytes",
+        default=64,
+        type=int,
+        help="MB written between two flushes in dontneed mode. Default: 64",
+    )
+    args.add_argument(
+        "--no_fsync",
+        action="store_true",
+        help="Do not fsync the ingested file before closing it.",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Write the JSON report to this file. Default: stdout only",
+    )
+
+    return parser
+
+
+def residency(path: str) -> float:
+    # Ratio of the file's pages in the page cache, from mincore(2).
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    libc = ctypes.CDLL(None, use_errno=True)
+    pages = (size + PAGE_SIZE - 1) // PAGE_SIZE
+    vector = (ctypes.c_ubyte * pages)()
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_COPY)
+        try:
+            address = ctypes.addressof(ctypes.c_char.from_buffer(mapped))
+            if libc.mincore(ctypes.c_void_p(address), ctypes.c_size_t(size), vector):
+                raise OSError(ctypes.get_errno(), "mincore failed")
+        finally:
+            mapped.close()
+    return round(sum(page & 1 for page in vector) / pages, 4)
+
+
+def warm(path: str):
+    with open(path, "rb") as file:
+        while file.read(16 * MB):
+            pass
+
+
+def ingest(path: str, size: int, mode: str, sync_bytes: int, fsync: bool) -> float:
+    # Options are given explicitly, the benchmark needs no handler settings.
+    chunk = os.urandom(MB)
+    start = time.perf_counter()
+    with IngestWriter(
+        path, size=size, mode=mode, sync_bytes=sync_bytes, fsync=fsync
+    ) as buffer:
+        for _ in range(size // MB):
+            buffer.write(chunk)
+    return time.perf_counter() - start
+
+
+def main(
+    folder: str,
+    hot_size: int,
+    ingest_size: int,
+    modes: list,
+    sync_bytes: int = 64,
+    fsync: bool = True,
+):
+    hot_path = os.path.join(folder, "benchmark_hot.bin")
+    ingest_path = os.path.join(folder, "benchmark_ingest.bin")
+    with IngestWriter(
+        hot_path, mode="buffered", sync_bytes=sync_bytes * MB, fsync=fsync
+    ) as buffer:
+        for _ in range(hot_size):
+            buffer.write(os.urandom(MB))
+
+    report = {"hot_size_mb": hot_size, "ingest_size_mb": ingest_size, "modes": {}}
+    try:
+        for mode in modes:
+            warm(hot_path)
+            hot_before = residency(hot_path)
+            elapsed = ingest(
+                ingest_path, ingest_size * MB, mode, sync_bytes * MB, fsync
+            )
+            report["modes"][mode] = {
+                "throughput_mb_s": round(ingest_size / elapsed, 2),
+                "hot_residency_before": hot_before,
+                "hot_residency_after": residency(hot_path),
+                "ingest_residency": residency(ingest_path),
+            }
+            os.remove(ingest_path)
+    finally:
+        for path in (hot_path, ingest_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return report
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    print(f"""The parameter you set is like below:\n \
+    * dir : {args.dir} \n \
+    * hot_size : {args.hot_size} MB \n \
+    * ingest_size : {args.ingest_size} MB \n \
+    * modes : {modes} \n \
+    * sync_bytes : {args.sync_bytes} MB \n \
+    * fsync : {not args.no_fsync} \n \n \n """)
+    report = main(
+        args.dir,
+        args.hot_size,
+        args.ingest_size,
+        modes,
+        args.sync_bytes,
+        not args.no_fsync,
+    )
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
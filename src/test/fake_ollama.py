@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from datetime import datetime, timezone
+from argparse import SUPPRESS, ArgumentParser
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Stand-in for the Ollama endpoints the model handler calls, for benchmarks.
+CONFIG = {
+    "latency": 0.0,
+    "create_steps": 10,
+    "step_interval": 0.01,
+    "load_seconds": 0.0,
+}
+MODELS = {}
+BLOBS = set()
+# Loaded model -> time it is unloaded at.
+LOADED = {}
+DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+
+app = FastAPI()
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-ip",
+        "--ip",
+        default="127.0.0.1",
+        type=str,
+        help="The ip to listen on. Default: 127.0.0.1",
+    )
+    args.add_argument(
+        "-p",
+        "--port",
+        default=11434,
+        type=int,
+        help="The port to listen on. Default: 11434",
+    )
+    args.add_argument(
+        "--latency",
+        default=0.0,
+        type=float,
+        help="Seconds added before every response. Default: 0",
+    )
+    args.add_argument(
+        "--create_steps",
+        default=10,
+        type=int,
+        help="Progress lines streamed by '/api/create' before 'success'. Default: 10",
+    )
+    args.add_argument(
+        "--step_interval",
+        default=0.01,
+        type=float,
+        help="Seconds between two progress lines of '/api/create'. Default: 0.01",
+    )
+    args.add_argument(
+        "--load_seconds",
+        default=0.0,
+        type=float,
+        help="Seconds '/api/generate' takes to load a model that is not loaded. Default: 0",
+    )
+
+    return parser
+
+
+async def delay():
+    if CONFIG["latency"]:
+        await asyncio.sleep(CONFIG["latency"])
+
+
+@app.get("/")
+async def check_alive():
+    await delay()
+    return Response("Ollama is running")
+
+
+@app.post("/api/create")
+async def create(request: Request):
+    body = await request.json()
+    await delay()
+
+    async def progress():
+        steps = CONFIG["create_steps"]
+        for step in range(steps):
+            await asyncio.sleep(CONFIG["step_interval"])
+            yield json.dumps(
+                {
+                    "status": "transferring model data",
+                    "completed": step + 1,
+                    "total": steps,
+                }
+            ) + "\n"
+        yield json.dumps({"status": "writing manifest"}) + "\n"
+        MODELS[body["model"]] = body.get("modelfile", "")
+        yield json.dumps({"status": "success"}) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
+def keep_alive_seconds(keep_alive) -> float:
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    return sum(
+        float(value) * DURATION_UNITS[unit]
+        for value, unit in re.findall(r"([\d.]+)(ns|us|ms|s|m|h)", keep_alive)
+    ) * (-1 if keep_alive.startswith("-") else 1)
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    # Only the model load of an empty prompt.
+    body = await request.json()
+    await delay()
+    name = body["model"] if ":" in body["model"] else body["model"] + ":latest"
+    if body["model"] not in MODELS and name not in MODELS:
+        return JSONResponse({"error": f"model '{body['model']}' not found"}, 404)
+    keep_alive = keep_alive_seconds(body.get("keep_alive", "5m"))
+    if keep_alive == 0:
+        LOADED.pop(name, None)
+        return {"model": name, "done": True, "done_reason": "unload"}
+    if LOADED.get(name, 0) < time.time():
+        await asyncio.sleep(CONFIG["load_seconds"])
+    LOADED[name] = time.time() + keep_alive if keep_alive > 0 else float("inf")
+    return {"model": name, "done": True, "done_reason": "load"}
+
+
+@app.get("/api/ps")
+async def ps():
+    await delay()
+    now = time.time()
+    for name in [name for name, until in LOADED.items() if until < now]:
+        del LOADED[name]
+    return {
+        "models": [
+            {
+                "name": name,
+                "model": name,
+                "expires_at": datetime.fromtimestamp(
+                    min(until, 2**33), timezone.utc
+                ).isoformat(),
+            }
+            for name, until in LOADED.items()
+        ]
+    }
+
+
+@app.head("/api/blobs/{digest}")
+async def check_blob(digest: str):
+    await delay()
+    return Response(status_code=200 if digest in BLOBS else 404)
+
+
+@app.post("/api/blobs/{digest}")
+async def push_blob(digest: str, request: Request):
+    sha256 = hashlib.sha256()
+    async for chunk in request.stream():
+        sha256.update(chunk)
+    await delay()
+    if f"sha256:{sha256.hexdigest()}" != digest:
+        return JSONResponse({"error": "digest mismatch"}, status_code=400)
+    BLOBS.add(digest)
+    return Response(status_code=201)
+
+
+@app.get("/api/tags")
+async def tags():
+    await delay()
+    return {
+        "models": [
+            {"name": name, "model": name, "size": len(modelfile), "digest": ""}
+            for name, modelfile in MODELS.items()
+        ]
+    }
+
+
+@app.post("/api/copy")
+async def copy(request: Request):
+    body = await request.json()
+    await delay()
+    if body["source"] not in MODELS:
+        return JSONResponse({"error": "model not found"}, status_code=404)
+    MODELS[body["destination"]] = MODELS[body["source"]]
+    return Response(status_code=200)
+
+
+@app.delete("/api/delete")
+async def delete(request: Request):
+    body = await request.json()
+    await delay()
+    if MODELS.pop(body["model"], None) is None:
+        return JSONResponse({"error": "model not found"}, status_code=404)
+    return Response(status_code=200)
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    CONFIG.update(
+        latency=args.latency,
+        create_steps=args.create_steps,
+        step_interval=args.step_interval,
+        load_seconds=args.load_seconds,
+    )
+    uvicorn.run(app, host=args.ip, port=args.port, log_level="warning")
@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from argparse import SUPPRESS, ArgumentParser
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+from benchmark_api import MB, SRC_PATH, make_archive, stream_request, wait_alive
+
+MODEL = "replicated"
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-d",
+        "--dir",
+        default=None,
+        type=str,
+        help="Folder under which the nodes' UPLOAD_DIR are created and removed afterwards. Default: system temp folder",
+    )
+    args.add_argument(
+        "-n",
+        "--nodes",
+        default=7,
+        type=int,
+        help="Handlers started, the first one is deployed to and seeds the others. Default: 7",
+    )
+    args.add_argument(
+        "--fanout",
+        default=2,
+        type=int,
+        help="Targets each node seeds, the node count to seed everything from the first one. Default: 2",
+    )
+    args.add_argument(
+        "--size",
+        default=64,
+        type=int,
+        help="Size in MB of the deployed archive. Default: 64",
+    )
+    args.add_argument(
+        "--members",
+        default=2,
+        type=int,
+        help="GGUF members of the archive, 1 or 2 (base and lora). Default: 2",
+    )
+    args.add_argument(
+        "--connections",
+        default=4,
+        type=int,
+        help="REPLICATION_CONNECTIONS of the nodes. Default: 4",
+    )
+    args.add_argument(
+        "--part_size",
+        default=16,
+        type=int,
+        help="REPLICATION_PART_BYTES of the nodes, in MB. Default: 16",
+    )
+    args.add_argument(
+        "--gc_budget",
+        default=8,
+        type=int,
+        help="GC_IO_BUDGET of the nodes in MB, the replaced folder of the resync is truncated by steps of it. Default: 8",
+    )
+    args.add_argument(
+        "--port",
+        default=5060,
+        type=int,
+        help="Port of the first node, the others follow. Default: 5060",
+    )
+    args.add_argument(
+        "--ollama_port",
+        default=11436,
+        type=int,
+        help="Port of the fake Ollama server the nodes share. Default: 11436",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Write the JSON report to this file. Default: stdout only",
+    )
+
+    return parser
+
+
+@contextmanager
+def running_nodes(args):
+    """Run ``args.nodes`` handlers, each on its own UPLOAD_DIR, and a fake Ollama.
+
+    Yields the url of every node. Everything is stopped and removed on exit.
+    """
+    root = Path(tempfile.mkdtemp(prefix="model_handler_replication_", dir=args.dir))
+    processes = []
+    try:
+        ollama = subprocess.Popen(
+            [
+                sys.executable,
+                str(Path(__file__).with_name("fake_ollama.py")),
+                f"--port={args.ollama_port}",
+            ],
+            cwd=root,
+        )
+        processes.append(ollama)
+        wait_alive(f"http://127.0.0.1:{args.ollama_port}/", ollama)
+        urls = []
+        for index in range(args.nodes):
+            port = args.port + index
+            upload_dir = root / f"node{index}" / "models"
+            work_dir = root / f"node{index}" / "work"
+            for folder in (upload_dir, work_dir):
+                folder.mkdir(parents=True, exist_ok=True)
+            env = dict(
+                os.environ,
+                UPLOAD_DIR=str(upload_dir),
+                MODEL_SERVER_IP="127.0.0.1",
+                MODEL_SERVER_PORT=str(args.ollama_port),
+                MODEL_HANDLER_PORT=str(port),
+                PEER_URL=f"http://127.0.0.1:{port}/",
+                REPLICATION_CONNECTIONS=str(args.connections),
+                REPLICATION_PART_BYTES=str(args.part_size * MB),
+                GC_IO_BUDGET=str(args.gc_budget * MB),
+                DISK_HEADROOM_BYTES="0",
+            )
+            handler = subprocess.Popen(
+                [sys.executable, str(SRC_PATH / "app.py")],
+                cwd=work_dir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            processes.append(handler)
+            urls.append(f"http://127.0.0.1:{port}/")
+        for url, handler in zip(urls, processes[1:]):
+            wait_alive(url, handler)
+        yield root, urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def tree_depth(result: dict) -> int:
+    # Rounds of the rollout below this node.
+    targets = result.get("details", {}).get("targets") or []
+    return 1 + max((tree_depth(target) for target in targets), default=0)
+
+
+def flatten(result: dict, target: str) -> list:
+    details = result.get("details", {})
+    rows = [
+        {
+            "target": target,
+            "status": result.get("status"),
+            "action": result.get("action"),
+            "fetched_bytes": details.get("fetched_bytes"),
+        }
+    ]
+    for child in details.get("targets") or []:
+        rows += flatten(child, child["target"])
+    return rows
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(MB):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def resync(root: Path, urls: list, archive: Path, client: httpx.Client) -> dict:
+    """Change the last member on the first node and sync the second from it.
+
+    The unchanged members are taken from the folder the sync replaces, which
+    the storage GC then reclaims: they must still be intact afterwards.
+    """
+    source = root / "node0" / "models" / MODEL
+    with zipfile.ZipFile(archive) as zip_ref:
+        names = zip_ref.namelist()
+    changed = root / f"{MODEL}_changed.zip"
+    with zipfile.ZipFile(changed, "w", zipfile.ZIP_STORED) as zip_ref:
+        for name in names[:-1]:
+            zip_ref.write(source / name, name)
+        zip_ref.writestr(names[-1], os.urandom((source / names[-1]).stat().st_size))
+    with open(changed, "rb") as file:
+        deployed = stream_request(
+            client,
+            "POST",
+            urls[0] + "deploy/",
+            files={"model": (f"{MODEL}.zip", file, "application/zip")},
+            data={"model_name_on_ollama": MODEL},
+        )
+    if not deployed["ok"]:
+        raise RuntimeError(f"Deploy of the changed archive failed: {deployed}")
+
+    started = time.perf_counter()
+    synced = stream_request(
+        client, "POST", urls[1] + "model/sync/", json={"model": MODEL, "peer": urls[0]}
+    )
+    elapsed = time.perf_counter() - started
+    trash = root / "node1" / "models" / ".trash"
+    deadline = time.monotonic() + 300
+    while any(trash.iterdir()) and time.monotonic() < deadline:
+        time.sleep(0.5)
+    reclaimed = time.perf_counter() - started
+
+    reference = client.get(urls[0] + f"model/{MODEL}/files/").json()["files"]
+    target = root / "node1" / "models" / MODEL
+    damaged = [
+        entry["name"]
+        for entry in reference
+        if not (target / entry["name"]).is_file()
+        or file_sha256(target / entry["name"]) != entry["sha256"]
+    ]
+    details = (synced["last"] or {}).get("message", {}).get("details", {})
+    return {
+        "seconds": round(elapsed, 3),
+        "reclaimed_seconds": round(reclaimed, 3),
+        "local_files": details.get("local_files"),
+        "fetched_bytes": details.get("fetched_bytes"),
+        "reclaimed": not any(trash.iterdir()),
+        "damaged": damaged,
+        "passed": synced["ok"] and not damaged,
+    }
+
+
+def main(args):
+    with running_nodes(args) as (root, urls):
+        archive = root / f"{MODEL}.zip"
+        make_archive(archive, args.size * MB, args.members)
+        with httpx.Client(timeout=None) as client:
+            with open(archive, "rb") as file:
+                deployed = stream_request(
+                    client,
+                    "POST",
+                    urls[0] + "deploy/",
+                    files={"model": (archive.name, file, "application/zip")},
+                    data={"model_name_on_ollama": MODEL},
+                )
+            if not deployed["ok"]:
+                raise RuntimeError(f"Deploy to the first node failed: {deployed}")
+
+            started = time.perf_counter()
+            synced = stream_request(
+                client,
+                "POST",
+                urls[1] + "model/sync/",
+                json={
+                    "model": MODEL,
+                    "peer": urls[0],
+                    "model_name_on_ollama": MODEL,
+                    "targets": urls[2:],
+                    "fanout": args.fanout,
+                },
+            )
+            elapsed = time.perf_counter() - started
+
+            reference = client.get(urls[0] + f"model/{MODEL}/files/").json()
+            mismatched = [
+                url
+                for url in urls[1:]
+                if client.get(url + f"model/{MODEL}/files/").json().get("files")
+                != reference["files"]
+            ]
+            resynced = resync(root, urls, archive, client)
+        last = synced["last"] or {}
+        result = {
+            "status": last.get("status"),
+            "action": last.get("message", {}).get("action"),
+            "details": last.get("message", {}).get("details", {}),
+        }
+        return {
+            "nodes": args.nodes,
+            "fanout": args.fanout,
+            "archive_mb": round(archive.stat().st_size / MB, 2),
+            "connections": args.connections,
+            "part_mb": args.part_size,
+            "seconds": round(elapsed, 3),
+            "rounds": tree_depth(result),
+            "targets": flatten(result, urls[1]),
+            "mismatched": mismatched,
+            "resync": resynced,
+            "passed": synced["ok"] and not mismatched and resynced["passed"],
+        }
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    print(f"""The parameter you set is like below:\n \
+    * nodes : {args.nodes} \n \
+    * fanout : {args.fanout} \n \
+    * size : {args.size} MB \n \
+    * connections : {args.connections} \n \
+    * gc_budget : {args.gc_budget} MB \n \n \n """)
+    report = main(args)
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    raise SystemExit(0 if report["passed"] else 1)
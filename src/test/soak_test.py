@@ -0,0 +1,358 @@
+import asyncio
+import json
+import statistics
+import time
+from argparse import SUPPRESS, ArgumentParser
+
+import httpx
+
+from benchmark_api import MB, ProcessSampler, make_archive, running_handler
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-d",
+        "--dir",
+        default=None,
+        type=str,
+        help="Folder under which the run's UPLOAD_DIR is created and removed afterwards. Default: system temp folder",
+    )
+    args.add_argument(
+        "--deployers",
+        default=50,
+        type=int,
+        help="Clients deploying then deleting their own model in a loop. Default: 50",
+    )
+    args.add_argument(
+        "--listers",
+        default=500,
+        type=int,
+        help="Clients polling the model list in a loop. Default: 500",
+    )
+    args.add_argument(
+        "--watchers",
+        default=0,
+        type=int,
+        help="Clients following the events of the running deploys. Default: 0",
+    )
+    args.add_argument(
+        "--think_time",
+        default=1.0,
+        type=float,
+        help="Seconds a client waits between two requests. Default: 1",
+    )
+    args.add_argument(
+        "--size",
+        default=8,
+        type=int,
+        help="Size in MB of the deployed archive. Default: 8",
+    )
+    args.add_argument(
+        "-t",
+        "--duration",
+        default=3600,
+        type=float,
+        help="Seconds the load runs. Default: 3600",
+    )
+    args.add_argument(
+        "--warmup",
+        default=60,
+        type=float,
+        help="Seconds of load before the baseline is sampled. Default: 60",
+    )
+    args.add_argument(
+        "--settle",
+        default=10,
+        type=float,
+        help="Seconds to wait after the load before the final sample. Default: 10",
+    )
+    args.add_argument(
+        "--interval",
+        default=5,
+        type=float,
+        help="Seconds between two samples of the timeline. Default: 5",
+    )
+    args.add_argument(
+        "--max_thread_growth",
+        default=10,
+        type=int,
+        help="Threads the handler may gain between baseline and final sample. Default: 10",
+    )
+    args.add_argument(
+        "--max_fd_growth",
+        default=20,
+        type=int,
+        help="Open FDs the handler may gain between baseline and final sample. Default: 20",
+    )
+    args.add_argument(
+        "--max_rss_growth",
+        default=100,
+        type=int,
+        help="MB of RSS the handler may gain between baseline and final sample. Default: 100",
+    )
+    args.add_argument(
+        "--max_lag",
+        default=0.5,
+        type=float,
+        help="Seconds the p99 event loop lag may reach under load. Default: 0.5",
+    )
+    args.add_argument(
+        "--port",
+        default=5055,
+        type=int,
+        help="Port of the model handler under test. Default: 5055",
+    )
+    args.add_argument(
+        "--ollama_port",
+        default=11435,
+        type=int,
+        help="Port of the fake Ollama server. Default: 11435",
+    )
+    args.add_argument(
+        "--latency",
+        default=0.0,
+        type=float,
+        help="Seconds the fake Ollama adds before every response. Default: 0",
+    )
+    args.add_argument(
+        "--create_steps",
+        default=10,
+        type=int,
+        help="Progress lines streamed by the fake '/api/create'. Default: 10",
+    )
+    args.add_argument(
+        "--step_interval",
+        default=0.01,
+        type=float,
+        help="Seconds between two progress lines of the fake '/api/create'. Default: 0.01",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Write the JSON report to this file. Default: stdout only",
+    )
+
+    return parser
+
+
+class LoadStats:
+    def __init__(self):
+        self.requests = {}
+        self.errors = {}
+        self.last_error = None
+        self.running_tasks = set()
+
+    def add(self, kind: str, ok: bool, detail=None):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        if not ok:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            self.last_error = {"kind": kind, "detail": detail}
+
+
+async def read_stream(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    # Yields each progress message, then whether the stream ended in a success.
+    last = None
+    async with client.stream(method, url, **kwargs) as response:
+        async for line in response.aiter_lines():
+            if line.strip():
+                last = json.loads(line)
+                yield last
+        ok = response.status_code == 200 and (last is None or last["status"] == 200)
+    yield {"ok": ok, "last": last}
+
+
+async def deployer(client, base_url, archive, index, stats: LoadStats, stop, think):
+    name = f"soak_{index}"
+    while not stop.is_set():
+        with open(archive, "rb") as file:
+            result, task_uuid = None, None
+            async for message in read_stream(
+                client,
+                "POST",
+                base_url + "/deploy/",
+                files={"model": (f"{name}.zip", file, "application/zip")},
+                data={"model_name_on_ollama": name},
+            ):
+                if "ok" in message:
+                    result = message
+                elif task_uuid is None:
+                    task_uuid = message["message"]["task_uuid"]
+                    stats.running_tasks.add(task_uuid)
+            stats.running_tasks.discard(task_uuid)
+            stats.add("deploy", result["ok"], result["last"])
+
+        async for message in read_stream(
+            client, "DELETE", base_url + "/model/", params={"model": name}
+        ):
+            if "ok" in message:
+                stats.add("delete", message["ok"], message["last"])
+        await asyncio.sleep(think)
+
+
+async def lister(client, base_url, stats: LoadStats, stop, think):
+    while not stop.is_set():
+        async for message in read_stream(client, "GET", base_url + "/model/"):
+            if "ok" in message:
+                stats.add("list", message["ok"], message["last"])
+        await asyncio.sleep(think)
+
+
+async def watcher(client, base_url, stats: LoadStats, stop, think):
+    while not stop.is_set():
+        if stats.running_tasks:
+            task_uuid = next(iter(stats.running_tasks))
+            response = await client.get(f"{base_url}/task/{task_uuid}/events")
+            stats.add("events", response.status_code == 200, response.text[:200])
+        await asyncio.sleep(think)
+
+
+async def keep_running(make_work, stats: LoadStats, stop, think: float):
+    # A failed request is counted, it does not end the client.
+    while not stop.is_set():
+        try:
+            await make_work()
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            stats.add("client", False, repr(e))
+            await asyncio.sleep(think)
+
+
+async def probe_lag(client: httpx.AsyncClient, base_url: str) -> float:
+    # "/" does no work, its latency is the time spent queued on the event loop.
+    start = time.perf_counter()
+    await client.get(base_url + "/")
+    return time.perf_counter() - start
+
+
+def sample(sampler: ProcessSampler, lags: list, stats: LoadStats, start: float):
+    return {
+        "seconds": round(time.monotonic() - start, 1),
+        "threads": sampler.threads(),
+        "open_fds": sampler.open_fds(),
+        "rss_mb": round(sampler.rss_bytes() / MB, 1),
+        "lag_p50_seconds": round(statistics.median(lags), 4) if lags else 0.0,
+        "lag_max_seconds": round(max(lags), 4) if lags else 0.0,
+        "requests": dict(stats.requests),
+        "errors": dict(stats.errors),
+    }
+
+
+async def soak(args, work_dir, handler):
+    base_url = f"http://127.0.0.1:{args.port}"
+    archive = work_dir / "archive.zip"
+    make_archive(archive, args.size * MB, 1)
+    sampler = ProcessSampler(handler.pid)
+    stats = LoadStats()
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    start = time.monotonic()
+    timeline, all_lags = [], []
+
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        before = sample(sampler, [], stats, start)
+        clients = (
+            [
+                lambda index=index: deployer(
+                    client, base_url, archive, index, stats, stop, args.think_time
+                )
+                for index in range(args.deployers)
+            ]
+            + [
+                lambda: lister(client, base_url, stats, stop, args.think_time)
+                for _ in range(args.listers)
+            ]
+            + [
+                lambda: watcher(client, base_url, stats, stop, args.think_time)
+                for _ in range(args.watchers)
+            ]
+        )
+        tasks = [
+            asyncio.create_task(keep_running(make_work, stats, stop, args.think_time))
+            for make_work in clients
+        ]
+
+        baseline = None
+        next_sample = time.monotonic() + args.interval
+        lags = []
+        while time.monotonic() - start < args.duration:
+            lags.append(await probe_lag(client, base_url))
+            await asyncio.sleep(0.1)
+            if time.monotonic() < next_sample:
+                continue
+            next_sample += args.interval
+            timeline.append(sample(sampler, lags, stats, start))
+            all_lags += lags
+            lags = []
+            print(json.dumps(timeline[-1]))
+            if baseline is None and time.monotonic() - start >= args.warmup:
+                baseline = timeline[-1]
+
+        stop.set()
+        await asyncio.gather(*tasks)
+        await asyncio.sleep(args.settle)
+        final = sample(sampler, [], stats, start)
+
+    baseline = baseline or before
+    all_lags.sort()
+    lag_p99 = all_lags[int(len(all_lags) * 0.99)] if all_lags else 0.0
+    growth = {
+        "threads": final["threads"] - baseline["threads"],
+        "open_fds": final["open_fds"] - baseline["open_fds"],
+        "rss_mb": round(final["rss_mb"] - baseline["rss_mb"], 1),
+    }
+    failures = []
+    if growth["threads"] > args.max_thread_growth:
+        failures.append(f"Threads grew by {growth['threads']}.")
+    if growth["open_fds"] > args.max_fd_growth:
+        failures.append(f"Open FDs grew by {growth['open_fds']}.")
+    if growth["rss_mb"] > args.max_rss_growth:
+        failures.append(f"RSS grew by {growth['rss_mb']} MB.")
+    if lag_p99 > args.max_lag:
+        failures.append(f"p99 event loop lag is {round(lag_p99, 4)} seconds.")
+    return {
+        "passed": not failures,
+        "failures": failures,
+        "before": before,
+        "baseline": baseline,
+        "final": final,
+        "growth": growth,
+        "lag_p99_seconds": round(lag_p99, 4),
+        "last_error": stats.last_error,
+        "timeline": timeline,
+    }
+
+
+def main(args):
+    with running_handler(args) as (work_dir, handler):
+        return asyncio.run(soak(args, work_dir, handler))
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    print(f"""The parameter you set is like below:\n \
+    * deployers : {args.deployers} \n \
+    * listers : {args.listers} \n \
+    * watchers : {args.watchers} \n \
+    * duration : {args.duration} s \n \
+    * warmup : {args.warmup} s \n \n \n """)
+    report = main(args)
+    print(
+        json.dumps(
+            {key: value for key, value in report.items() if key != "timeline"}, indent=4
+        )
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    raise SystemExit(0 if report["passed"] else 1)
@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import json
+import time
+from argparse import SUPPRESS, ArgumentParser
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Stand-in for a callback receiver, to try completion webhooks locally.
+CONFIG = {"secret": None, "fail_first": 0, "max_skew": 300}
+DELIVERIES = []
+ATTEMPTS = {}
+
+app = FastAPI()
+
+
+def build_argparser():
+    parser = ArgumentParser(add_help=False)
+    args = parser.add_argument_group("Options")
+
+    args.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        default=SUPPRESS,
+        help="Show this help message and exit.",
+    )
+    args.add_argument(
+        "-ip",
+        "--ip",
+        default="127.0.0.1",
+        type=str,
+        help="The ip to listen on. Default: 127.0.0.1",
+    )
+    args.add_argument(
+        "-p",
+        "--port",
+        default=8085,
+        type=int,
+        help="The port to listen on. Default: 8085",
+    )
+    args.add_argument(
+        "-s",
+        "--secret",
+        default=None,
+        type=str,
+        help="WEBHOOK_SECRET of the handler, to check the signatures. Default: not checked",
+    )
+    args.add_argument(
+        "--fail_first",
+        default=0,
+        type=int,
+        help="Answer 503 to the first attempts of each delivery, to see the retries. Default: 0",
+    )
+    args.add_argument(
+        "--max_skew",
+        default=300,
+        type=int,
+        help="Seconds a signature timestamp may be off. Default: 300",
+    )
+
+    return parser
+
+
+def verify(secret: str, timestamp: str, signature: str, body: bytes) -> bool:
+    message = timestamp.encode() + b"." + body
+    expected = (
+        "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    )
+    return hmac.compare_digest(expected, signature)
+
+
+@app.post("/{path:path}")
+async def receive(path: str, request: Request):
+    body = await request.body()
+    delivery = request.headers.get("X-Model-Handler-Delivery")
+    if CONFIG["secret"] is not None:
+        timestamp = request.headers.get("X-Model-Handler-Timestamp", "0")
+        signature = request.headers.get("X-Model-Handler-Signature", "")
+        if abs(time.time() - int(timestamp)) > CONFIG["max_skew"] or not verify(
+            CONFIG["secret"], timestamp, signature, body
+        ):
+            print(f"Reject delivery {delivery}: bad signature.")
+            return JSONResponse({"error": "bad signature"}, status_code=401)
+
+    ATTEMPTS[delivery] = ATTEMPTS.get(delivery, 0) + 1
+    if ATTEMPTS[delivery] <= CONFIG["fail_first"]:
+        print(f"Fail delivery {delivery}, attempt {ATTEMPTS[delivery]}.")
+        return JSONResponse({"error": "try again"}, status_code=503)
+
+    payload = json.loads(body)
+    DELIVERIES.append(
+        {
+            "path": "/" + path,
+            "delivery": delivery,
+            "event": request.headers.get("X-Model-Handler-Event"),
+            "attempts": ATTEMPTS[delivery],
+            "payload": payload,
+        }
+    )
+    print(json.dumps(DELIVERIES[-1]))
+    return {"received": delivery}
+
+
+@app.get("/deliveries")
+async def deliveries():
+    return DELIVERIES
+
+
+if __name__ == "__main__":
+    args = build_argparser().parse_args()
+    CONFIG.update(
+        secret=args.secret, fail_first=args.fail_first, max_skew=args.max_skew
+    )
+    uvicorn.run(app, host=args.ip, port=args.port, log_level="warning")
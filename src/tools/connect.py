@@ -1,41 +1,292 @@
-import os
-
 import httpx
 
+from tools.settings import get_settings
+
 
 def get_port():
     # Get models port from ENV parameter.
-    port = int(os.environ.get("MODEL_HANDLER_PORT", "5000"))
-    return port
+    return get_settings().MODEL_HANDLER_PORT
 
 
 def get_models_folder():
-    # Get models folder from ENV parameter.
-    dir_path = os.environ.get("UPLOAD_DIR", "/workspace/models/inno")
+    # Get models folder from ENV parameter, checked when the settings load.
+    return get_settings().UPLOAD_DIR
 
-    # check folder path exist
-    if not os.path.exists(dir_path):
-        raise FileExistsError("Models folder not found.")
 
-    return dir_path
+def get_workers():
+    # Get number of uvicorn workers from ENV parameter.
+    return get_settings().MODEL_HANDLER_WORKERS
 
 
-def get_model_server_url(ip: str = "127.0.0.1", port: int = 11434):
-    # Get ip folder from ENV parameter.
-    ip = os.environ.get("MODEL_SERVER_IP", ip)
+def get_state_folder():
+    # Get folder that holds shared handler state (locks, tasks, events).
+    return get_settings().state_folder
 
-    # Get port folder from ENV parameter.
-    port = os.environ.get("MODEL_SERVER_PORT", str(port))
 
-    try:
-        full_url = check_connection(ip=ip, port=port)
-    except Exception as e:
-        raise ConnectionError(f"Connect to Model server failed : \n detail \n: {e}")
-    return full_url
+def get_trash_folder():
+    # Deleted model folders wait here to be reclaimed, same filesystem as models.
+    return get_settings().trash_folder
+
+
+def get_spool_folder():
+    # Folder where uploads are spooled, keep it on the models volume.
+    return get_settings().spool_folder
+
+
+def get_state_backend_name():
+    # Multi-worker deployments must share state through the models volume.
+    return get_settings().state_backend
+
+
+def get_disk_headroom():
+    # Bytes always left free on the models volume.
+    return get_settings().DISK_HEADROOM_BYTES
+
+
+def get_disk_quota():
+    # Bytes the models may take, 0 for no quota but the free space.
+    return get_settings().DISK_QUOTA_BYTES
+
+
+def get_ollama_models_dir():
+    # Ollama's models folder, counted in the quota when set.
+    return get_settings().OLLAMA_MODELS_DIR
+
+
+def get_disk_eviction():
+    # Whether deploys short of space delete the least recently used models.
+    return get_settings().DISK_EVICTION
+
+
+def get_pinned_models():
+    # Model folders never evicted.
+    return get_settings().pinned_models
+
+
+def get_admission_timeout():
+    # Seconds a request may wait for disk reservations of others to be released.
+    return get_settings().ADMISSION_QUEUE_TIMEOUT
+
+
+def get_zip_retention():
+    # When an uploaded zip is removed: "delete", "hours" or "until_create".
+    return get_settings().ZIP_RETENTION
+
+
+def get_zip_retention_hours():
+    return get_settings().ZIP_RETENTION_HOURS
+
+
+def get_gc_interval():
+    # Seconds between two storage GC sweeps.
+    return get_settings().GC_INTERVAL
+
+
+def get_gc_io_budget():
+    # Bytes per second the storage GC may reclaim.
+    return get_settings().GC_IO_BUDGET
+
+
+def get_ingest_io_mode():
+    # How uploads are written: "buffered", "dontneed" or "direct".
+    return get_settings().INGEST_IO_MODE
+
+
+def get_ingest_sync_bytes():
+    # Written bytes between two flushes of the page cache.
+    return get_settings().INGEST_SYNC_BYTES
+
+
+def get_ingest_fsync():
+    # Whether an ingested file is fsync'ed before it is reported as saved.
+    return get_settings().INGEST_FSYNC
+
+
+def get_ingest_queue_depth():
+    # Chunks in flight between the reader, hasher and writer stages.
+    return get_settings().INGEST_QUEUE_DEPTH
+
+
+def get_ingest_max_chunk():
+    # Upper bound of the adaptive ingest chunk size.
+    return get_settings().INGEST_MAX_CHUNK_BYTES
+
+
+def get_save_concurrency():
+    # Uploads of this worker saved to the models volume at once.
+    return get_settings().SAVE_CONCURRENCY
+
+
+def get_extract_concurrency():
+    # Archives of this worker extracted at once.
+    return get_settings().EXTRACT_CONCURRENCY
+
+
+def get_create_concurrency():
+    # Models of this worker created on the model server at once.
+    return get_settings().CREATE_CONCURRENCY
+
+
+def get_interactive_workers():
+    # Threads reserved for quick requests (model list, delete).
+    return get_settings().INTERACTIVE_WORKERS
+
+
+def get_bulk_workers():
+    # Uploads, deploys and creates running at once, the others queue.
+    return get_settings().BULK_WORKERS
+
+
+def get_background_workers():
+    # Threads of the best-effort lane (storage GC).
+    return get_settings().BACKGROUND_WORKERS
+
+
+def get_instance_timeout():
+    # Seconds without heartbeat before an instance's ingests and locks are taken over.
+    return get_settings().INSTANCE_TIMEOUT
+
+
+def get_task_retention_hours():
+    # Hours finished task records and their progress events are kept.
+    return get_settings().TASK_RETENTION_HOURS
+
+
+def get_task_traces():
+    # Whether each task writes its span timings to log/<date>/traces/<uuid>.json.
+    return get_settings().TASK_TRACES
+
+
+def get_admin_token():
+    # Token of the admin endpoints, they are disabled when it is not set.
+    return get_settings().ADMIN_TOKEN
+
+
+def get_webhook_secret():
+    # Key of the HMAC signature of completion callbacks, required to send them.
+    return get_settings().WEBHOOK_SECRET
+
+
+def get_webhook_max_attempts():
+    # Sends of a completion callback before it is dropped.
+    return get_settings().WEBHOOK_MAX_ATTEMPTS
+
+
+def get_webhook_timeout():
+    # Seconds a callback receiver has to answer.
+    return get_settings().WEBHOOK_TIMEOUT
+
+
+def get_webhook_concurrency():
+    # Callbacks of this worker sent at once, over one pooled client.
+    return get_settings().WEBHOOK_CONCURRENCY
+
+
+def get_warmup_on_deploy():
+    # Whether deploys and creates load the model when the request does not say.
+    return get_settings().WARMUP_ON_DEPLOY
+
+
+def get_warmup_keep_alive():
+    # How long Ollama keeps a model warmed up by a deploy loaded.
+    return get_settings().WARMUP_KEEP_ALIVE
+
+
+def get_warmup_timeout():
+    # Seconds a model load may take on the model server.
+    return get_settings().WARMUP_TIMEOUT
+
+
+def get_hot_models():
+    # Models kept loaded, as (name, (start, end) minutes of the day or None).
+    return get_settings().hot_models
+
+
+def get_hot_models_keep_alive():
+    # keep_alive of the loads of the hot models scheduler, refreshed before it ends.
+    return get_settings().HOT_MODELS_KEEP_ALIVE
+
+
+def get_hot_models_interval():
+    # Seconds between two checks of the loaded models.
+    return get_settings().HOT_MODELS_INTERVAL
+
+
+def get_hot_recent_models():
+    # Most used models also kept loaded, 0 to only keep HOT_MODELS.
+    return get_settings().HOT_RECENT_MODELS
+
+
+def get_hot_recent_hours():
+    # Hours of model server usage the most used models are ranked on.
+    return get_settings().HOT_RECENT_HOURS
+
+
+def get_inventory_ttl():
+    # Seconds the merged model inventory is served from cache.
+    return get_settings().INVENTORY_TTL
+
+
+def get_peer_url():
+    # Url other handlers reach this one at, the peer of the targets it seeds.
+    return get_settings().peer_url
+
+
+def get_replication_connections():
+    # Ranged downloads a model sync runs at once.
+    return get_settings().REPLICATION_CONNECTIONS
+
+
+def get_replication_part_size():
+    # Bytes of a file fetched by one ranged download.
+    return get_settings().REPLICATION_PART_BYTES
+
+
+def get_replication_fanout():
+    # Targets a node seeds itself once it has the model.
+    return get_settings().REPLICATION_FANOUT
+
+
+def get_replication_timeout():
+    # Seconds a peer may take to answer a request of a model sync.
+    return get_settings().REPLICATION_TIMEOUT
+
+
+def get_model_servers():
+    # Model server pool, as (name, url) in MODEL_SERVERS order.
+    return get_settings().model_servers
+
+
+def get_model_server_placement():
+    # Which servers of the pool a model is created on.
+    return get_settings().MODEL_SERVER_PLACEMENT
+
+
+def get_model_server_pins():
+    # Model folder -> the server the pinned placement creates it on.
+    return get_settings().model_server_pins
+
+
+def get_model_server_health_interval():
+    # Seconds between two health checks of every model server.
+    return get_settings().MODEL_SERVER_HEALTH_INTERVAL
+
+
+def get_model_server_url():
+    # The first model server, for requests not placed on the pool.
+    return get_model_servers()[0][1]
+
+
+def check_model_server():
+    # Probed once at startup, the pool checks the servers afterwards.
+    return [check_url(url) for _, url in get_model_servers()]
 
 
 def check_connection(ip: str, port: int):
-    full_url = f"http://{ip}:{port}/"
+    return check_url(f"http://{ip}:{port}/")
+
+
+def check_url(full_url: str):
     try:
         response = httpx.get(full_url, timeout=5)
         if response.status_code == 200:
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import shutil
+import time
+import zipfile
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import UploadFile
+
+from tools.connect import (
+    get_admission_timeout,
+    get_disk_headroom,
+    get_disk_quota,
+    get_gc_io_budget,
+    get_models_folder,
+    get_ollama_models_dir,
+    get_spool_folder,
+)
+
+from .ingest_io import links_into_place
+from .inventory import folder_size
+from .metrics import REGISTRY
+from .state_backend import get_state_backend
+from .zip_handler import ZipOperator
+
+POLL_INTERVAL = 1
+# Seconds added to the storage GC time of evicted models before giving up.
+RECLAIM_SLACK = 30
+
+
+def visible_usage(root_path: str) -> int:
+    # Model folders and zips. Ingests write hidden files and are reserved instead.
+    usage = 0
+    with os.scandir(root_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                usage += folder_size(entry.path)
+            else:
+                usage += entry.stat(follow_symlinks=False).st_size
+    return usage
+
+
+class InsufficientStorage(Exception):
+    """The request can never fit on the models volume (HTTP 507)."""
+
+
+class AdmissionTimeout(Exception):
+    """The request fits, but not next to the running ingests (HTTP 429)."""
+
+    def __init__(self, message, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DiskAdmission:
+    """Reserves disk space for an ingest before any byte is written.
+
+    Reservations live in the state backend, so every worker accounts for
+    the ingests of the others. The space is the free space of the volume,
+    capped by ``DISK_QUOTA_BYTES`` when set. Given ``make_room``, a request
+    short of space first asks it to free the missing bytes, then waits for
+    the storage GC to reclaim them.
+    """
+
+    def __init__(
+        self, make_room: Optional[Callable[[int, str], Awaitable[int]]] = None
+    ):
+        self.root_path = get_models_folder()
+        self.headroom = get_disk_headroom()
+        self.timeout = get_admission_timeout()
+        self.quota = get_disk_quota()
+        self.make_room = make_room
+        self.state = get_state_backend()
+
+    @staticmethod
+    def estimate(file: UploadFile) -> int:
+        # Everything the zip extracts to, plus the zip itself unless it is
+        # spooled on the models volume: its bytes are already used there.
+        size = file.size or 0
+        if links_into_place(file.file, get_models_folder()):
+            size = 0
+        try:
+            file.file.seek(0)
+            size += ZipOperator.uncompressed_size(file.file)
+        except zipfile.BadZipFile:
+            pass  # save_model reports the invalid archive.
+        finally:
+            file.file.seek(0)
+        return size
+
+    def quota_usage(self) -> int:
+        usage = visible_usage(self.root_path)
+        spool_folder = get_spool_folder()
+        if os.stat(spool_folder).st_dev == os.stat(self.root_path).st_dev:
+            # Spooled uploads are linked into the models folder, not reserved.
+            usage += folder_size(spool_folder)
+        if get_ollama_models_dir():
+            usage += folder_size(get_ollama_models_dir())
+        return usage
+
+    def capacity(self) -> int:
+        capacity = shutil.disk_usage(self.root_path).free - self.headroom
+        if self.quota:
+            capacity = min(capacity, self.quota - self.quota_usage())
+        return capacity
+
+    def reserved(self) -> int:
+        return sum(item["size"] for item in self.state.list_reservations())
+
+    def shortfall(self, size: int) -> int:
+        # Bytes to free for the request to fit next to the running ingests.
+        return max(size + self.reserved() - self.capacity(), 0)
+
+    async def admit(self, uuid: str, model: str, size: int):
+        deadline = time.monotonic() + self.timeout
+        capacity = await asyncio.to_thread(self.capacity)
+        freed = 0
+        shortfall = await asyncio.to_thread(self.shortfall, size)
+        if shortfall and self.make_room is not None:
+            freed = await self.make_room(shortfall, model)
+            # Evicted models are reclaimed by the storage GC at its I/O budget.
+            reclaim = freed / get_gc_io_budget() * 2 + RECLAIM_SLACK
+            deadline = max(deadline, time.monotonic() + reclaim)
+        if size > capacity + freed:
+            raise InsufficientStorage(
+                f"'{model}' needs {size} bytes but only {max(capacity + freed, 0)} bytes are available."
+            )
+
+        while not self.state.reserve_space(
+            uuid, model, size, await asyncio.to_thread(self.capacity)
+        ):
+            if time.monotonic() >= deadline:
+                raise AdmissionTimeout(
+                    f"Not enough free space for '{model}' until running ingests finish.",
+                    retry_after=POLL_INTERVAL * 10,
+                )
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def update(self, uuid: str, size: int):
+        self.state.update_reservation(uuid, size)
+
+    def release(self, uuid: str):
+        self.state.release_space(uuid)
+
+    def status(self) -> Dict:
+        usage = shutil.disk_usage(self.root_path)
+        reservations = self.state.list_reservations()
+        reserved = sum(item["size"] for item in reservations)
+        quota_used = self.quota_usage() if self.quota else 0
+        capacity = usage.free - self.headroom
+        if self.quota:
+            capacity = min(capacity, self.quota - quota_used)
+        return {
+            "path": self.root_path,
+            "total": usage.total,
+            "free": usage.free,
+            "headroom": self.headroom,
+            "quota": self.quota,
+            "quota_used": quota_used,
+            "reserved": reserved,
+            "available": max(capacity - reserved, 0),
+            "reservations": reservations,
+        }
+
+
+def _disk_samples():
+    status = DiskAdmission().status()
+    return [
+        ((kind,), status[kind])
+        for kind in (
+            "total",
+            "free",
+            "headroom",
+            "quota",
+            "quota_used",
+            "reserved",
+            "available",
+        )
+    ]
+
+
+REGISTRY.gauge(
+    "model_handler_disk_bytes",
+    "Models volume space: total, free, headroom, quota and its use, reserved by running ingests and available.",
+    ("kind",),
+    _disk_samples,
+)
+REGISTRY.gauge(
+    "model_handler_disk_reservations",
+    "Disk reservations of running ingests.",
+    collect=lambda: [((), len(get_state_backend().list_reservations()))],
+)
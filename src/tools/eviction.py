@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from tools.connect import (
+    get_disk_eviction,
+    get_hot_models,
+    get_models_folder,
+    get_ollama_models_dir,
+    get_pinned_models,
+)
+from utils import config_logger, get_uuid
+
+from .inventory import INVENTORY
+from .metrics import EVICTED_BYTES, EVICTED_MODELS
+from .model_handler import MODEL_STATUS, ModelOperator
+from .model_registry import get_model_registry
+from .ollama_client import ollama_name
+
+EVICTION_LOG = config_logger(
+    file_name="eviction.log",
+    write_mode="a",
+    level="info",
+    logger_name="eviction_logger",
+)
+
+EVICT_LOCK = ".eviction"
+EVICT_LOCK_TIMEOUT = 60
+POLL_INTERVAL = 0.5
+
+SKIP_PINNED = "pinned"
+SKIP_LOADED = "loaded"
+SKIP_BUSY = "busy"
+SKIP_DEPLOYING = "deploying"
+SKIP_BASE = "base"
+
+
+class ModelEvictor:
+    """Deletes the least recently used models to make room for a deploy.
+
+    A model folder was last used when a model created from it was last seen
+    loaded on Ollama, or deployed by the handler, else when the folder was
+    last modified. Folders that are pinned by ``PINNED_MODELS`` or by a
+    ``HOT_MODELS`` entry, loaded on Ollama, the base of adapter deploys, or
+    being worked on are never evicted. Evictions go through ``delete_model``, as ``DELETE /model/``
+    does, and are made by one worker at a time.
+    """
+
+    def __init__(self):
+        self.uuid = get_uuid()
+
+    async def candidates(self, exclude: Optional[str] = None) -> List[Dict]:
+        # Every folder, least recently used first, with why it is kept if it is.
+        INVENTORY.invalidate()
+        inventory = await INVENTORY.get()
+        usage = await asyncio.to_thread(get_model_registry().usage)
+        adapters = await asyncio.to_thread(get_model_registry().adapters)
+        pinned = set(get_pinned_models())
+        hot = {ollama_name(name) for name, _ in get_hot_models()}
+        now = time.time()
+
+        candidates = []
+        for folder, details in inventory["models"].items():
+            names = {ollama_name(model["name"]) for model in details["ollama_models"]}
+            size = details["size"]
+            if get_ollama_models_dir():
+                size += sum(model["size"] or 0 for model in details["ollama_models"])
+            if details["loaded"]:
+                last_used, source = now, "loaded"
+            elif folder in usage:
+                last_used, source = usage[folder], "handler"
+            else:
+                path = os.path.join(get_models_folder(), folder)
+                last_used, source = os.path.getmtime(path), "mtime"
+
+            skip = None
+            if folder in pinned or names & hot:
+                skip = SKIP_PINNED
+            elif details["loaded"]:
+                skip = SKIP_LOADED
+            elif folder in adapters:
+                skip = SKIP_BASE
+            elif folder == exclude:
+                skip = SKIP_DEPLOYING
+            elif folder in MODEL_STATUS or f"{folder}.zip" in MODEL_STATUS:
+                skip = SKIP_BUSY
+            candidates.append(
+                {
+                    "model": folder,
+                    "size": size,
+                    "last_used": last_used,
+                    "last_used_source": source,
+                    "skip": skip,
+                }
+            )
+        candidates.sort(key=lambda candidate: candidate["last_used"])
+        return candidates
+
+    async def plan(self, needed: int, exclude: Optional[str] = None) -> Dict:
+        candidates = await self.candidates(exclude)
+        evict, freed = [], 0
+        for candidate in candidates:
+            if freed >= needed:
+                break
+            if candidate["skip"] is None:
+                evict.append(candidate)
+                freed += candidate["size"]
+        return {
+            "needed": needed,
+            "freed": freed,
+            "enough": freed >= needed,
+            "evict": evict,
+            "candidates": candidates,
+        }
+
+    async def make_room(self, needed: int, model: str) -> int:
+        # Returns the bytes freed, 0 when evicting all it may would not be enough.
+        if not get_disk_eviction():
+            return 0
+        deadline = time.monotonic() + EVICT_LOCK_TIMEOUT
+        while not await asyncio.to_thread(MODEL_STATUS.acquire, EVICT_LOCK, self.uuid):
+            if time.monotonic() >= deadline:
+                return 0
+            await asyncio.sleep(POLL_INTERVAL)  # Another worker is evicting.
+        try:
+            plan = await self.plan(needed, model.removesuffix(".zip"))
+            if not plan["enough"]:
+                EVICTION_LOG.warning(
+                    f"Cannot free {needed} bytes for '{model}', only {plan['freed']} "
+                    "bytes of models may be evicted."
+                )
+                return 0
+            freed = 0
+            for candidate in plan["evict"]:
+                freed += await self.evict(candidate, model)
+            return freed
+        finally:
+            await asyncio.to_thread(MODEL_STATUS.release, EVICT_LOCK, self.uuid)
+
+    async def evict(self, candidate: Dict, model: str) -> int:
+        operator = ModelOperator()
+        operator.streamed = False
+        if not await asyncio.to_thread(
+            MODEL_STATUS.acquire, candidate["model"], operator.uuid
+        ):
+            return 0  # Taken by a request since the plan.
+        EVICTION_LOG.warning(
+            f"'{operator.uuid}' Evict '{candidate['model']}' ({candidate['size']} bytes, "
+            f"last used {time.ctime(candidate['last_used'])}) for '{model}'."
+        )
+        await operator.run(operator.delete_model, model=candidate["model"])
+        if operator.error_flag:
+            return 0
+        EVICTED_MODELS.inc()
+        EVICTED_BYTES.inc(candidate["size"])
+        return candidate["size"]
+
+
+MODEL_EVICTOR = ModelEvictor()
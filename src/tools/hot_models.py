@@ -0,0 +1,244 @@
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+from tools.connect import (
+    get_hot_models,
+    get_hot_models_interval,
+    get_hot_models_keep_alive,
+    get_hot_recent_hours,
+    get_hot_recent_models,
+)
+from utils import config_logger, get_uuid
+
+from .model_handler import timed_stage
+from .model_registry import get_model_registry
+from .model_servers import MODEL_SERVERS, ModelServer
+from .ollama_client import OllamaClient, load_model, ollama_name
+from .stage_limiter import STAGE_WARMUP
+from .state_backend import ModelStatus
+
+HOT_LOG = config_logger(
+    file_name="hot_models.log",
+    write_mode="a",
+    level="info",
+    logger_name="hot_models_logger",
+)
+
+HOT_LOCK = ".hot_models"
+REASON_SCHEDULED = "scheduled"
+REASON_RECENT = "recent"
+# A model expiring within this many intervals is loaded again.
+REFRESH_INTERVALS = 2
+FRACTION = re.compile(r"\.(\d+)")
+
+
+def parse_expires_at(value: Optional[str]) -> Optional[float]:
+    # Ollama sends nanoseconds, which fromisoformat only takes up to micro.
+    if not value:
+        return None
+    value = value.replace("Z", "+00:00")
+    value = FRACTION.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def in_window(window: Optional[Tuple[int, int]], now: datetime) -> bool:
+    if window is None:
+        return True
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end  # Spans midnight.
+
+
+class HotModels:
+    """Keeps chosen models loaded on the model servers.
+
+    Each interval the loaded models are read from ``/api/ps`` of every
+    server, and every hot model that is not loaded on the servers it was
+    created on, the first server if that is not known, or whose
+    ``keep_alive`` ends before the next checks, is loaded again there. Hot models are the ``HOT_MODELS`` entries whose
+    time window is open, plus the ``HOT_RECENT_MODELS`` models most often
+    seen loaded over the last ``HOT_RECENT_HOURS`` while the scheduler was
+    not keeping them. When a model stops being hot it is left to expire.
+    Workers take turns through a lock, the usage seen is per worker.
+    """
+
+    def __init__(self):
+        self.uuid = get_uuid()
+        self.model_status = ModelStatus()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.usage: Dict[str, Deque[float]] = {}
+        self.models: Dict[str, Dict] = {}
+        self.checked: Optional[float] = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self._loop()), name="hot_models", daemon=True
+        )
+        self.thread.start()
+
+    async def _loop(self):
+        while True:
+            if get_hot_models() or get_hot_recent_models():
+                try:
+                    await self.check()
+                except Exception as e:
+                    HOT_LOG.error(f"Hot models check failed. Details : {e!r}")
+            else:
+                with self.lock:
+                    self.models = {}
+            await asyncio.sleep(get_hot_models_interval())
+
+    def record_usage(self, loaded: Dict[str, Optional[float]], now: float):
+        keep = now - get_hot_recent_hours() * 3600
+        with self.lock:
+            for name in loaded:
+                if name not in self.models:
+                    self.usage.setdefault(name, deque()).append(now)
+            for name in list(self.usage):
+                samples = self.usage[name]
+                while samples and samples[0] < keep:
+                    samples.popleft()
+                if not samples:
+                    del self.usage[name]
+
+    def targets(self, now: datetime) -> Dict[str, str]:
+        # Hot model name -> why it is hot.
+        targets = {
+            ollama_name(name): REASON_SCHEDULED
+            for name, window in get_hot_models()
+            if in_window(window, now)
+        }
+        with self.lock:
+            ranked = sorted(self.usage, key=lambda name: -len(self.usage[name]))
+        for name in ranked[: get_hot_recent_models()]:
+            targets.setdefault(name, REASON_RECENT)
+        return targets
+
+    async def check(self):
+        if not await asyncio.to_thread(self.model_status.acquire, HOT_LOCK, self.uuid):
+            return  # Another worker is checking.
+        try:
+            servers = MODEL_SERVERS.all()
+            placements = {
+                ollama_name(name): placed
+                for name, placed in (
+                    await asyncio.to_thread(get_model_registry().all_placements)
+                ).items()
+            }
+            async with OllamaClient(follow_redirects=True) as client:
+                answers = await asyncio.gather(
+                    *(self.loaded(client, server) for server in servers)
+                )
+                loaded = {}
+                for answer in answers:
+                    loaded.update(answer or {})
+                now = time.time()
+                self.record_usage(loaded, now)
+                targets = self.targets(datetime.now())
+                refresh_before = now + REFRESH_INTERVALS * get_hot_models_interval()
+                models = {}
+                for name, reason in targets.items():
+                    state = dict(self.models.get(name, {}), reason=reason)
+                    placed = [
+                        (server, answer)
+                        for server, answer in zip(servers, answers)
+                        if server.name in placements.get(name, ())
+                    ] or [(servers[0], answers[0])]
+                    results = []
+                    for server, answer in placed:
+                        expires_at = (answer or {}).get(name)
+                        if answer is None:
+                            # Checked again next time, reported until then.
+                            result = dict(
+                                loaded=False,
+                                error=f"Model server '{server.name}' did not answer.",
+                            )
+                        elif name not in answer or (
+                            expires_at is not None and expires_at < refresh_before
+                        ):
+                            result = await self.load(client, server, name)
+                        else:
+                            result = dict(
+                                loaded=True, error=None, expires_at=expires_at
+                            )
+                        state.update(result)
+                        results.append(result)
+                    state.update(
+                        loaded=all(result["loaded"] for result in results),
+                        error=next(
+                            (result["error"] for result in results if result["error"]),
+                            None,
+                        ),
+                        model_servers=[server.name for server, _ in placed],
+                    )
+                    models[name] = state
+            with self.lock:
+                self.models = models
+                self.checked = now
+        finally:
+            await asyncio.to_thread(self.model_status.release, HOT_LOCK, self.uuid)
+
+    async def loaded(
+        self, client: OllamaClient, server: ModelServer
+    ) -> Optional[Dict[str, Optional[float]]]:
+        # Loaded model -> when it expires, None if the server does not answer.
+        try:
+            response = await client.get(server.url + "api/ps")
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            HOT_LOG.warning(
+                f"Read loaded models of '{server.name}' failed. Details : {e!r}"
+            )
+            return None
+        return {
+            ollama_name(model["name"]): parse_expires_at(model.get("expires_at"))
+            for model in response.json().get("models", [])
+        }
+
+    async def load(self, client: OllamaClient, server: ModelServer, name: str) -> Dict:
+        keep_alive = get_hot_models_keep_alive()
+        try:
+            with timed_stage(STAGE_WARMUP):
+                seconds = await load_model(client, name, keep_alive, server.url)
+        except Exception as e:
+            HOT_LOG.warning(
+                f"Load hot model {name} on '{server.name}' failed. Details : {e!r}"
+            )
+            return {"loaded": False, "error": repr(e)}
+        HOT_LOG.info(
+            f"Load hot model {name} on '{server.name}' in {round(seconds, 3)} seconds."
+        )
+        return {
+            "loaded": True,
+            "error": None,
+            "keep_alive": keep_alive,
+            "last_load": time.time(),
+            "load_seconds": round(seconds, 3),
+        }
+
+    def status(self) -> Dict:
+        with self.lock:
+            return {
+                "checked": self.checked,
+                "interval": get_hot_models_interval(),
+                "models": dict(self.models),
+                "usage": {name: len(samples) for name, samples in self.usage.items()},
+            }
+
+
+HOT_MODELS = HotModels()
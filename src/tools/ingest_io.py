@@ -0,0 +1,415 @@
+import errno
+import hashlib
+import mmap
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from starlette import formparsers
+
+from tools.connect import (
+    get_ingest_fsync,
+    get_ingest_io_mode,
+    get_ingest_max_chunk,
+    get_ingest_queue_depth,
+    get_ingest_sync_bytes,
+    get_spool_folder,
+)
+from utils import config_logger
+
+IO_LOG = config_logger(
+    file_name="ingest_io.log",
+    write_mode="a",
+    level="info",
+    logger_name="ingest_io_logger",
+)
+
+INGEST_BUFFERED = "buffered"
+INGEST_DONTNEED = "dontneed"
+INGEST_DIRECT = "direct"
+
+ALIGNMENT = 4096
+DIRECT_BUFFER_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 1024 * 1024
+ADAPT_WINDOW_CHUNKS = 8
+
+
+class IngestWriter:
+    """Writes an ingested file without polluting the page cache.
+
+    ``buffered`` is a plain write. ``dontneed`` flushes every ``sync_bytes``
+    and drops the written range with ``POSIX_FADV_DONTNEED``, so the models
+    Ollama has mmapped stay resident. ``direct`` bypasses the cache with
+    aligned ``O_DIRECT`` writes and falls back to ``dontneed`` on filesystems
+    that refuse it.
+    """
+
+    def __init__(
+        self,
+        path,
+        size: Optional[int] = None,
+        mode: Optional[str] = None,
+        sync_bytes: Optional[int] = None,
+        fsync: Optional[bool] = None,
+    ):
+        self.path = str(path)
+        self.mode = mode or get_ingest_io_mode()
+        self.sync_bytes = sync_bytes or get_ingest_sync_bytes()
+        self.fsync = get_ingest_fsync() if fsync is None else fsync
+        self.written = 0
+        self.synced = 0
+        self.buffer = None
+        self.buffered = 0
+
+        if self.mode != INGEST_BUFFERED and not hasattr(os, "posix_fadvise"):
+            self.mode = INGEST_BUFFERED
+        self.fd = self._open()
+        if self.mode == INGEST_DIRECT:
+            self.buffer = mmap.mmap(-1, DIRECT_BUFFER_SIZE)  # Page aligned.
+        if size:
+            self._preallocate(size)
+
+    def _open(self) -> int:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if self.mode == INGEST_DIRECT:
+            try:
+                return os.open(self.path, flags | os.O_DIRECT, 0o666)
+            except (AttributeError, OSError) as e:
+                IO_LOG.warning(
+                    f"O_DIRECT is not supported for '{self.path}', use dontneed. Details : {e}"
+                )
+                self.mode = INGEST_DONTNEED
+        return os.open(self.path, flags, 0o666)
+
+    def _preallocate(self, size: int):
+        # Contiguous extents and an early ENOSPC instead of one mid-upload.
+        if not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            IO_LOG.debug(f"Preallocate '{self.path}' skipped. Details : {e}")
+
+    def __enter__(self) -> "IngestWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        size = len(view)
+        if self.mode == INGEST_DIRECT:
+            self._write_direct(view)
+        else:
+            self._write_all(view)
+            self.written += size
+            if (
+                self.mode == INGEST_DONTNEED
+                and self.written - self.synced >= self.sync_bytes
+            ):
+                self._drop()
+        return size
+
+    def _write_all(self, view: memoryview):
+        while view:
+            view = view[os.write(self.fd, view) :]
+
+    def _write_direct(self, view: memoryview):
+        while view:
+            size = min(len(view), DIRECT_BUFFER_SIZE - self.buffered)
+            self.buffer[self.buffered : self.buffered + size] = view[:size]
+            self.buffered += size
+            self.written += size
+            view = view[size:]
+            if self.buffered == DIRECT_BUFFER_SIZE:
+                self._write_all(memoryview(self.buffer))
+                self.buffered = 0
+
+    def _drop(self):
+        os.fdatasync(self.fd)
+        os.posix_fadvise(
+            self.fd, self.synced, self.written - self.synced, os.POSIX_FADV_DONTNEED
+        )
+        self.synced = self.written
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self.mode == INGEST_DIRECT and self.buffered:
+                # O_DIRECT only writes whole blocks, pad and truncate afterwards.
+                padded = -(-self.buffered // ALIGNMENT) * ALIGNMENT
+                self.buffer[self.buffered : padded] = bytes(padded - self.buffered)
+                self._write_all(memoryview(self.buffer)[:padded])
+                self.buffered = 0
+            if os.fstat(self.fd).st_size != self.written:
+                os.ftruncate(self.fd, self.written)
+            if self.fsync:
+                os.fsync(self.fd)
+                if self.mode == INGEST_DONTNEED:
+                    self._drop()
+        finally:
+            os.close(self.fd)
+            self.fd = None
+            if self.buffer is not None:
+                self.buffer.close()
+
+
+class SpoolFile(tempfile.SpooledTemporaryFile):
+    """Upload spool that rolls over to a named file in the spool folder.
+
+    Starlette writes every upload through this class, so the sha256 of the
+    archive is known once the request body is read, and the file on disk
+    can be linked into ``UPLOAD_DIR`` instead of copied.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("dir", get_spool_folder())
+        super().__init__(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        # perf_counter times of the spool, for the trace of the task.
+        self.started = self.finished = time.perf_counter()
+        self.hash_seconds = 0.0
+
+    def write(self, s):
+        start = time.perf_counter()
+        self.sha256.update(s)
+        self.finished = time.perf_counter()
+        self.hash_seconds += self.finished - start
+        return super().write(s)
+
+    def rollover(self):
+        if self._rolled:
+            return
+        file = self._file
+        newfile = self._file = tempfile.NamedTemporaryFile(**self._TemporaryFileArgs)
+        del self._TemporaryFileArgs
+        pos = file.tell()
+        newfile.write(file.getvalue())
+        newfile.seek(pos, 0)
+        self._rolled = True
+
+    @property
+    def digest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+def install_spool_file():
+    # Starlette has no hook for the multipart spool, replace its class.
+    formparsers.SpooledTemporaryFile = SpoolFile
+
+
+def upload_digest(source) -> str:
+    # Free for spooled uploads, one extra read pass otherwise.
+    if isinstance(source, SpoolFile):
+        return source.digest
+    sha256 = hashlib.sha256()
+    source.seek(0)
+    while chunk := source.read(MIN_CHUNK_SIZE):
+        sha256.update(chunk)
+    source.seek(0)
+    return sha256.hexdigest()
+
+
+def links_into_place(source, folder) -> bool:
+    # Whether a spooled upload is on disk, on the filesystem of ``folder``.
+    if not isinstance(source, SpoolFile) or not source._rolled:
+        return False
+    try:
+        return os.stat(source.name).st_dev == os.stat(folder).st_dev
+    except OSError:
+        return False
+
+
+def link_into_place(source, target) -> bool:
+    """Give a spooled upload its final name without copying it.
+
+    Returns False when the caller has to copy: the upload is still in
+    memory, or the spool folder is on another filesystem.
+    """
+    target = str(target)
+    if not links_into_place(source, os.path.dirname(target)):
+        return False
+    link_path = f"{target}.link"
+    try:
+        source.flush()
+        if os.path.exists(link_path):
+            os.remove(link_path)
+        os.link(source.name, link_path)
+        os.replace(link_path, target)
+        return True
+    except OSError as e:
+        IO_LOG.debug(f"Link '{target}' into place failed, copy it. Details : {e}")
+        return False
+
+
+class PipelinedCopier:
+    """Copies a file object into an ``IngestWriter`` through three stages.
+
+    A reader thread fills buffers of a bounded ring, a hasher and a writer
+    thread consume each buffer in parallel, and the buffer goes back to the
+    ring once both are done with it. The chunk size doubles while it keeps
+    improving the writer throughput, up to ``max_chunk``.
+    """
+
+    def __init__(
+        self,
+        source,
+        writer: IngestWriter,
+        queue_depth: Optional[int] = None,
+        min_chunk: int = MIN_CHUNK_SIZE,
+        max_chunk: Optional[int] = None,
+    ):
+        self.source = source
+        self.writer = writer
+        self.min_chunk = min_chunk
+        self.max_chunk = max(max_chunk or get_ingest_max_chunk(), min_chunk)
+        self.chunk_size = min_chunk
+        self.processed = 0
+        self.error: Optional[BaseException] = None
+        self.sha256 = hashlib.sha256()
+        self.cancelled = threading.Event()
+        # Time each stage spent on its own work, not waiting on the others.
+        self.busy = {"read": 0.0, "hash": 0.0, "write": 0.0}
+        self.started: Optional[float] = None
+
+        depth = queue_depth or get_ingest_queue_depth()
+        self.free = queue.Queue()
+        for _ in range(depth):
+            self.free.put(_Slot(self.max_chunk))
+        self.to_write = queue.Queue()
+        self.to_hash = queue.Queue()
+        self.threads = [
+            threading.Thread(target=self._guard, args=(stage,), daemon=True)
+            for stage in (self._read, self._hash, self._write)
+        ]
+
+    @property
+    def done(self) -> bool:
+        return not any(thread.is_alive() for thread in self.threads)
+
+    @property
+    def digest(self) -> str:
+        return self.sha256.hexdigest()
+
+    def start(self):
+        self.started = time.perf_counter()
+        for thread in self.threads:
+            thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        self.start()
+        self.join()
+
+    def _guard(self, stage):
+        try:
+            stage()
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            self.cancelled.set()
+            # Unblock the other stages.
+            self.to_write.put(None)
+            self.to_hash.put(None)
+            self.free.put(None)
+
+    def _readinto(self):
+        readinto = getattr(self.source, "readinto", None)
+        if readinto is None and hasattr(self.source, "_file"):
+            readinto = getattr(self.source._file, "readinto", None)
+        if readinto is not None:
+            return readinto
+
+        def read_copy(view: memoryview) -> int:
+            data = self.source.read(len(view))
+            view[: len(data)] = data
+            return len(data)
+
+        return read_copy
+
+    def _read(self):
+        readinto = self._readinto()
+        while not self.cancelled.is_set():
+            slot = self.free.get()
+            if slot is None or self.cancelled.is_set():
+                break
+            start = time.perf_counter()
+            size = readinto(memoryview(slot.buffer)[: self.chunk_size])
+            self.busy["read"] += time.perf_counter() - start
+            if not size:
+                break
+            slot.size = size
+            slot.pending = 2
+            self.to_hash.put(slot)
+            self.to_write.put(slot)
+        self.to_hash.put(None)
+        self.to_write.put(None)
+
+    def _release(self, slot: "_Slot"):
+        with slot.lock:
+            slot.pending -= 1
+            if slot.pending == 0:
+                self.free.put(slot)
+
+    def _hash(self):
+        while True:
+            slot = self.to_hash.get()
+            if slot is None:
+                break
+            start = time.perf_counter()
+            self.sha256.update(memoryview(slot.buffer)[: slot.size])
+            self.busy["hash"] += time.perf_counter() - start
+            self._release(slot)
+
+    def _write(self):
+        window_start = time.perf_counter()
+        window_bytes = 0
+        last_rate = 0.0
+        while True:
+            slot = self.to_write.get()
+            if slot is None:
+                break
+            start = time.perf_counter()
+            self.writer.write(memoryview(slot.buffer)[: slot.size])
+            self.busy["write"] += time.perf_counter() - start
+            self.processed += slot.size
+            window_bytes += slot.size
+            self._release(slot)
+
+            if window_bytes >= ADAPT_WINDOW_CHUNKS * self.chunk_size:
+                now = time.perf_counter()
+                rate = window_bytes / max(now - window_start, 1e-6)
+                self._adapt(rate, last_rate)
+                last_rate = rate
+                window_start = now
+                window_bytes = 0
+
+    def _adapt(self, rate: float, last_rate: float):
+        # Grow while larger chunks do not cost throughput, shrink when they do.
+        if rate >= last_rate * 0.95 and self.chunk_size < self.max_chunk:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk)
+        elif rate < last_rate * 0.8 and self.chunk_size > self.min_chunk:
+            self.chunk_size = max(self.chunk_size // 2, self.min_chunk)
+
+
+class _Slot:
+    def __init__(self, size: int):
+        self.buffer = bytearray(size)
+        self.size = 0
+        self.pending = 0
+        self.lock = threading.Lock()
@@ -0,0 +1,186 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from tools.connect import get_instance_timeout, get_state_folder
+from utils import config_logger, get_uuid
+
+from .state_backend import ClosingConnection
+
+JOURNAL_LOG = config_logger(
+    file_name="journal.log",
+    write_mode="a",
+    level="info",
+    logger_name="ingest_journal_logger",
+)
+
+JOURNAL_SAVE = "save"
+JOURNAL_EXTRACT = "extract"
+JOURNAL_CREATE = "create"
+
+
+class IngestJournal:
+    """Write-ahead journal of the ingests in flight.
+
+    Every stage of an upload or deploy is recorded before it touches the
+    models folder, together with how far it got. The instance running it
+    keeps a heartbeat, and the ingests of an instance whose heartbeat
+    stopped are handed over to a live one to be resumed or cleaned up.
+    Like the registry, it is always a SQLite file on the models volume.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.instance = get_uuid()
+        self.thread: Optional[threading.Thread] = None
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ingest (
+                    uuid TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    model_name_on_ollama TEXT,
+                    stage TEXT NOT NULL,
+                    bytes_written INTEGER NOT NULL DEFAULT 0,
+                    members_done INTEGER NOT NULL DEFAULT 0,
+                    instance TEXT NOT NULL,
+                    created REAL,
+                    updated REAL,
+                    callback_url TEXT
+                );
+                CREATE TABLE IF NOT EXISTS instance (
+                    instance TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    heartbeat REAL
+                );
+                """)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(ingest)")]
+            if "callback_url" not in columns:  # Journals of earlier versions.
+                conn.execute("ALTER TABLE ingest ADD COLUMN callback_url TEXT")
+        self.heartbeat()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return ClosingConnection(conn)
+
+    # Ingests
+    def begin(
+        self,
+        uuid: str,
+        filename: str,
+        model_name_on_ollama: Optional[str],
+        callback_url: Optional[str] = None,
+    ):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest (uuid, filename, model_name_on_ollama, "
+                "stage, instance, created, updated, callback_url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    uuid,
+                    filename,
+                    model_name_on_ollama,
+                    JOURNAL_SAVE,
+                    self.instance,
+                    now,
+                    now,
+                    callback_url,
+                ),
+            )
+
+    def update(
+        self,
+        uuid: str,
+        stage: Optional[str] = None,
+        bytes_written: Optional[int] = None,
+        members_done: Optional[int] = None,
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest SET stage = COALESCE(?, stage), "
+                "bytes_written = COALESCE(?, bytes_written), "
+                "members_done = COALESCE(?, members_done), updated = ? "
+                "WHERE uuid = ?",
+                (stage, bytes_written, members_done, time.time(), uuid),
+            )
+
+    def get(self, uuid: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM ingest WHERE uuid = ?", (uuid,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def finish(self, uuid: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ingest WHERE uuid = ?", (uuid,))
+
+    # Instances
+    def heartbeat(self):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO instance VALUES (?, ?, ?)",
+                (self.instance, os.getpid(), time.time()),
+            )
+
+    def claim_orphans(self) -> List[Dict]:
+        # Take over the ingests of instances that stopped heartbeating.
+        expire = time.time() - get_instance_timeout()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT ingest.* FROM ingest LEFT JOIN instance "
+                "ON ingest.instance = instance.instance "
+                "WHERE instance.heartbeat IS NULL OR instance.heartbeat < ?",
+                (expire,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE ingest SET instance = ?, updated = ? WHERE uuid = ?",
+                [(self.instance, time.time(), row["uuid"]) for row in rows],
+            )
+            conn.execute("DELETE FROM instance WHERE heartbeat < ?", (expire,))
+            conn.execute("COMMIT")
+        return [dict(row) for row in rows]
+
+    def start(self, on_orphans: Callable[[List[Dict]], None]):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self._loop, args=(on_orphans,), name="ingest_journal", daemon=True
+        )
+        self.thread.start()
+
+    def _loop(self, on_orphans: Callable[[List[Dict]], None]):
+        # Orphans are looked for on every beat: after a quick restart, the
+        # previous instance only expires once its last heartbeat is old enough.
+        while True:
+            try:
+                self.heartbeat()
+                orphans = self.claim_orphans()
+                if orphans:
+                    JOURNAL_LOG.warning(
+                        f"Recover {len(orphans)} interrupted ingests: "
+                        f"{[orphan['filename'] for orphan in orphans]}"
+                    )
+                    on_orphans(orphans)
+            except Exception as e:
+                JOURNAL_LOG.error(f"Ingest journal heartbeat failed. Details : {e}")
+            time.sleep(get_instance_timeout() / 3)
+
+
+_INGEST_JOURNAL: Optional[IngestJournal] = None
+_INGEST_JOURNAL_LOCK = threading.Lock()
+
+
+def get_ingest_journal() -> IngestJournal:
+    global _INGEST_JOURNAL
+    with _INGEST_JOURNAL_LOCK:
+        if _INGEST_JOURNAL is None:
+            _INGEST_JOURNAL = IngestJournal(
+                os.path.join(get_state_folder(), "journal.db")
+            )
+        return _INGEST_JOURNAL
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from tools.connect import get_inventory_ttl, get_models_folder
+from utils import config_logger
+
+from .metrics import INVENTORY_READS, INVENTORY_REFRESHES
+from .model_registry import get_model_registry
+from .model_servers import MODEL_SERVERS, ModelServer
+from .ollama_client import OllamaClient, ollama_name
+
+INVENTORY_LOG = config_logger(
+    file_name="inventory.log",
+    write_mode="a",
+    level="info",
+    logger_name="inventory_logger",
+)
+
+# Refreshed ahead once this share of the TTL is left, checked as often.
+REFRESH_AHEAD = 0.25
+# Background refreshes stop when nobody read the inventory for this many TTLs.
+IDLE_TTLS = 10
+
+
+def folder_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except FileNotFoundError:
+                pass  # Removed while walking.
+    return size
+
+
+def scan_folders(root_path: str) -> Dict[str, int]:
+    # Model folder -> bytes, hidden folders are the handler's own.
+    with os.scandir(root_path) as entries:
+        return {
+            entry.name: folder_size(entry.path)
+            for entry in entries
+            if entry.is_dir() and not entry.name.startswith(".")
+        }
+
+
+class ModelInventory:
+    """Folders of ``UPLOAD_DIR`` joined with the Ollama models created from them.
+
+    The join reads the folders, ``api/tags`` and ``api/ps`` of every model
+    server, and is served
+    from memory for ``INVENTORY_TTL`` seconds. Reads from every task loop go
+    through one event loop on a thread of its own, where a read of an expired
+    inventory waits for the refresh already running instead of starting
+    another: any number of pollers cost one refresh per TTL. While it is
+    polled, the inventory is refreshed in the background before it expires.
+    Tasks that change the models expire it in this worker.
+    """
+
+    def __init__(self):
+        self.thread: Optional[threading.Thread] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.started = threading.Event()
+        self.lock = threading.Lock()
+        self.snapshot: Optional[Dict] = None
+        self.refreshed: Optional[float] = None
+        self.read = 0.0
+        self.generation = 0
+        self.refreshing: Optional[asyncio.Task] = None
+        self.refreshing_generation = 0
+        # Last answer of each model server, kept when it does not answer.
+        self.ollama: Dict[str, Tuple[Dict, Dict]] = {}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=lambda: asyncio.run(self._loop()),
+                    name="inventory",
+                    daemon=True,
+                )
+                self.thread.start()
+        self.started.wait()
+
+    async def get(self) -> Dict:
+        # Callable from any event loop.
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._get(), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def invalidate(self):
+        # A refresh running meanwhile may predate the change, it is not kept fresh.
+        self.generation += 1
+        self.refreshed = None
+
+    def _age(self, now: float) -> float:
+        return float("inf") if self.refreshed is None else now - self.refreshed
+
+    async def _loop(self):
+        self.loop = asyncio.get_running_loop()
+        self.started.set()
+        while True:
+            ttl = get_inventory_ttl()
+            await asyncio.sleep(ttl * REFRESH_AHEAD)
+            now = time.monotonic()
+            if now - self.read > ttl * IDLE_TTLS:
+                continue
+            if self._age(now) >= ttl * (1 - REFRESH_AHEAD):
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    INVENTORY_LOG.error(f"Refresh inventory failed. Details : {e!r}")
+
+    async def _get(self) -> Dict:
+        self.read = time.monotonic()
+        if self.snapshot is not None and self._age(self.read) < get_inventory_ttl():
+            INVENTORY_READS.inc(source="cache")
+            return self.snapshot
+        INVENTORY_READS.inc(source="refresh")
+        await self._refresh()
+        return self.snapshot
+
+    async def _refresh(self):
+        # Joins the running refresh, unless the models changed since it started.
+        if self.refreshing is None or self.refreshing_generation != self.generation:
+            self.refreshing_generation = self.generation
+            self.refreshing = asyncio.create_task(self._build())
+            self.refreshing.add_done_callback(self._refreshed)
+        # A reader that goes away does not cancel the refresh of the others.
+        await asyncio.shield(self.refreshing)
+
+    def _refreshed(self, task: asyncio.Task):
+        if self.refreshing is task:
+            self.refreshing = None
+
+    async def _build(self):
+        generation = self.generation
+        folders = await asyncio.to_thread(scan_folders, get_models_folder())
+        links = await asyncio.to_thread(get_model_registry().all_links)
+        servers = MODEL_SERVERS.all()
+        errors = await asyncio.gather(
+            *(self._fetch_ollama(server) for server in servers)
+        )
+        error = "; ".join(
+            f"{server.name}: {server_error}"
+            for server, server_error in zip(servers, errors)
+            if server_error is not None
+        )
+        error = error or None
+        INVENTORY_REFRESHES.inc(result="error" if error else "ok")
+        if error is not None:
+            INVENTORY_LOG.warning(
+                f"Model server not reachable, keep its last models. Details : {error}"
+            )
+
+        models = {}
+        for folder, size in sorted(folders.items()):
+            ollama_models = []
+            for name in links.get(folder, []):
+                for server in servers:
+                    tags, loaded = self.ollama.get(server.name, ({}, {}))
+                    tag = tags.get(ollama_name(name))
+                    if tag is None:
+                        continue  # Removed on the model server side.
+                    running = loaded.get(ollama_name(name))
+                    ollama_models.append(
+                        {
+                            "name": name,
+                            "model_server": server.name,
+                            "size": tag.get("size"),
+                            "digest": tag.get("digest"),
+                            "modified_at": tag.get("modified_at"),
+                            "loaded": running is not None,
+                            "expires_at": running and running.get("expires_at"),
+                        }
+                    )
+            models[folder] = {
+                "model": folder,
+                "size": size,
+                "ollama_models": ollama_models,
+                "loaded": any(model["loaded"] for model in ollama_models),
+            }
+        in_use = [folder for folder, details in models.items() if details["loaded"]]
+        if in_use and error is None:
+            # Loaded on Ollama is a use, which the eviction of old models ranks on.
+            await asyncio.to_thread(get_model_registry().touch, *in_use)
+        self.snapshot = {"refreshed": time.time(), "error": error, "models": models}
+        if generation == self.generation:
+            self.refreshed = time.monotonic()
+
+    async def _fetch_ollama(self, server: ModelServer) -> Optional[str]:
+        # Keeps the models of the server, returns why it did not answer.
+        try:
+            async with OllamaClient(follow_redirects=True) as client:
+                tags, ps = await asyncio.gather(
+                    client.get(server.url + "api/tags"),
+                    client.get(server.url + "api/ps"),
+                )
+            tags.raise_for_status()
+            ps.raise_for_status()
+        except Exception as e:
+            return repr(e)
+        self.ollama[server.name] = (
+            {
+                ollama_name(model["name"]): model
+                for model in tags.json().get("models") or []
+            },
+            {
+                ollama_name(model["name"]): model
+                for model in ps.json().get("models") or []
+            },
+        )
+        return None
+
+
+INVENTORY = ModelInventory()
@@ -0,0 +1,317 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+THROUGHPUT_BUCKETS = tuple(2**power * 1024 * 1024 for power in range(0, 13))
+
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+
+class _Shards:
+    """Per thread storage of a metric, merged when it is scraped.
+
+    A thread only ever writes its own shard, so recording takes no lock:
+    the lock is taken once per thread to register the shard, and by scrapes.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards: List[Dict] = []
+
+    def get(self) -> Dict:
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def snapshot(self) -> List[Dict]:
+        with self.lock:
+            shards = list(self.shards)
+        return [shard.copy() for shard in shards]
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterable[Tuple[str, Dict, float]]:
+        """Yield the ``(name suffix, labels, value)`` of every sample."""
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.shards = _Shards()
+
+    def inc(self, value: float = 1, **labels):
+        shard = self.shards.get()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def totals(self) -> Dict[Tuple, float]:
+        totals = {}
+        for shard in self.shards.snapshot():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def samples(self):
+        for key, value in sorted(self.totals().items()):
+            yield "", dict(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.shards = _Shards()
+
+    def observe(self, value: float, **labels):
+        shard = self.shards.get()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # Bucket counts (the last one is +Inf), sum, count.
+            state = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        totals = {}
+        for shard in self.shards.snapshot():
+            for key, (counts, total, count) in shard.items():
+                merged = totals.setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for key, (counts, total, count) in sorted(totals.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                yield "_bucket", {**labels, "le": _format(bound)}, cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class Gauge(Metric):
+    """Value read when scraped, from the state that already tracks it."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Iterable[Tuple[Tuple, float]]]] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self):
+        for key, value in self.collect():
+            yield "", dict(zip(self.labels, key)), value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Iterable[Tuple[Tuple, float]]]] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4.
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} collect failed: {_escape(str(e))}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in samples:
+                if labels:
+                    text = ",".join(
+                        f'{label}="{_escape(str(label_value))}"'
+                        for label, label_value in labels.items()
+                    )
+                    lines.append(f"{metric.name}{suffix}{{{text}}} {_format(value)}")
+                else:
+                    lines.append(f"{metric.name}{suffix} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+TASKS_STARTED = REGISTRY.counter(
+    "model_handler_tasks_started_total", "Tasks started by action.", ("action",)
+)
+TASKS_FINISHED = REGISTRY.counter(
+    "model_handler_tasks_finished_total",
+    "Tasks finished by action and status.",
+    ("action", "status"),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "model_handler_stage_seconds",
+    "Duration of the save, extract, validate, create and delete stages.",
+    ("stage",),
+)
+STAGE_RESULTS = REGISTRY.counter(
+    "model_handler_stage_total",
+    "Stages finished by result: success, failed or cancelled.",
+    ("stage", "result"),
+)
+STAGE_WAIT_SECONDS = REGISTRY.histogram(
+    "model_handler_stage_wait_seconds",
+    "Time waited for a slot of the stage concurrency limit.",
+    ("stage",),
+)
+INGESTED_BYTES = REGISTRY.counter(
+    "model_handler_ingested_bytes_total", "Bytes of uploads saved to the models volume."
+)
+INGEST_THROUGHPUT = REGISTRY.histogram(
+    "model_handler_ingest_throughput_bytes_per_second",
+    "Save throughput of each upload.",
+    buckets=THROUGHPUT_BUCKETS,
+)
+MODEL_LOCKS = REGISTRY.counter(
+    "model_handler_model_lock_acquire_total",
+    "Model lock acquisitions by result: acquired or busy.",
+    ("result",),
+)
+OLLAMA_SECONDS = REGISTRY.histogram(
+    "model_handler_ollama_request_seconds",
+    "Latency to the response headers of the model server requests.",
+    ("endpoint",),
+)
+OLLAMA_REQUESTS = REGISTRY.counter(
+    "model_handler_ollama_requests_total",
+    "Model server requests by endpoint and status code, 'error' when no response came.",
+    ("endpoint", "code"),
+)
+INVENTORY_READS = REGISTRY.counter(
+    "model_handler_inventory_reads_total",
+    "Merged model list reads by source: cache, or the refresh they waited for.",
+    ("source",),
+)
+INVENTORY_REFRESHES = REGISTRY.counter(
+    "model_handler_inventory_refreshes_total",
+    "Refreshes of the merged model list by result: ok or error.",
+    ("result",),
+)
+EVICTED_MODELS = REGISTRY.counter(
+    "model_handler_evicted_models_total",
+    "Model folders deleted to make room for a deploy.",
+)
+EVICTED_BYTES = REGISTRY.counter(
+    "model_handler_evicted_bytes_total",
+    "Bytes of the model folders deleted to make room for a deploy.",
+)
+EXPORTS = REGISTRY.counter(
+    "model_handler_exports_total",
+    "Model export responses by kind, file or archive, and status code.",
+    ("kind", "code"),
+)
+EXPORTED_BYTES = REGISTRY.counter(
+    "model_handler_exported_bytes_total", "Bytes of model files sent by exports."
+)
+REPLICATED_BYTES = REGISTRY.counter(
+    "model_handler_replicated_bytes_total",
+    "Bytes of synced model files by source: peer, or local for files copied from another folder.",
+    ("source",),
+)
+MODEL_SERVER_CREATES = REGISTRY.counter(
+    "model_handler_model_server_creates_total",
+    "Model creates by model server and result.",
+    ("server", "result"),
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "model_handler_event_loop_lag_seconds",
+    "Delay of the main event loop in running a scheduled callback.",
+    buckets=LAG_BUCKETS,
+)
+
+
+def _active_tasks():
+    finished = {}
+    for (action, _), value in TASKS_FINISHED.totals().items():
+        finished[action] = finished.get(action, 0) + value
+    for (action,), value in TASKS_STARTED.totals().items():
+        yield (action,), value - finished.get(action, 0)
+
+
+REGISTRY.gauge(
+    "model_handler_tasks_active", "Tasks running by action.", ("action",), _active_tasks
+)
+
+
+async def watch_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    # A blocked loop wakes this sleep up late, by the time it was blocked.
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0))
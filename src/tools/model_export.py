@@ -0,0 +1,372 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import BinaryIO, Dict, List, Mapping, Optional, Tuple, Union
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from tools.connect import get_models_folder
+from utils import config_logger
+
+from .metrics import EXPORTED_BYTES, EXPORTS
+from .model_registry import get_model_registry
+
+EXPORT_LOG = config_logger(
+    file_name="export.log",
+    write_mode="a",
+    level="info",
+    logger_name="export_logger",
+)
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Stored zip64 members, so the archive layout is known before any byte is
+# read: every offset comes from the file sizes, the CRCs from the digests.
+ZIP_VERSION = 45
+ZIP_UTF8 = 0x0800
+ZIP_DOS_DATE = 0x0021  # 1980-01-01, fixed so the bytes only follow the content.
+ZIP_MAX32 = 0xFFFFFFFF
+ZIP_MAX16 = 0xFFFF
+
+# A piece of a response: bytes, or (file, offset, length).
+Segment = Union[bytes, Tuple[BinaryIO, int, int]]
+
+
+class ExportNotFound(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def hash_file(file: BinaryIO) -> Tuple[str, int]:
+    # sha256 and CRC32 in one pass, read with pread so the offset is untouched.
+    sha256, crc32, offset = hashlib.sha256(), 0, 0
+    fd = file.fileno()
+    while chunk := os.pread(fd, READ_CHUNK_SIZE, offset):
+        sha256.update(chunk)
+        crc32 = zlib.crc32(chunk, crc32)
+        offset += len(chunk)
+    return sha256.hexdigest(), crc32
+
+
+class FileDigests:
+    """Digests of model files, kept in the registry next to the file's stat.
+
+    A file is hashed once after it changed, the first export pays for it.
+    Exports of the same file waiting meanwhile share that hash.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running: Dict[Tuple, concurrent.futures.Future] = {}
+
+    def get(self, model: str, name: str, file: BinaryIO) -> Tuple[str, int]:
+        stat = os.fstat(file.fileno())
+        registry = get_model_registry()
+        cached = registry.file_digest(model, name, stat)
+        if cached:
+            return cached
+        key = (model, name, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            future = self.running.get(key)
+            owner = future is None
+            if owner:
+                future = self.running[key] = concurrent.futures.Future()
+        if not owner:
+            return future.result()
+        try:
+            digest = hash_file(file)
+            registry.record_file_digest(model, name, stat, *digest)
+            EXPORT_LOG.info(f"Hash '{model}/{name}' : sha256 {digest[0]}.")
+            future.set_result(digest)
+            return digest
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.running[key]
+
+
+FILE_DIGESTS = FileDigests()
+
+
+class ModelExport:
+    """Open files of a model folder, as one file or as a stored zip.
+
+    The files are opened up front: a folder deleted or deployed again while
+    it is sent keeps serving the content its ``ETag`` was computed from.
+    """
+
+    def __init__(self, model: str):
+        root_path = os.path.realpath(get_models_folder())
+        self.model = model
+        self.folder = os.path.realpath(os.path.join(root_path, model))
+        if (
+            model.startswith(".")
+            or os.path.dirname(self.folder) != root_path
+            or not os.path.isdir(self.folder)
+        ):
+            raise ExportNotFound(f"Model '{model}' not found.")
+        self.files: Dict[str, BinaryIO] = {}
+
+    def names(self) -> List[str]:
+        names = []
+        for root, dirs, files in os.walk(self.folder):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                names.append(os.path.relpath(path, self.folder).replace(os.sep, "/"))
+        return names
+
+    def open(self, name: str) -> BinaryIO:
+        if name not in self.files:
+            path = os.path.realpath(os.path.join(self.folder, name))
+            if os.path.commonpath([path, self.folder]) != self.folder or not (
+                os.path.isfile(path)
+            ):
+                raise ExportNotFound(f"File '{name}' not found in '{self.model}'.")
+            file = open(path, "rb")
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            self.files[name] = file
+        return self.files[name]
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def digest(self, name: str) -> Tuple[str, int]:
+        return FILE_DIGESTS.get(self.model, name, self.open(name))
+
+    def size(self, name: str) -> int:
+        return os.fstat(self.open(name).fileno()).st_size
+
+    def file(self, name: str) -> Tuple[List[Segment], str]:
+        # Segments and ETag of one file.
+        sha256, _ = self.digest(name)
+        return [(self.open(name), 0, self.size(name))], f'"{sha256}"'
+
+    def archive(self) -> Tuple[List[Segment], str]:
+        # Segments and ETag of a zip of the whole folder.
+        members = []
+        for name in self.names():
+            sha256, crc32 = self.digest(name)
+            members.append((name, self.size(name), sha256, crc32))
+        etag = hashlib.sha256()
+        for name, size, sha256, _ in members:
+            etag.update(f"{name}\0{size}\0{sha256}\n".encode())
+        segments, central, offset = [], [], 0
+        for name, size, _, crc32 in members:
+            encoded = name.encode()
+            header = struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                ZIP_VERSION,
+                ZIP_UTF8,
+                0,
+                0,
+                ZIP_DOS_DATE,
+                crc32,
+                ZIP_MAX32,
+                ZIP_MAX32,
+                len(encoded),
+                20,
+            )
+            extra = struct.pack("<HHQQ", 0x0001, 16, size, size)
+            segments += [header + encoded + extra, (self.open(name), 0, size)]
+            central.append(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014B50,
+                    ZIP_VERSION,
+                    ZIP_VERSION,
+                    ZIP_UTF8,
+                    0,
+                    0,
+                    ZIP_DOS_DATE,
+                    crc32,
+                    ZIP_MAX32,
+                    ZIP_MAX32,
+                    len(encoded),
+                    28,
+                    0,
+                    0,
+                    0,
+                    0o100644 << 16,
+                    ZIP_MAX32,
+                )
+                + encoded
+                + struct.pack("<HHQQQ", 0x0001, 24, size, size, offset)
+            )
+            offset += len(header) + len(encoded) + len(extra) + size
+        central = b"".join(central)
+        end = struct.pack(
+            "<IQHHIIQQQQ",
+            0x06064B50,
+            44,
+            ZIP_VERSION,
+            ZIP_VERSION,
+            0,
+            0,
+            len(members),
+            len(members),
+            len(central),
+            offset,
+        )
+        end += struct.pack("<IIQI", 0x07064B50, 0, offset + len(central), 1)
+        end += struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, ZIP_MAX16, ZIP_MAX16, ZIP_MAX32, ZIP_MAX32, 0
+        )
+        segments.append(central + end)
+        return segments, f'"{etag.hexdigest()}"'
+
+
+def segments_size(segments: List[Segment]) -> int:
+    return sum(
+        len(segment) if isinstance(segment, bytes) else segment[2]
+        for segment in segments
+    )
+
+
+def slice_segments(segments: List[Segment], start: int, end: int) -> List[Segment]:
+    # The bytes start..end (inclusive) of the segments.
+    sliced, position = [], 0
+    for segment in segments:
+        length = len(segment) if isinstance(segment, bytes) else segment[2]
+        first, last = max(start, position), min(end + 1, position + length)
+        if first < last:
+            if isinstance(segment, bytes):
+                sliced.append(segment[first - position : last - position])
+            else:
+                file, offset, _ = segment
+                sliced.append((file, offset + first - position, last - first))
+        position += length
+    return sliced
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # A single "bytes=" range, None to send the whole content. Several
+    # ranges are answered in full, which a client may always be given.
+    if not header or "," in header:
+        return None
+    match = RANGE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    # Strong comparison, a weak validator never matches.
+    if not header:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in header.split(","))
+
+
+class SegmentsResponse(Response):
+    """ASGI response of byte segments with Range, If-Range and If-None-Match.
+
+    File segments are read with ``pread`` off the event loop, uvicorn has
+    no way for an ASGI app to ``sendfile`` to its socket.
+    """
+
+    def __init__(
+        self,
+        segments: List[Segment],
+        etag: str,
+        kind: str,
+        media_type: str,
+        filename: str,
+        request_headers: Mapping[str, str],
+        on_close=None,
+    ):
+        self.segments = segments
+        self.kind = kind
+        self.on_close = on_close
+        self.background = None
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "content-type": media_type,
+            "content-disposition": f'attachment; filename="{filename}"',
+        }
+        size = segments_size(segments)
+        self.status_code = 200
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            self.status_code, self.segments = 304, []
+        elif request_headers.get("if-range") in (None, etag):
+            # A stale If-Range asks for the whole new content instead.
+            try:
+                byte_range = parse_range(request_headers.get("range"), size)
+            except RangeNotSatisfiable as e:
+                byte_range = None
+                self.status_code, self.segments = 416, []
+                headers["content-range"] = str(e)
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.segments = slice_segments(segments, start, end)
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+        if self.status_code != 304:
+            headers["content-length"] = str(segments_size(self.segments))
+        self.raw_headers = [
+            (key.encode(), value.encode()) for key, value in headers.items()
+        ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        EXPORTS.inc(kind=self.kind, code=str(self.status_code))
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            if scope["method"] == "HEAD":
+                self.segments = []
+            for segment in self.segments:
+                if isinstance(segment, bytes):
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": segment,
+                            "more_body": True,
+                        }
+                    )
+                else:
+                    await self.send_pread(send, *segment)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    async def send_pread(self, send: Send, file: BinaryIO, offset: int, length: int):
+        end = offset + length
+        while offset < end:
+            chunk = await asyncio.to_thread(
+                os.pread, file.fileno(), min(READ_CHUNK_SIZE, end - offset), offset
+            )
+            if not chunk:
+                raise EOFError(f"{file.name} ended at {offset} of {end} bytes.")
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            EXPORTED_BYTES.inc(len(chunk))
+            offset += len(chunk)
@@ -1,19 +1,104 @@
 import asyncio
 import json
 import os
-import shutil
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from string import Template
+from typing import Callable, Dict, List, Optional, Tuple
 
 import httpx
 from fastapi import UploadFile
 
 from schema.main import ResponseFormat, ResponseMessage
-from tools.connect import get_model_server_url, get_models_folder
-from utils import ResponseErrorHandler, config_logger, get_uuid
+from tools.connect import (
+    get_models_folder,
+    get_trash_folder,
+    get_zip_retention,
+)
+from utils import ResponseErrorHandler, close_logger, config_logger, get_uuid
 
+from .ingest_io import (
+    IngestWriter,
+    PipelinedCopier,
+    SpoolFile,
+    link_into_place,
+    upload_digest,
+)
+from .ingest_journal import (
+    JOURNAL_CREATE,
+    JOURNAL_EXTRACT,
+    JOURNAL_SAVE,
+    get_ingest_journal,
+)
+from .metrics import (
+    INGEST_THROUGHPUT,
+    INGESTED_BYTES,
+    MODEL_SERVER_CREATES,
+    STAGE_RESULTS,
+    STAGE_SECONDS,
+    TASKS_FINISHED,
+    TASKS_STARTED,
+)
+from .inventory import INVENTORY
+from .model_registry import get_model_registry
+from .model_servers import (
+    MODEL_SERVERS,
+    ModelServer,
+    ModelServerError,
+    ModelServerUnavailable,
+)
+from .ollama_client import OllamaClient, load_model, ollama_name
+from .profiler import PROFILER
+from .replication import FolderDownload, seed_target, split_targets
+from .stage_limiter import (
+    STAGE_CREATE,
+    STAGE_DELETE,
+    STAGE_EXTRACT,
+    STAGE_LIMITER,
+    STAGE_SAVE,
+    STAGE_SYNC,
+    STAGE_VALIDATE,
+    STAGE_WARMUP,
+)
+from .state_backend import (
+    TASK_CANCELLED,
+    TASK_FAILED,
+    TASK_SUCCESS,
+    ModelStatus,
+    get_state_backend,
+)
+from .storage_gc import STORAGE_GC
+from .task_lanes import LANE_BULK, get_lane
+from .task_trace import TaskTrace
+from .webhooks import get_webhook_outbox
 from .zip_handler import ZipOperator
 
-MODEL_STATUS = {}
+MODEL_STATUS = ModelStatus()
+PROGRESS_INTERVAL = 0.1
+MESSAGE_POLL_INTERVAL = 0.02
+CANCEL_POLL_INTERVAL = 0.5
+JOURNAL_INTERVAL = 1
+
+
+class TaskCancelled(Exception):
+    """Raised at a checkpoint of a task whose cancel was requested."""
+
+
+@contextmanager
+def timed_stage(stage: str):
+    # Duration and outcome of a stage, for /metrics.
+    start = time.perf_counter()
+    result = "failed"
+    try:
+        yield
+        result = "success"
+    except TaskCancelled:
+        result = "cancelled"
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        STAGE_RESULTS.inc(stage=stage, result=result)
 
 
 class CustomError(Exception):
@@ -23,26 +108,221 @@ class CustomError(Exception):
 
 
 class ModelOperator:
-    def __init__(self):
-        self.uuid = get_uuid()
+    def __init__(self, uuid: Optional[str] = None):
+        # A recovered ingest keeps the uuid of the task it resumes.
+        self.uuid = uuid or get_uuid()
         # manager.create_room(self.uuid)
         self.root_path = get_models_folder()
         self.message = asyncio.Queue()
         self.alive = True
         self.error_flag = False
         self.model_status = MODEL_STATUS
+        self.state = get_state_backend()
+        self.last_progress = None
+        self.digest = None
+        self.cancel_event = threading.Event()
+        self.cancel_on_disconnect = False
+        # With a callback, nobody streams the messages and the result is posted.
+        self.callback_url: Optional[str] = None
+        self.streamed = True
+        self.last_message = None
+        # Set to a keep_alive, the created model is loaded before the task ends.
+        self.keep_alive: Optional[str] = None
+        self.parent = None
+        # Set to the uuid of a task already holding the model lock, to share it.
+        self.lock_owner: Optional[str] = None
         self.error_handler = ResponseErrorHandler()
+        self.trace = TaskTrace(self.uuid)
         self.log = config_logger(
             file_name=f"{self.uuid}.log",
-            write_mode="w",
+            write_mode="w" if uuid is None else "a",
             level="debug",
             logger_name=f"{self.uuid}_logger",
             sub_folder="tasks",
         )
 
-    async def delete_model(self, model: str):
+    async def run(self, task: Callable, **kwargs):
+        # Keep the shared task record in sync so any worker can observe it.
+        details = {
+            key: value
+            for key, value in kwargs.items()
+            if isinstance(value, (str, int, float, bool))
+        }
+        if self.cancel_on_disconnect:
+            details["cancel_on_disconnect"] = True
+        if self.callback_url:
+            details["callback_url"] = self.callback_url
+        self.state.create_task(self.uuid, action=task.__name__, details=details)
+        TASKS_STARTED.inc(action=task.__name__)
+        PROFILER.watch_loop(asyncio.get_running_loop())
+        watcher = asyncio.create_task(self._watch_cancel())
+        try:
+            await task(**kwargs)
+        finally:
+            watcher.cancel()
+            for value in kwargs.values():
+                if isinstance(value, UploadFile):
+                    value.file.close()  # Detached from the request by the router.
+            self.state.release_space(self.uuid)
+            if not self.error_flag:
+                status = TASK_SUCCESS
+            elif self.cancel_event.is_set():
+                status = TASK_CANCELLED
+            else:
+                status = TASK_FAILED
+            self.state.update_task(self.uuid, status=status)
+            TASKS_FINISHED.inc(action=task.__name__, status=status)
+            if task.__name__ != "get_model_list":
+                INVENTORY.invalidate()
+            if self.callback_url:
+                self.queue_callback(task.__name__, status, details)
+            try:
+                self.trace.export(task.__name__, status)
+            except OSError as e:
+                self.log.warning(f"'{self.uuid}' Export trace failed. Details : {e}")
+            close_logger(self.log)
+
+    def queue_callback(self, action: str, status: str, details: dict):
+        # Sent by the webhook outbox, which retries until it is received.
+        payload = {
+            "event": f"task.{status}",
+            "task_uuid": self.uuid,
+            "action": action,
+            "status": status,
+            "request": details,
+            "result": self.last_message,
+            "timings": self.trace.summary(),
+            "finished": time.time(),
+        }
+        try:
+            get_webhook_outbox().enqueue(
+                self.uuid, self.callback_url, payload["event"], payload
+            )
+        except Exception as e:
+            self.log.error(f"'{self.uuid}' Queue callback failed. Details : {e}")
+
+    async def _watch_cancel(self):
+        # Cancels can be requested from any worker, through the state backend.
+        while not self.cancel_event.is_set():
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+            if (
+                self.parent is not None and self.parent.cancel_event.is_set()
+            ) or await asyncio.to_thread(self.state.cancel_requested, self.uuid):
+                self.cancel()
+
+    def cancel(self):
+        # Checked by the running stage at its next chunk, member or line.
+        if not self.cancel_event.is_set():
+            self.log.warning(f"'{self.uuid}' Cancel requested.")
+        self.cancel_event.set()
+
+    def raise_if_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled(f"Task '{self.uuid}' cancelled.")
+
+    @contextmanager
+    def timed(self, stage: str):
+        # Timed for /metrics and in the trace of the task.
+        with timed_stage(stage), self.trace.span(stage):
+            yield
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        # Runs under the concurrency limit of the stage, timed once started.
+        waited = time.perf_counter()
+        async with STAGE_LIMITER.stage(stage):
+            self.trace.add(f"{stage}_wait", waited, time.perf_counter() - waited)
+            with self.timed(stage):
+                yield
+
+    async def warm_up(
+        self,
+        model: str,
+        model_name_on_ollama: str,
+        progress: float,
+        servers: Optional[List[ModelServer]] = None,
+    ) -> Optional[Dict]:
+        # The model is created, a failed load is reported but fails nothing.
+        if self.keep_alive is None:
+            return None
+        servers = servers or MODEL_SERVERS.all()[:1]
+        response = ResponseFormat(
+            status=200,
+            message=ResponseMessage(
+                action="Start warmup model",
+                task_uuid=str(self.uuid),
+                progress=progress,
+                details={
+                    "model": model,
+                    "model_name_on_ollama": model_name_on_ollama,
+                    "keep_alive": self.keep_alive,
+                },
+            ),
+        )
+        await self.put_message(response)
+        try:
+            with self.timed(STAGE_WARMUP):
+                async with OllamaClient(follow_redirects=True) as client:
+                    seconds = max(
+                        await asyncio.gather(
+                            *(
+                                load_model(
+                                    client,
+                                    model_name_on_ollama,
+                                    self.keep_alive,
+                                    server.url,
+                                )
+                                for server in servers
+                            )
+                        )
+                    )
+        except Exception as e:
+            self.log.warning(
+                f"'{self.uuid}' Warmup {model_name_on_ollama} failed. Details : {e!r}"
+            )
+            return {"keep_alive": self.keep_alive, "error": repr(e)}
+        self.log.info(
+            f"'{self.uuid}' Warmup {model_name_on_ollama} in {round(seconds, 3)} seconds."
+        )
+        return {"keep_alive": self.keep_alive, "seconds": round(seconds, 3)}
+
+    async def put_cancelled(self, model: str):
+        self.log.warning(f"'{self.uuid}' Task cancelled. Details : {model}")
+        response = ResponseFormat(
+            status=499,
+            message=ResponseMessage(
+                action="Task cancelled.",
+                task_uuid=str(self.uuid),
+                progress=-1,
+                details={"model": model},
+            ),
+        )
+        await self.put_message(response)
+        self.error_flag = True
+
+    async def put_message(self, response: ResponseFormat):
+        message = dict(response)
+        progress = message["message"]["progress"]
+        if progress in (1, -1):
+            # The last message of a task tells where its time went.
+            message["message"]["details"]["timings"] = self.trace.summary()
+        if self.streamed:
+            await self.message.put(json.dumps(message) + "\n")
+
+        # "Flag" messages are per chunk, only their progress is shared.
+        if "Flag" not in message["message"]["action"]:
+            self.state.append_event(self.uuid, message)
+            self.last_message = message
+        if progress != self.last_progress:
+            self.last_progress = progress
+            self.state.update_task(self.uuid, progress=progress)
+
+    async def delete_model(self, model: str, delete_on_ollama: bool = True):
         try:
-            self.model_status[model] = self.uuid
+            if not self.model_status.acquire(model, self.uuid):
+                raise ValueError(
+                    f"Model '{model}' is currently in use and cannot be deleted."
+                )
             self.log.info(f"'{self.uuid}'Delete model.Details : {model}")
             model_path = os.path.join(self.root_path, model)
             response = ResponseFormat(
@@ -54,9 +334,27 @@ class ModelOperator:
                     details={"model_name": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
-            shutil.rmtree(model_path)
+            with self.timed(STAGE_DELETE):
+                # Rename is atomic, the name can be deployed again right away.
+                trash_path = os.path.join(get_trash_folder(), f"{model}.{self.uuid}")
+                os.rename(model_path, trash_path)
+                self.model_status.release(model, self.uuid)
+                STORAGE_GC.schedule(trash_path)
+
+                registry = get_model_registry()
+                ollama_models = registry.links(model)
+                details = {"model_name": model}
+                if delete_on_ollama and ollama_models:
+                    details["ollama_models"] = await self.delete_ollama_models(
+                        ollama_models
+                    )
+                registry.unlink(model)
+                registry.forget_deploys(model)
+                registry.forget_usage(model)
+                registry.set_base(model, None)
+                registry.forget_file_digests(model)
 
             response = ResponseFormat(
                 status=200,
@@ -64,10 +362,10 @@ class ModelOperator:
                     action="Success delete model.",
                     task_uuid=str(self.uuid),
                     progress=1,
-                    details={"model_name": model},
+                    details=details,
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
             self.log.warning(f"'{self.uuid}'Delete model success.Details : {model}.")
 
@@ -89,16 +387,56 @@ class ModelOperator:
                     details=dict(self.error_handler.errors[0]),
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
             self.error_flag = True
         finally:
-            del self.model_status[model]
+            self.model_status.release(model, self.uuid)
             self.alive = False
 
+    async def delete_ollama_models(self, ollama_models: list) -> dict:
+        # Remove every Ollama model created from the folder, concurrently, on
+        # the servers it was placed on, or on all of them if it is not known.
+        registry = get_model_registry()
+
+        async def delete(client: httpx.AsyncClient, server: ModelServer, name: str):
+            try:
+                response = await client.request(
+                    "DELETE", server.url + "api/delete", json={"model": name}
+                )
+                if response.status_code in (200, 404):
+                    return "deleted"
+                return f"failed: {response.status_code} {response.text}"
+            except httpx.RequestError as e:
+                return f"failed: {e}"
+
+        async def delete_everywhere(client: httpx.AsyncClient, name: str) -> str:
+            servers = MODEL_SERVERS.named(registry.placements(name))
+            results = await asyncio.gather(
+                *(
+                    delete(client, server, name)
+                    for server in servers or MODEL_SERVERS.all()
+                )
+            )
+            failed = [result for result in results if result != "deleted"]
+            if not failed:
+                registry.unplace(name)
+            return failed[0] if failed else "deleted"
+
+        async with OllamaClient(follow_redirects=True) as client:
+            results = await asyncio.gather(
+                *(delete_everywhere(client, name) for name in ollama_models)
+            )
+        for name, result in zip(ollama_models, results):
+            self.log.info(f"'{self.uuid}' Delete '{name}' on model server: {result}")
+        return dict(zip(ollama_models, results))
+
     async def get_status(self):
         while self.alive or not self.message.empty():
-            if not self.message.empty():
-                raw_message = await self.message.get()
+            if self.message.empty():
+                # The task runs on another thread and loop, poll without spinning.
+                await asyncio.sleep(MESSAGE_POLL_INTERVAL)
+            else:
+                raw_message = self.message.get_nowait()
                 try:
                     if isinstance(raw_message, str):
                         message = json.loads(raw_message)
@@ -121,23 +459,37 @@ class ModelOperator:
                     )
                     yield 500, {"error": "Invalid message format"}
 
-    async def get_model_list(self):
+    async def get_model_list(self, merged: bool = False):
         try:
-            total_model_dir = next(os.walk(self.root_path))[1]
+            if merged:
+                # Joined with Ollama, from the inventory cache.
+                inventory = await INVENTORY.get()
+                models = [dict(details) for details in inventory["models"].values()]
+                for details in models:
+                    details["refreshed"] = inventory["refreshed"]
+                    if inventory["error"] is not None:
+                        details["model_server_error"] = inventory["error"]
+            else:
+                models = [
+                    {"model": folder}
+                    for folder in next(os.walk(self.root_path))[1]
+                    if not folder.startswith(".")
+                ]
+            total_model_dir = [details["model"] for details in models]
 
             self.log.info(f"'{self.uuid}'Get model list. Detail:{total_model_dir}")
             total_model = len(total_model_dir)
-            for progress, model in enumerate(total_model_dir):
+            for progress, details in enumerate(models):
                 response = ResponseFormat(
                     status=200,
                     message=ResponseMessage(
                         action="Get model.",
                         task_uuid=str(self.uuid),
                         progress=round((progress + 1) / total_model, 2),
-                        details={"model": model},
+                        details=details,
                     ),
                 )
-                await self.message.put(json.dumps(dict(response)) + "\n")
+                await self.put_message(response)
 
         except Exception as e:
             self.log.error(f"'{self.uuid}' Failed Get model list. Details: {e}")
@@ -157,7 +509,7 @@ class ModelOperator:
                     details=dict(self.error_handler.errors[0]),
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
             self.error_flag = True
         finally:
             self.alive = False
@@ -168,14 +520,20 @@ class ModelOperator:
         file: UploadFile,
         progress_ratio: float = 1,
         progress_base: float = 0,
+        model_name_on_ollama: Optional[str] = None,
     ):
         # async def save_model(self, model: str, file: UploadFile, content_length: int):
+        operator = None
+        journal = get_ingest_journal()
         try:
             processed_size = 0
 
-            self.model_status[model] = self.uuid
+            if not self.model_status.acquire(model, self.uuid):
+                raise ValueError(f"{model} is being processed.")
 
-            operator = ZipOperator(filename=model)
+            operator = ZipOperator(filename=model, uuid=self.uuid)
+            # A deploy stays journaled until its create is done.
+            journal.begin(self.uuid, model, model_name_on_ollama, self.callback_url)
             self.log.info(f"'{self.uuid}' Start to save '{model}'.")
             response = ResponseFormat(
                 status=200,
@@ -187,42 +545,96 @@ class ModelOperator:
                     details={"model": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
             processed_size = 0
-            chunk_size = 1024 * 1024
             total = file.size
-            with open(operator.zip_path, "wb") as buffer:
-                file.file.seek(0)
-                while True:
-                    chunk = file.file.read(chunk_size)
-                    if not chunk:
-                        break
-                    buffer.write(chunk)
-                    processed_size = processed_size + chunk_size
-
-                    if processed_size >= total:
-                        processed_size = total
+            if isinstance(file.file, SpoolFile):
+                # Received before the task started, hashed on the way in.
+                spool = file.file
+                self.trace.add(
+                    "spool", spool.started, spool.finished - spool.started, bytes=total
+                )
+                self.trace.add(
+                    "hash", spool.started, spool.hash_seconds, thread="request"
+                )
+            async with self.stage(STAGE_SAVE):
+                self.raise_if_cancelled()
+                started = time.perf_counter()
+                if link_into_place(file.file, operator.part_path):
+                    # The spool is already on the models volume, no copy needed.
+                    self.trace.add("link", started, time.perf_counter() - started)
+                    self.log.info(f"'{self.uuid}' Link spooled '{model}' into place.")
+                    self.digest = file.file.digest
+                else:
+                    journaled = time.monotonic()
+                    copy_span = self.trace.span("copy", bytes=total)
+                    with copy_span as copy_args, IngestWriter(
+                        operator.part_path, size=total
+                    ) as buffer:
+                        file.file.seek(0)
+                        copier = PipelinedCopier(file.file, buffer)
+                        copier.start()
+                        try:
+                            while not copier.done:
+                                await asyncio.sleep(PROGRESS_INTERVAL)
+                                if self.cancel_event.is_set():
+                                    copier.cancel()  # Stops at the next chunk.
+                                if copier.processed == processed_size:
+                                    continue
+                                processed_size = min(copier.processed, total)
+                                if time.monotonic() - journaled >= JOURNAL_INTERVAL:
+                                    journaled = time.monotonic()
+                                    await asyncio.to_thread(
+                                        journal.update,
+                                        self.uuid,
+                                        bytes_written=processed_size,
+                                    )
 
-                    progress = round(0.5 * (processed_size / total), 2)
+                                progress = round(0.5 * (processed_size / total), 2)
 
-                    response = ResponseFormat(
-                        status=200,
-                        message=ResponseMessage(
-                            action=f"Flag Saving '{model}'.",
-                            task_uuid=str(self.uuid),
-                            progress=round(
-                                progress_ratio * progress + progress_base, 2
-                            ),
-                            details={"model": model},
-                        ),
-                    )
-                    await self.message.put(json.dumps(dict(response)) + "\n")
+                                response = ResponseFormat(
+                                    status=200,
+                                    message=ResponseMessage(
+                                        action=f"Flag Saving '{model}'.",
+                                        task_uuid=str(self.uuid),
+                                        progress=round(
+                                            progress_ratio * progress + progress_base, 2
+                                        ),
+                                        details={"model": model},
+                                    ),
+                                )
+                                await self.put_message(response)
+                        finally:
+                            if not copier.done:
+                                copier.cancel()
+                            copier.join()
+                            # The copier stages ran in parallel with the copy.
+                            self.trace.add(
+                                "hash",
+                                copier.started,
+                                copier.busy["hash"],
+                                thread="hasher",
+                            )
+                            copy_args.update(
+                                read_seconds=round(copier.busy["read"], 4),
+                                write_seconds=round(copier.busy["write"], 4),
+                            )
+                        self.raise_if_cancelled()
+                        self.digest = copier.digest
+                operator.commit_zip()
+                INGESTED_BYTES.inc(total)
+                INGEST_THROUGHPUT.observe(
+                    total / max(time.perf_counter() - started, 1e-6)
+                )
+                journal.update(self.uuid, stage=JOURNAL_EXTRACT, bytes_written=total)
 
                 # with open(self.zip_path, "wb") as buffer:
                 #     buffer.write(file)
 
-            self.log.info(f"'{self.uuid}' Save '{model}' success.")
+            self.log.info(
+                f"'{self.uuid}' Save '{model}' success. sha256 : {self.digest}"
+            )
             # response = ResponseFormat(
             #     status=200,
             #     message=ResponseMessage(
@@ -232,7 +644,7 @@ class ModelOperator:
             #         details={"model": model},
             #     ),
             # )
-            # await self.message.put(json.dumps(dict(response)) + "\n")
+            # await self.put_message(response)
             self.log.info(f"'{self.uuid}' Start extract '{model}'.")
             response = ResponseFormat(
                 status=200,
@@ -243,24 +655,17 @@ class ModelOperator:
                     details={"model": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
-            operator.extract()
-
-            for root, _, files in os.walk(operator.extract_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    _, ext = os.path.splitext(file)
-                    if ext.lower() != ".gguf":
-                        self.log.error(
-                            f"'{self.uuid}' Failed to save model. Details: Invalid file extension '{ext}' for file '{file_path}'."
-                        )
-                        shutil.rmtree(root)
-                        raise ValueError(
-                            f"Invalid file extension '{ext}' for file '{file_path}'."
-                        )
+            await self.extract_model(operator)
 
             self.log.info(f"'{self.uuid}' Upload '{model}' success.")
+            if get_zip_retention() == "delete":
+                STORAGE_GC.schedule(operator.zip_path)
+            if model_name_on_ollama is None:
+                journal.finish(self.uuid)
+            else:
+                journal.update(self.uuid, stage=JOURNAL_CREATE)
 
             response = ResponseFormat(
                 status=200,
@@ -271,8 +676,13 @@ class ModelOperator:
                     details={"model": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
+        except TaskCancelled:
+            await self.put_cancelled(model)
+            if operator is not None:
+                with self.trace.span("cleanup"):
+                    operator.cleanup()
         except Exception as e:
             self.log.error(f"'{self.uuid}' Failed save model. Details: {e}")
             self.error_handler.add(
@@ -291,11 +701,109 @@ class ModelOperator:
                     details=dict(self.error_handler.errors[0]),
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
             self.error_flag = True
+            if operator is not None:
+                with self.trace.span("cleanup"):
+                    operator.cleanup()
         finally:
+            if self.error_flag:
+                journal.finish(self.uuid)
             self.alive = False
-            del self.model_status[model]
+            self.model_status.release(model, self.uuid)
+
+    async def extract_model(self, operator: ZipOperator, members_done: int = 0):
+        # Extract the committed zip next to its folder, then swap it in.
+        journal = get_ingest_journal()
+
+        # The zip is on disk now, only its extraction is still to come.
+        self.state.update_reservation(
+            self.uuid, ZipOperator.uncompressed_size(operator.zip_path)
+        )
+        # The folder content changes, earlier deploys of it are stale.
+        get_model_registry().forget_deploys(operator.extract_path.name)
+        if not operator.extract_tmp_path.is_dir():
+            members_done = 0  # Crashed after the swap, extract it again.
+        async with self.stage(STAGE_EXTRACT):
+            self.raise_if_cancelled()
+            await asyncio.to_thread(
+                operator.extract,
+                self.cancel_event.is_set,
+                members_done,
+                lambda done: journal.update(self.uuid, members_done=done),
+            )
+            self.raise_if_cancelled()
+
+        with self.timed(STAGE_VALIDATE):
+            for root, _, files in os.walk(operator.extract_tmp_path):
+                for file in files:
+                    # Reported under the name the folder will have.
+                    file_path = os.path.join(
+                        operator.extract_path,
+                        os.path.relpath(
+                            os.path.join(root, file), operator.extract_tmp_path
+                        ),
+                    )
+                    _, ext = os.path.splitext(file)
+                    if ext.lower() != ".gguf":
+                        self.log.error(
+                            f"'{self.uuid}' Failed to save model. Details: Invalid file extension '{ext}' for file '{file_path}'."
+                        )
+                        raise ValueError(
+                            f"Invalid file extension '{ext}' for file '{file_path}'."
+                        )
+
+        replaced = operator.commit_extract()
+        if replaced is not None:
+            STORAGE_GC.schedule(replaced)
+
+    def base_model_file(self, model: str) -> Optional[str]:
+        # The base GGUF of a folder, None if it has none of its own.
+        model_folder = os.path.join(self.root_path, model)
+        if not os.path.isdir(model_folder) or get_model_registry().base_of(model):
+            return None
+        files = sorted(next(os.walk(model_folder))[2])
+        if len(files) == 2:
+            return files[1] if "lora" in files[0] else files[0]
+        elif len(files) == 1:
+            return files[0]
+        return None
+
+    def build_modelfile(self, model: str, base: Optional[str] = None):
+        # Modelfile for the folder as Ollama sees it, None if it is not deployable.
+        # An adapter-only folder builds on the base GGUF of its base folder.
+        model_folder = os.path.join(self.root_path, model)
+        ollama_model_folder = os.path.join("/home", model)
+        files = sorted(next(os.walk(model_folder))[2])
+
+        basemodel_template = Template("FROM $base_model_path")
+        gguf_template = Template("\nADAPTER $gguf_path")
+
+        base = base or get_model_registry().base_of(model)
+        if base is not None:
+            base_file = self.base_model_file(base)
+            if base_file is None or len(files) != 1:
+                return None
+            base_model_path = os.path.join("/home", base, base_file)
+            gguf_path = os.path.join(ollama_model_folder, files[0])
+            return basemodel_template.substitute(
+                base_model_path=base_model_path
+            ) + gguf_template.substitute(gguf_path=gguf_path)
+        elif len(files) == 2:
+            if "lora" in files[0]:
+                base_model_path = os.path.join(ollama_model_folder, files[1])
+                gguf_path = os.path.join(ollama_model_folder, files[0])
+            else:
+                base_model_path = os.path.join(ollama_model_folder, files[0])
+                gguf_path = os.path.join(ollama_model_folder, files[1])
+
+            return basemodel_template.substitute(
+                base_model_path=base_model_path
+            ) + gguf_template.substitute(gguf_path=gguf_path)
+        elif len(files) == 1:
+            base_model_path = os.path.join(ollama_model_folder, files[0])
+            return basemodel_template.substitute(base_model_path=base_model_path)
+        return None
 
     async def create_model(
         self,
@@ -304,15 +812,34 @@ class ModelOperator:
         progress_ratio: float = 1,
         progress_base: float = 0,
     ):
+        owner = self.lock_owner or self.uuid
+        locked = False
         try:
-            self.model_status[model] = self.uuid
-            model_server_url = get_model_server_url()
-            url = model_server_url + "api/create"
+            locked = self.model_status.acquire(model, owner)
+            if not locked:
+                self.log.warning(
+                    f"'{self.uuid}' Create model error. Details : {model} is being processed."
+                )
+                self.error_handler.add(
+                    type=self.error_handler.ERR_INTERNAL,
+                    loc=[self.error_handler.ERR_INTERNAL],
+                    msg=f"{model} is being processed.",
+                    input=dict(),
+                )
+                response = ResponseFormat(
+                    status=409,
+                    message=ResponseMessage(
+                        action="Create model error.",
+                        task_uuid=str(self.uuid),
+                        progress=-1,
+                        details=dict(self.error_handler.errors[0]),
+                    ),
+                )
+                await self.put_message(response)
+                self.error_flag = True
+                return
             model_folder = os.path.join(self.root_path, model)
             self.log.info(f"'{self.uuid}' Start create model {model} ")
-            ollama_model_folder = os.path.join(
-                "/home", model
-            )  # Check if the model folder exists
             response = ResponseFormat(
                 status=200,
                 message=ResponseMessage(
@@ -322,7 +849,7 @@ class ModelOperator:
                     details={"model": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
             if not os.path.exists(model_folder):
                 self.log.warning(
@@ -348,7 +875,7 @@ class ModelOperator:
                         details=dict(self.error_handler.errors),
                     ),
                 )
-                await self.message.put(json.dumps(dict(response)) + "\n")
+                await self.put_message(response)
                 return
             self.log.info(
                 f"'{self.uuid}'Start structure template model_folder :{model_folder}"
@@ -362,32 +889,10 @@ class ModelOperator:
                     details={"model": model},
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
-
-            files = next(os.walk(model_folder))[2]
-
-            modelfile_content = ""
-            basemodel_template = Template("FROM $base_model_path")
-            gguf_template = Template("\nADAPTER $gguf_path")
-
-            # Prepare the modelfile content
-            if len(files) == 2:
-                if "lora" in files[0]:
-                    base_model_path = os.path.join(ollama_model_folder, files[1])
-                    gguf_path = os.path.join(ollama_model_folder, files[0])
-                else:
-                    base_model_path = os.path.join(ollama_model_folder, files[0])
-                    gguf_path = os.path.join(ollama_model_folder, files[1])
+            await self.put_message(response)
 
-                modelfile_content = basemodel_template.substitute(
-                    base_model_path=base_model_path
-                ) + gguf_template.substitute(gguf_path=gguf_path)
-            elif len(files) == 1:
-                base_model_path = os.path.join(ollama_model_folder, files[0])
-                modelfile_content = basemodel_template.substitute(
-                    base_model_path=base_model_path
-                )
-            else:
+            modelfile_content = self.build_modelfile(model)
+            if modelfile_content is None:
                 self.error_handler.add(
                     type=self.error_handler.ERR_INTERNAL,
                     loc=[self.error_handler.ERR_INTERNAL],
@@ -398,17 +903,6 @@ class ModelOperator:
                     message="Create model error.",
                     details=self.error_handler.errors[0],
                 )
-                response = ResponseFormat(
-                    status=500,
-                    message=ResponseMessage(
-                        action="Failed to structure template",
-                        task_uuid=str(self.uuid),
-                        progress=-1,
-                        details=dict(self.error_handler.errors),
-                    ),
-                )
-                await self.message.put(json.dumps(dict(response)) + "\n")
-                return
             # Prepare payload
             payload = {
                 "model": model_name_on_ollama,
@@ -429,101 +923,51 @@ class ModelOperator:
             #         },
             #     ),
             # )
-            # await self.message.put(json.dumps(dict(response)) + "\n")
-
-            # Make the POST request
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                try:
-                    async with client.stream("POST", url, json=payload) as response:
-                        async for line in response.aiter_lines():
-                            if line.strip():
-                                try:
-                                    parsed_response = json.loads(line)
-                                    self.log.debug(
-                                        f"'{self.uuid}' Model server response:\n {parsed_response}\n"
-                                    )
-                                    # {"status":"using existing layer sha256:9845de86d85acee501671b2fa12bfb8c98adc36c82897eed479fbfb81ea6bedf"}
-                                    # await self.message.put(
-                                    #     json.dumps(
-                                    #         {
-                                    #             "status": 200,
-                                    #             "message": f"Get model process status from ollama. status : {str(parsed_response['status'])}",
-                                    #             "details": str(line),
-                                    #         }
-                                    #     )
-                                    #     + "\n"
-                                    # )
-
-                                    #
-                                    # print(parsed_response)
-                                except json.JSONDecodeError as e:
-                                    raise
-                                    self.log.error(
-                                        f"'{self.uuid}' Create model Get response error .Details: JSON decode error . {e}"
-                                    )
-
-                                    self.error_handler.add(
-                                        type=self.error_handler.ERR_INTERNAL,
-                                        loc=[self.error_handler.ERR_INTERNAL],
-                                        msg=str(
-                                            f"'{self.uuid}' Create model Get response error .Details: JSON decode error . {e}"
-                                        ),
-                                        input=dict(),
-                                    )
+            # await self.put_message(response)
 
-                                    response = ResponseFormat(
-                                        status=400,
-                                        message=ResponseMessage(
-                                            action="Model server processing failed.",
-                                            task_uuid=str(self.uuid),
-                                            progress=-1,
-                                            details=dict(self.error_handler.errors),
-                                        ),
-                                    )
-                                    await self.message.put(
-                                        json.dumps(dict(response)) + "\n"
-                                    )
-                                    return
-                except httpx.RequestError as e:
-                    raise
-                    self.log.error(
-                        f"'{self.uuid}' Create model Request error.details: {e}"
-                    )
-
-                    self.error_handler.add(
-                        type=self.error_handler.ERR_INTERNAL,
-                        loc=[self.error_handler.ERR_INTERNAL],
-                        msg=f"'{self.uuid}' Create model Request error.details: {e}",
-                        input=dict(),
-                    )
-
-                    response = ResponseFormat(
-                        status=400,
-                        message=ResponseMessage(
-                            action="Failed to call model server",
-                            task_uuid=str(self.uuid),
-                            progress=-1,
-                            details=dict(self.error_handler.errors),
-                        ),
-                    )
-                    await self.message.put(json.dumps(dict(response)) + "\n")
-                    return
+            async with self.stage(STAGE_CREATE):
+                self.raise_if_cancelled()
+                created, placement = await self.create_on_servers(model, payload)
+                self.raise_if_cancelled()
+            registry = get_model_registry()
+            details = {"model": model, "model_name_on_ollama": model_name_on_ollama}
+            base = registry.base_of(model)
+            if base is not None:
+                details["base"] = base
+            details["model_servers"] = placement
+            warmup = await self.warm_up(
+                model,
+                model_name_on_ollama,
+                round(progress_ratio * 0.9 + progress_base, 2),
+                created,
+            )
+            if warmup is not None:
+                details["warmup"] = warmup
             response = ResponseFormat(
                 status=200,
                 message=ResponseMessage(
                     action="Success create model",
                     task_uuid=str(self.uuid),
                     progress=round(progress_ratio * 1 + progress_base, 2),
-                    details={
-                        "model": model,
-                        "model_name_on_ollama": model_name_on_ollama,
-                    },
+                    details=details,
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
 
             self.log.debug(f"'{self.uuid}' Success create model")
+            registry.link(model, model_name_on_ollama)
+            registry.place(model_name_on_ollama, *(server.name for server in created))
+            registry.touch(model)
+            if self.digest:
+                registry.record_deploy(
+                    self.digest, model, modelfile_content, model_name_on_ollama
+                )
+            zip_path = os.path.join(self.root_path, f"{model}.zip")
+            if get_zip_retention() == "until_create" and os.path.exists(zip_path):
+                STORAGE_GC.schedule(zip_path)
 
+        except TaskCancelled:
+            await self.put_cancelled(model)
         except Exception as e:
             self.log.error(
                 f"'{self.uuid}' Unexpected failed to create model. Details: {e}"
@@ -547,16 +991,259 @@ class ModelOperator:
                     details=dict(self.error_handler.errors[0]),
                 ),
             )
-            await self.message.put(json.dumps(dict(response)) + "\n")
+            await self.put_message(response)
             self.error_flag = True
         finally:
             self.alive = False
-            del self.model_status[model]
+            # A shared lock stays with the task it was borrowed from.
+            if locked and owner == self.uuid:
+                self.model_status.release(model, owner)
+
+    async def create_on_servers(
+        self, model: str, payload: Dict
+    ) -> Tuple[List[ModelServer], Dict[str, str]]:
+        """Create a model on the servers the pool places the folder on.
+
+        The servers are created on concurrently. A server that does not
+        answer, or is too busy, is replaced by the next fallback. Returns the
+        servers the model was created on and the outcome on each server
+        tried; raises when it was created on none.
+        """
+        targets, fallbacks = MODEL_SERVERS.place(model)
+        placement: Dict[str, str] = {}
+
+        async def create(server: ModelServer) -> ModelServer:
+            while True:
+                try:
+                    await self.create_on(server, payload)
+                    placement[server.name] = "created"
+                    return server
+                except ModelServerUnavailable as e:
+                    placement[server.name] = f"failed: {e}"
+                    if not fallbacks:
+                        raise
+                    server = fallbacks.pop(0)
+                except ModelServerError as e:
+                    placement[server.name] = f"failed: {e}"
+                    raise
+
+        results = await asyncio.gather(
+            *(create(server) for server in targets), return_exceptions=True
+        )
+        created = [result for result in results if isinstance(result, ModelServer)]
+        self.log.info(f"'{self.uuid}' Create '{payload['model']}' : {placement}")
+        if not created:
+            raise next(
+                (result for result in results if isinstance(result, BaseException)),
+                ModelServerError("No model server to create the model on."),
+            )
+        return created, placement
+
+    async def create_on(self, server: ModelServer, payload: Dict):
+        # Streams api/create of one server, an error line fails the create.
+        result = "failed"
+        try:
+            with MODEL_SERVERS.creating(server):
+                async with OllamaClient(follow_redirects=True) as client:
+                    async with client.stream(
+                        "POST", server.url + "api/create", json=payload
+                    ) as response:
+                        if response.status_code == 503:
+                            raise ModelServerUnavailable(
+                                f"'{server.name}' is busy, answered 503."
+                            )
+                        async for line in response.aiter_lines():
+                            if self.cancel_event.is_set():
+                                result = "cancelled"
+                                return  # Leaving the block closes the stream.
+                            if line.strip():
+                                parsed_response = json.loads(line)
+                                self.log.debug(
+                                    f"'{self.uuid}' Model server '{server.name}' response:\n {parsed_response}\n"
+                                )
+                                if "error" in parsed_response:
+                                    raise ModelServerError(
+                                        f"'{server.name}' : {parsed_response['error']}"
+                                    )
+                        if response.status_code != 200:
+                            raise ModelServerError(
+                                f"'{server.name}' answered {response.status_code}."
+                            )
+            result = "success"
+        except httpx.RequestError as e:
+            MODEL_SERVERS.mark_down(server, repr(e))
+            raise ModelServerUnavailable(f"'{server.name}' not reachable : {e!r}")
+        finally:
+            MODEL_SERVER_CREATES.inc(server=server.name, result=result)
+
+    async def get_ollama_models(self) -> Dict[str, List[ModelServer]]:
+        # Ollama models of every server that answers -> the servers having them.
+        async def tags(client: httpx.AsyncClient, server: ModelServer) -> List[str]:
+            try:
+                response = await client.get(server.url + "api/tags")
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                self.log.warning(
+                    f"'{self.uuid}' List models of '{server.name}' failed : {e!r}"
+                )
+                return []
+            return [model["name"] for model in response.json().get("models", [])]
+
+        servers = MODEL_SERVERS.ranked()
+        async with OllamaClient(follow_redirects=True) as client:
+            names = await asyncio.gather(*(tags(client, server) for server in servers))
+        available: Dict[str, List[ModelServer]] = {}
+        for server, server_names in zip(servers, names):
+            for name in server_names:
+                available.setdefault(ollama_name(name), []).append(server)
+        return available
+
+    async def copy_ollama_model(
+        self, server: ModelServer, source: str, destination: str
+    ) -> bool:
+        url = server.url + "api/copy"
+        async with OllamaClient(follow_redirects=True) as client:
+            response = await client.post(
+                url, json={"source": source, "destination": destination}
+            )
+        self.log.info(
+            f"'{self.uuid}' Copy '{source}' to '{destination}' on model server '{server.name}': {response.status_code}"
+        )
+        return response.status_code == 200
+
+    async def deploy_from_cache(
+        self,
+        filename: str,
+        model: str,
+        model_name_on_ollama: str,
+        file: UploadFile,
+        base: Optional[str] = None,
+    ) -> bool:
+        """Finish a deploy whose archive was already deployed to this folder.
+
+        Returns False when the full save and create is needed.
+        """
+        if not self.model_status.acquire(model, self.uuid):
+            return False
+        try:
+            if not os.path.isdir(os.path.join(self.root_path, model)):
+                return False
+            if get_model_registry().base_of(model) != base:
+                return False  # The folder is deployed on another base.
+            modelfile = self.build_modelfile(model)
+            if modelfile is None:
+                return False
+            self.digest = await asyncio.to_thread(upload_digest, file.file)
+            registry = get_model_registry()
+            deployed = registry.find_deploys(self.digest, model, modelfile)
+            if not deployed:
+                return False
+
+            # Models removed on the model server side invalidate their entries.
+            available = await self.get_ollama_models()
+            for name in deployed:
+                if ollama_name(name) not in available:
+                    registry.forget_deploys(model, name)
+                    registry.unlink(model, name)
+                    registry.unplace(name)
+            deployed = [name for name in deployed if ollama_name(name) in available]
+            if not deployed:
+                return False
+            if MODEL_SERVERS.replicates():
+                # Every healthy server must have it, else it is created again.
+                targets, _ = MODEL_SERVERS.place(model)
+                deployed = [
+                    name
+                    for name in deployed
+                    if set(targets) <= set(available[ollama_name(name)])
+                ]
+                if not deployed:
+                    return False
+
+            details = {"model": model, "model_name_on_ollama": model_name_on_ollama}
+            if base is not None:
+                details["base"] = base
+            if model_name_on_ollama in deployed:
+                details["cached"] = True
+                servers = available[ollama_name(model_name_on_ollama)]
+            else:
+                source = deployed[0]
+                copied = await asyncio.gather(
+                    *(
+                        self.copy_ollama_model(server, source, model_name_on_ollama)
+                        for server in available[ollama_name(source)]
+                    )
+                )
+                servers = [
+                    server
+                    for server, ok in zip(available[ollama_name(source)], copied)
+                    if ok
+                ]
+                if not servers:
+                    return False
+                registry.link(model, model_name_on_ollama)
+                registry.place(
+                    model_name_on_ollama, *(server.name for server in servers)
+                )
+                registry.record_deploy(
+                    self.digest, model, modelfile, model_name_on_ollama
+                )
+                details["copied_from"] = source
+            details["model_servers"] = {server.name: "cached" for server in servers}
+
+            self.log.info(f"'{self.uuid}' Deploy '{model}' from cache. {details}")
+            registry.touch(model)
+            warmup = await self.warm_up(model, model_name_on_ollama, 0.9, servers)
+            if warmup is not None:
+                details["warmup"] = warmup
+            response = ResponseFormat(
+                status=200,
+                message=ResponseMessage(
+                    action="Success create model",
+                    task_uuid=str(self.uuid),
+                    progress=1,
+                    details=details,
+                ),
+            )
+            await self.put_message(response)
+            self.model_status.release(filename, self.uuid)
+            self.alive = False
+            return True
+        except Exception as e:
+            self.log.warning(
+                f"'{self.uuid}' Deploy cache lookup failed, deploy in full. Details: {e}"
+            )
+            return False
+        finally:
+            self.model_status.release(model, self.uuid)
 
-    async def deploy(self, filename: str, model_name_on_ollama: str, file: UploadFile):
+    async def deploy(
+        self,
+        filename: str,
+        model_name_on_ollama: str,
+        file: UploadFile,
+        base: Optional[str] = None,
+    ):
+        # With a base, the archive only holds an adapter, the Modelfile takes
+        # the base GGUF from the base folder where it already is.
         model = filename.replace(".zip", "")
-        await self.save_model(model=filename, file=file, progress_ratio=0.5)
-        if not self.error_flag:
+        if await self.deploy_from_cache(
+            filename, model, model_name_on_ollama, file, base
+        ):
+            return
+        registry = get_model_registry()
+        previous_base = registry.base_of(model)
+        # Recorded first, a resumed create builds on the same base.
+        registry.set_base(model, base)
+        await self.save_model(
+            model=filename,
+            file=file,
+            progress_ratio=0.5,
+            model_name_on_ollama=model_name_on_ollama,
+        )
+        if self.error_flag:
+            registry.set_base(model, previous_base)
+        else:
             self.alive = True
             await self.create_model(
                 model=model,
@@ -564,3 +1251,449 @@ class ModelOperator:
                 progress_ratio=0.5,
                 progress_base=0.5,
             )
+            get_ingest_journal().finish(self.uuid)
+
+    async def resume_ingest(
+        self,
+        filename: str,
+        stage: str,
+        bytes_written: int = 0,
+        members_done: int = 0,
+        model_name_on_ollama: Optional[str] = None,
+    ):
+        """Pick up an ingest whose instance stopped during ``stage``.
+
+        The request body of a save died with its instance, so only its part
+        file is cleaned up. An extraction goes on from the last member done
+        and a create is sent again.
+        """
+        operator = ZipOperator(filename=filename, uuid=self.uuid)
+        model = filename.replace(".zip", "")
+        progress_ratio = 0.5 if model_name_on_ollama else 1
+        try:
+            self.log.warning(
+                f"'{self.uuid}' Resume '{filename}' interrupted at {stage}. "
+                f"Details : {bytes_written} bytes written, {members_done} members extracted."
+            )
+            if stage == JOURNAL_SAVE:
+                raise ValueError(
+                    f"Upload of '{filename}' interrupted after {bytes_written} bytes, upload it again."
+                )
+            if stage == JOURNAL_EXTRACT:
+                if not self.model_status.acquire(filename, self.uuid):
+                    raise ValueError(f"'{filename}' was uploaded again meanwhile.")
+                operator.zip_committed = True
+                response = ResponseFormat(
+                    status=200,
+                    message=ResponseMessage(
+                        action="Resume extract model.",
+                        task_uuid=str(self.uuid),
+                        progress=round(progress_ratio * 0.66, 2),
+                        details={"model": filename, "members_done": members_done},
+                    ),
+                )
+                await self.put_message(response)
+                await self.extract_model(operator, members_done)
+                operator.zip_committed = False
+
+                self.log.info(f"'{self.uuid}' Upload '{filename}' success.")
+                response = ResponseFormat(
+                    status=200,
+                    message=ResponseMessage(
+                        action="Success upload model file.",
+                        task_uuid=str(self.uuid),
+                        progress=progress_ratio,
+                        details={"model": filename},
+                    ),
+                )
+                await self.put_message(response)
+            if model_name_on_ollama:
+                self.alive = True
+                await self.create_model(
+                    model=model,
+                    model_name_on_ollama=model_name_on_ollama,
+                    progress_ratio=progress_ratio,
+                    progress_base=1 - progress_ratio,
+                )
+
+        except TaskCancelled:
+            await self.put_cancelled(filename)
+            with self.trace.span("cleanup"):
+                operator.cleanup()
+        except Exception as e:
+            self.log.error(f"'{self.uuid}' Failed resume ingest. Details: {e}")
+            self.error_handler.add(
+                type=self.error_handler.ERR_INTERNAL,
+                loc=[self.error_handler.ERR_INTERNAL],
+                msg=str(f"'{self.uuid}' Failed resume ingest. Details: {e}"),
+                input=dict(),
+            )
+
+            response = ResponseFormat(
+                status=500,
+                message=ResponseMessage(
+                    action="Failed to resume ingest.",
+                    task_uuid=str(self.uuid),
+                    progress=-1,
+                    details=dict(self.error_handler.errors[0]),
+                ),
+            )
+            await self.put_message(response)
+            self.error_flag = True
+            with self.trace.span("cleanup"):
+                operator.cleanup()
+        finally:
+            # Also drops the lock a crashed SQLite backed instance left behind.
+            self.model_status.release(filename, self.uuid)
+            get_ingest_journal().finish(self.uuid)
+            self.alive = False
+
+    async def sync_model(
+        self,
+        model: str,
+        peer: str,
+        plan: Dict,
+        model_name_on_ollama: Optional[str] = None,
+        targets: Optional[List[str]] = None,
+        fanout: int = 1,
+        seed_url: Optional[str] = None,
+    ):
+        """Sync a model folder from another handler, then seed the targets.
+
+        The plan of ``plan_sync`` tells which files are already here. The
+        others are fetched into a hidden folder swapped in once verified, as
+        an extraction is. The model is then created, while the first
+        ``fanout`` targets sync from this node, each seeding a share of the
+        other targets: the rollout takes a number of rounds logarithmic in
+        the targets instead of loading the uplink of ``peer`` once per node.
+        """
+        targets = targets or []
+        progress_ratio = 0.5 if model_name_on_ollama or targets else 1
+        details = {"model": model, "peer": peer}
+        try:
+            response = ResponseFormat(
+                status=200,
+                message=ResponseMessage(
+                    action="Start sync model.",
+                    task_uuid=str(self.uuid),
+                    progress=0,
+                    details={
+                        **details,
+                        "fetch_bytes": plan["size"],
+                        "up_to_date": plan["up_to_date"] and plan["base_plan"] is None,
+                    },
+                ),
+            )
+            await self.put_message(response)
+
+            folder_plans = [plan]
+            if plan["base_plan"] is not None:
+                folder_plans.insert(0, plan["base_plan"])
+            fetched = 0
+            for folder_plan in folder_plans:
+                if folder_plan["up_to_date"]:
+                    continue
+                fetched += await self.sync_folder(
+                    folder_plan, peer, plan["size"], fetched, progress_ratio
+                )
+            details.update(
+                fetched_bytes=fetched,
+                fetched_files=sum(len(item["fetch"]) for item in folder_plans),
+                local_files=sum(len(item["local"]) for item in folder_plans),
+            )
+            if plan["base_plan"] is not None:
+                details["base"] = plan["base_plan"]["model"]
+            response = ResponseFormat(
+                status=200,
+                message=ResponseMessage(
+                    action="Success sync model files.",
+                    task_uuid=str(self.uuid),
+                    progress=round(progress_ratio, 2),
+                    details=details,
+                ),
+            )
+            await self.put_message(response)
+
+            jobs = []
+            if model_name_on_ollama:
+                jobs.append(self.create_synced(model, model_name_on_ollama))
+            for target, subtree in split_targets(targets, fanout):
+                jobs.append(
+                    seed_target(
+                        seed_url, target, model, model_name_on_ollama, subtree, fanout
+                    )
+                )
+            results = await asyncio.gather(*jobs)
+            if model_name_on_ollama:
+                details["create"] = results.pop(0)
+                self.error_flag = details["create"]["status"] != 200
+            if targets:
+                details["targets"] = results
+                self.error_flag = self.error_flag or any(
+                    result["status"] != 200 for result in results
+                )
+            response = ResponseFormat(
+                status=500 if self.error_flag else 200,
+                message=ResponseMessage(
+                    action=(
+                        "Sync model finished with failures."
+                        if self.error_flag
+                        else "Success sync model."
+                    ),
+                    task_uuid=str(self.uuid),
+                    progress=-1 if self.error_flag else 1,
+                    details=details,
+                ),
+            )
+            await self.put_message(response)
+
+        except TaskCancelled:
+            await self.put_cancelled(model)
+        except Exception as e:
+            self.log.error(f"'{self.uuid}' Failed sync model. Details: {e}")
+            self.error_handler.add(
+                type=self.error_handler.ERR_INTERNAL,
+                loc=[self.error_handler.ERR_INTERNAL],
+                msg=str(f"'{self.uuid}' Failed sync model. Details: {e}"),
+                input=dict(),
+            )
+
+            response = ResponseFormat(
+                status=500,
+                message=ResponseMessage(
+                    action="Failed to sync model.",
+                    task_uuid=str(self.uuid),
+                    progress=-1,
+                    details=dict(self.error_handler.errors[0]),
+                ),
+            )
+            await self.put_message(response)
+            self.error_flag = True
+        finally:
+            self.model_status.release(model, self.uuid)
+            if plan["base_plan"] is not None:
+                self.model_status.release(plan["base_plan"]["model"], self.uuid)
+            self.alive = False
+
+    async def sync_folder(
+        self,
+        plan: Dict,
+        peer: str,
+        total: int,
+        fetched: int,
+        progress_ratio: float,
+    ) -> int:
+        # Returns the bytes fetched from the peer.
+        model = plan["model"]
+        operator = ZipOperator(filename=f"{model}.zip", uuid=self.uuid)
+        download = FolderDownload(plan, peer, operator.extract_tmp_path)
+        try:
+            with self.timed(STAGE_SYNC):
+                task = asyncio.ensure_future(download.run())
+                while not task.done():
+                    await asyncio.wait({task}, timeout=PROGRESS_INTERVAL)
+                    if self.cancel_event.is_set():
+                        task.cancel()  # Stops the downloads at their next chunk.
+                        await asyncio.gather(task, return_exceptions=True)
+                        self.raise_if_cancelled()
+                    response = ResponseFormat(
+                        status=200,
+                        message=ResponseMessage(
+                            action=f"Flag Syncing '{model}'.",
+                            task_uuid=str(self.uuid),
+                            progress=round(
+                                progress_ratio
+                                * (fetched + download.fetched)
+                                / max(total, 1),
+                                2,
+                            ),
+                            details={"model": model},
+                        ),
+                    )
+                    await self.put_message(response)
+                task.result()
+
+            registry = get_model_registry()
+            registry.forget_deploys(model)
+            replaced = operator.commit_extract()
+            if replaced is not None:
+                STORAGE_GC.schedule(replaced)
+            registry.set_base(model, plan["manifest"]["base"])
+            for name, (sha256, crc32) in download.digests.items():
+                stat = os.stat(os.path.join(self.root_path, model, name))
+                registry.record_file_digest(model, name, stat, sha256, crc32)
+            self.log.info(
+                f"'{self.uuid}' Sync '{model}' from '{peer}' success. "
+                f"Details : {download.fetched} bytes fetched."
+            )
+            return download.fetched
+        except BaseException:
+            with self.trace.span("cleanup"):
+                operator.cleanup()
+            raise
+
+    async def create_synced(self, model: str, model_name_on_ollama: str) -> Dict:
+        # Created by a task of its own, whose messages are summed up here.
+        response = ResponseFormat(
+            status=200,
+            message=ResponseMessage(
+                action="Start create model.",
+                task_uuid=str(self.uuid),
+                progress=0.5,
+                details={"model": model, "model_name_on_ollama": model_name_on_ollama},
+            ),
+        )
+        await self.put_message(response)
+        operator = ModelOperator()
+        operator.parent = self
+        operator.lock_owner = self.uuid  # The folder stays locked by the sync.
+        operator.streamed = False
+        operator.keep_alive = self.keep_alive
+        await operator.run(
+            operator.create_model,
+            model=model,
+            model_name_on_ollama=model_name_on_ollama,
+        )
+        message = operator.last_message["message"]
+        return {
+            "status": operator.last_message["status"],
+            "action": message["action"],
+            "task_uuid": operator.uuid,
+            "details": {
+                key: value
+                for key, value in message["details"].items()
+                if key != "timings"
+            },
+        }
+
+    async def deploy_batch(self, jobs: list):
+        # jobs: (operator, task, kwargs) of each item, run concurrently and
+        # limited per stage. Their messages are merged into this stream.
+        try:
+            names = [
+                kwargs.get("filename") or kwargs.get("model") for _, _, kwargs in jobs
+            ]
+            item_progress = {operator.uuid: 0.0 for operator, _, _ in jobs}
+            for operator, _, _ in jobs:
+                operator.parent = self  # Cancelling the batch cancels its items.
+            response = ResponseFormat(
+                status=200,
+                message=ResponseMessage(
+                    action="Start batch deploy.",
+                    task_uuid=str(self.uuid),
+                    progress=0,
+                    details={
+                        "items": [
+                            {"item": name, "item_task_uuid": operator.uuid}
+                            for name, (operator, _, _) in zip(names, jobs)
+                        ]
+                    },
+                ),
+            )
+            await self.put_message(response)
+
+            async def run_item(operator: "ModelOperator", task: Callable, kwargs):
+                try:
+                    await operator.run(task, **kwargs)
+                finally:
+                    await operator.message.put(None)
+
+            async def forward(operator: "ModelOperator", name: str):
+                while True:
+                    raw_message = await operator.message.get()
+                    if raw_message is None:
+                        break
+                    message = json.loads(raw_message)
+                    if "Flag" in message["message"]["action"]:
+                        continue
+                    progress = message["message"]["progress"]
+                    item_progress[operator.uuid] = 1 if progress < 0 else progress
+                    response = ResponseFormat(
+                        status=message["status"],
+                        message=ResponseMessage(
+                            action=message["message"]["action"],
+                            task_uuid=str(self.uuid),
+                            progress=round(
+                                sum(item_progress.values()) / len(item_progress), 2
+                            ),
+                            details={
+                                "item": name,
+                                "item_task_uuid": operator.uuid,
+                                "item_progress": progress,
+                                **message["message"]["details"],
+                            },
+                        ),
+                    )
+                    await self.put_message(response)
+
+            await asyncio.gather(
+                *(run_item(operator, task, kwargs) for operator, task, kwargs in jobs),
+                *(
+                    forward(operator, name)
+                    for name, (operator, _, _) in zip(names, jobs)
+                ),
+            )
+
+            results = [
+                {
+                    "item": name,
+                    "model_name_on_ollama": kwargs["model_name_on_ollama"],
+                    "item_task_uuid": operator.uuid,
+                    "status": TASK_FAILED if operator.error_flag else TASK_SUCCESS,
+                }
+                for name, (operator, _, kwargs) in zip(names, jobs)
+            ]
+            self.error_flag = any(operator.error_flag for operator, _, _ in jobs)
+            response = ResponseFormat(
+                status=500 if self.error_flag else 200,
+                message=ResponseMessage(
+                    action=(
+                        "Batch deploy finished with failures."
+                        if self.error_flag
+                        else "Success batch deploy."
+                    ),
+                    task_uuid=str(self.uuid),
+                    progress=-1 if self.error_flag else 1,
+                    details={"items": results},
+                ),
+            )
+            await self.put_message(response)
+
+        except Exception as e:
+            self.log.error(f"'{self.uuid}' Failed batch deploy. Details: {e}")
+            self.error_handler.add(
+                type=self.error_handler.ERR_INTERNAL,
+                loc=[self.error_handler.ERR_INTERNAL],
+                msg=str(f"'{self.uuid}' Failed batch deploy. Details: {e}"),
+                input=dict(),
+            )
+
+            response = ResponseFormat(
+                status=500,
+                message=ResponseMessage(
+                    action="Unexpected failed to deploy batch.",
+                    task_uuid=str(self.uuid),
+                    progress=-1,
+                    details=dict(self.error_handler.errors[0]),
+                ),
+            )
+            await self.put_message(response)
+            self.error_flag = True
+        finally:
+            self.alive = False
+
+
+def recover_ingests(entries: List[Dict]):
+    # Called by the ingest journal with the ingests of a stopped instance.
+    for entry in entries:
+        operator = ModelOperator(uuid=entry["uuid"])
+        operator.callback_url = entry.get("callback_url")
+        get_lane(LANE_BULK).run_in_background(
+            operator.run,
+            operator.resume_ingest,
+            filename=entry["filename"],
+            stage=entry["stage"],
+            bytes_written=entry["bytes_written"],
+            members_done=entry["members_done"],
+            model_name_on_ollama=entry["model_name_on_ollama"],
+        )
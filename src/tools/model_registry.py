@@ -0,0 +1,301 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tools.connect import get_state_folder
+
+from .state_backend import ClosingConnection
+
+
+class ModelRegistry:
+    """Persistent metadata about the model folders in ``UPLOAD_DIR``.
+
+    Unlike the state backend, this is always a SQLite file on the models
+    volume: it has to survive restarts even with a single worker.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS model_link (
+                    model TEXT NOT NULL,
+                    model_name_on_ollama TEXT NOT NULL,
+                    created REAL,
+                    PRIMARY KEY (model, model_name_on_ollama)
+                );
+                CREATE TABLE IF NOT EXISTS model_placement (
+                    model_name_on_ollama TEXT NOT NULL,
+                    server TEXT NOT NULL,
+                    created REAL,
+                    PRIMARY KEY (model_name_on_ollama, server)
+                );
+                CREATE TABLE IF NOT EXISTS model_usage (
+                    model TEXT PRIMARY KEY,
+                    last_used REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS model_base (
+                    model TEXT PRIMARY KEY,
+                    base TEXT NOT NULL,
+                    created REAL
+                );
+                CREATE TABLE IF NOT EXISTS file_digest (
+                    model TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    crc32 INTEGER NOT NULL,
+                    PRIMARY KEY (model, name)
+                );
+                CREATE TABLE IF NOT EXISTS deploy_cache (
+                    digest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    modelfile TEXT NOT NULL,
+                    model_name_on_ollama TEXT NOT NULL,
+                    created REAL,
+                    PRIMARY KEY (digest, model, model_name_on_ollama)
+                );
+                """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return ClosingConnection(conn)
+
+    # Ollama models created from a folder
+    def link(self, model: str, model_name_on_ollama: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_link VALUES (?, ?, ?)",
+                (model, model_name_on_ollama, time.time()),
+            )
+
+    def links(self, model: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model_name_on_ollama FROM model_link WHERE model = ? "
+                "ORDER BY created",
+                (model,),
+            ).fetchall()
+        return [row["model_name_on_ollama"] for row in rows]
+
+    def all_links(self) -> Dict[str, List[str]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model, model_name_on_ollama FROM model_link ORDER BY created"
+            ).fetchall()
+        links = {}
+        for row in rows:
+            links.setdefault(row["model"], []).append(row["model_name_on_ollama"])
+        return links
+
+    def unlink(self, model: str, model_name_on_ollama: Optional[str] = None):
+        with self._connect() as conn:
+            if model_name_on_ollama is None:
+                conn.execute("DELETE FROM model_link WHERE model = ?", (model,))
+            else:
+                conn.execute(
+                    "DELETE FROM model_link WHERE model = ? AND model_name_on_ollama = ?",
+                    (model, model_name_on_ollama),
+                )
+
+    # Model servers an Ollama model was created on
+    def place(self, model_name_on_ollama: str, *servers: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO model_placement VALUES (?, ?, ?)",
+                [(model_name_on_ollama, server, now) for server in servers],
+            )
+
+    def placements(self, model_name_on_ollama: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT server FROM model_placement WHERE model_name_on_ollama = ? "
+                "ORDER BY created",
+                (model_name_on_ollama,),
+            ).fetchall()
+        return [row["server"] for row in rows]
+
+    def all_placements(self) -> Dict[str, List[str]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model_name_on_ollama, server FROM model_placement "
+                "ORDER BY created"
+            ).fetchall()
+        placements = {}
+        for row in rows:
+            placements.setdefault(row["model_name_on_ollama"], []).append(row["server"])
+        return placements
+
+    def servers_of(self, model: str) -> List[str]:
+        # Servers the Ollama models of a folder were created on.
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT placement.server FROM model_placement AS placement "
+                "JOIN model_link AS link "
+                "ON link.model_name_on_ollama = placement.model_name_on_ollama "
+                "WHERE link.model = ? ORDER BY placement.created",
+                (model,),
+            ).fetchall()
+        return [row["server"] for row in rows]
+
+    def unplace(self, model_name_on_ollama: str, server: Optional[str] = None):
+        with self._connect() as conn:
+            if server is None:
+                conn.execute(
+                    "DELETE FROM model_placement WHERE model_name_on_ollama = ?",
+                    (model_name_on_ollama,),
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM model_placement "
+                    "WHERE model_name_on_ollama = ? AND server = ?",
+                    (model_name_on_ollama, server),
+                )
+
+    # Last use of a folder, deployed by the handler or loaded on Ollama
+    def touch(self, *models: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO model_usage VALUES (?, ?)",
+                [(model, now) for model in models],
+            )
+
+    def usage(self) -> Dict[str, float]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT model, last_used FROM model_usage").fetchall()
+        return {row["model"]: row["last_used"] for row in rows}
+
+    def forget_usage(self, model: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM model_usage WHERE model = ?", (model,))
+
+    # Base folder of an adapter-only folder, whose Modelfile builds on it
+    def set_base(self, model: str, base: Optional[str]):
+        with self._connect() as conn:
+            if base is None:
+                conn.execute("DELETE FROM model_base WHERE model = ?", (model,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO model_base VALUES (?, ?, ?)",
+                    (model, base, time.time()),
+                )
+
+    def base_of(self, model: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT base FROM model_base WHERE model = ?", (model,)
+            ).fetchone()
+        return row and row["base"]
+
+    def adapters(self) -> Dict[str, List[str]]:
+        # Base folder -> the adapter folders built on it.
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model, base FROM model_base ORDER BY created"
+            ).fetchall()
+        adapters = {}
+        for row in rows:
+            adapters.setdefault(row["base"], []).append(row["model"])
+        return adapters
+
+    # Digests of the files of a folder, valid while the file is unchanged
+    def record_file_digest(
+        self, model: str, name: str, stat: os.stat_result, sha256: str, crc32: int
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_digest VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    model,
+                    name,
+                    stat.st_ino,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    sha256,
+                    crc32,
+                ),
+            )
+
+    def file_digest(
+        self, model: str, name: str, stat: os.stat_result
+    ) -> Optional[Tuple[str, int]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256, crc32 FROM file_digest WHERE model = ? AND name = ? "
+                "AND inode = ? AND size = ? AND mtime_ns = ?",
+                (model, name, stat.st_ino, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        return row and (row["sha256"], row["crc32"])
+
+    def find_files(self, sha256: str) -> List[Tuple[str, str]]:
+        # Files last seen with this digest, to check against their stat.
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model, name FROM file_digest WHERE sha256 = ?", (sha256,)
+            ).fetchall()
+        return [(row["model"], row["name"]) for row in rows]
+
+    def forget_file_digests(self, model: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM file_digest WHERE model = ?", (model,))
+
+    # Deploy results, keyed by archive digest, Modelfile and target name
+    def record_deploy(
+        self, digest: str, model: str, modelfile: str, model_name_on_ollama: str
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO deploy_cache VALUES (?, ?, ?, ?, ?)",
+                (digest, model, modelfile, model_name_on_ollama, time.time()),
+            )
+
+    def find_deploys(self, digest: str, model: str, modelfile: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model_name_on_ollama FROM deploy_cache "
+                "WHERE digest = ? AND model = ? AND modelfile = ? ORDER BY created",
+                (digest, model, modelfile),
+            ).fetchall()
+        return [row["model_name_on_ollama"] for row in rows]
+
+    def find_digest(self, digest: str) -> Optional[str]:
+        # Folder last deployed from the archive with this digest.
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT model FROM deploy_cache WHERE digest = ? "
+                "ORDER BY created DESC LIMIT 1",
+                (digest,),
+            ).fetchone()
+        return row and row["model"]
+
+    def forget_deploys(self, model: str, model_name_on_ollama: Optional[str] = None):
+        with self._connect() as conn:
+            if model_name_on_ollama is None:
+                conn.execute("DELETE FROM deploy_cache WHERE model = ?", (model,))
+            else:
+                conn.execute(
+                    "DELETE FROM deploy_cache WHERE model = ? AND model_name_on_ollama = ?",
+                    (model, model_name_on_ollama),
+                )
+
+
+_MODEL_REGISTRY: Optional[ModelRegistry] = None
+_MODEL_REGISTRY_LOCK = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    global _MODEL_REGISTRY
+    with _MODEL_REGISTRY_LOCK:
+        if _MODEL_REGISTRY is None:
+            _MODEL_REGISTRY = ModelRegistry(
+                os.path.join(get_state_folder(), "registry.db")
+            )
+        return _MODEL_REGISTRY
@@ -0,0 +1,262 @@
+import asyncio
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from tools.connect import (
+    get_model_server_health_interval,
+    get_model_server_pins,
+    get_model_server_placement,
+    get_model_servers,
+    get_models_folder,
+    get_ollama_models_dir,
+)
+from tools.settings import on_reload
+from utils import config_logger
+
+from .metrics import REGISTRY
+from .model_registry import get_model_registry
+from .ollama_client import OllamaClient
+
+MODEL_SERVER_LOG = config_logger(
+    file_name="model_servers.log",
+    write_mode="a",
+    level="info",
+    logger_name="model_servers_logger",
+)
+
+PLACE_LEAST_LOADED = "least_loaded"
+PLACE_PINNED = "pinned"
+PLACE_ALL = "all"
+HEALTH_TIMEOUT = 5
+
+
+class ModelServerError(Exception):
+    pass
+
+
+class ModelServerUnavailable(ModelServerError):
+    # Not reachable or too busy, another server may take the request.
+    pass
+
+
+class ModelServer:
+    """A model server of the pool, and what this worker last saw of it."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.healthy: Optional[bool] = None  # Not checked yet.
+        self.checked: Optional[float] = None
+        self.error: Optional[str] = None
+        self.latency: Optional[float] = None
+        self.creating = 0
+        self.placed = 0.0  # Last create started here, to take turns on ties.
+        self.loaded_models = 0
+        self.loaded_bytes = 0
+        self.loaded_vram_bytes = 0
+
+    def load(self) -> Tuple:
+        # Least loaded first: creates running, then memory of loaded models.
+        return (self.creating, self.loaded_bytes, self.placed)
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "checked": self.checked,
+            "error": self.error,
+            "latency": self.latency and round(self.latency, 4),
+            "creating": self.creating,
+            "loaded_models": self.loaded_models,
+            "loaded_bytes": self.loaded_bytes,
+            "loaded_vram_bytes": self.loaded_vram_bytes,
+        }
+
+
+class ModelServerPool:
+    """The model servers of ``MODEL_SERVERS`` and which ones a model goes to.
+
+    Every ``MODEL_SERVER_HEALTH_INTERVAL`` seconds each server is checked
+    through ``api/ps``, which also tells the memory its loaded models take.
+    A server that fails a check or a request is left out of placements until
+    a check succeeds again. ``MODEL_SERVER_PLACEMENT`` picks the servers of
+    a create: ``least_loaded`` the healthy server running the fewest creates
+    in this worker, then with the least memory loaded, ``pinned`` the server
+    of ``MODEL_SERVER_PINS`` or the ones the folder was created on before,
+    ``all`` every healthy server.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers: Dict[str, ModelServer] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.resize()
+
+    def resize(self, *_):
+        # Servers kept across a reload keep what was seen of them.
+        with self.lock:
+            servers = {}
+            for name, url in get_model_servers():
+                server = self.servers.get(name)
+                if server is None or server.url != url:
+                    server = ModelServer(name, url)
+                servers[name] = server
+            self.servers = servers
+
+    def all(self) -> List[ModelServer]:
+        with self.lock:
+            return list(self.servers.values())
+
+    def named(self, names: List[str]) -> List[ModelServer]:
+        with self.lock:
+            return [self.servers[name] for name in names if name in self.servers]
+
+    def ranked(self) -> List[ModelServer]:
+        # Healthy servers least loaded first, all of them when none is.
+        servers = self.all()
+        healthy = [server for server in servers if server.healthy is not False]
+        with self.lock:
+            return sorted(healthy or servers, key=ModelServer.load)
+
+    def place(self, model: str) -> Tuple[List[ModelServer], List[ModelServer]]:
+        """Servers to create a folder on, and the ones to fall back to.
+
+        A placed server that does not answer is replaced by the next
+        fallback. An explicit pin has no fallback.
+        """
+        ranked = self.ranked()
+        policy = get_model_server_placement()
+        if policy == PLACE_ALL:
+            return ranked, []
+        if policy == PLACE_PINNED:
+            pin = get_model_server_pins().get(model)
+            if pin is not None:
+                return self.named([pin]), []
+            previous = [
+                server
+                for server in self.named(get_model_registry().servers_of(model))
+                if server.healthy is not False
+            ]
+            if previous:
+                return previous, [server for server in ranked if server not in previous]
+        return ranked[:1], ranked[1:]
+
+    def replicates(self) -> bool:
+        return get_model_server_placement() == PLACE_ALL
+
+    @contextmanager
+    def creating(self, server: ModelServer):
+        with self.lock:
+            server.creating += 1
+            server.placed = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                server.creating -= 1
+
+    def mark_down(self, server: ModelServer, error: str):
+        with self.lock:
+            was_healthy = server.healthy is not False
+            server.healthy, server.error = False, error
+        if was_healthy:
+            MODEL_SERVER_LOG.warning(
+                f"Model server '{server.name}' down. Details : {error}"
+            )
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self._loop()), name="model_servers", daemon=True
+        )
+        self.thread.start()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                MODEL_SERVER_LOG.error(f"Model servers check failed. Details : {e!r}")
+            await asyncio.sleep(get_model_server_health_interval())
+
+    async def check(self):
+        async with OllamaClient(
+            follow_redirects=True, timeout=HEALTH_TIMEOUT
+        ) as client:
+            await asyncio.gather(
+                *(self.check_server(client, server) for server in self.all())
+            )
+
+    async def check_server(self, client: OllamaClient, server: ModelServer):
+        start = time.perf_counter()
+        try:
+            response = await client.get(server.url + "api/ps")
+            response.raise_for_status()
+            models = response.json().get("models") or []
+        except (httpx.HTTPError, ValueError) as e:
+            self.mark_down(server, repr(e))
+            with self.lock:
+                server.checked = time.time()
+            return
+        with self.lock:
+            was_healthy = server.healthy
+            server.healthy, server.error = True, None
+            server.checked = time.time()
+            server.latency = time.perf_counter() - start
+            server.loaded_models = len(models)
+            server.loaded_bytes = sum(model.get("size") or 0 for model in models)
+            server.loaded_vram_bytes = sum(
+                model.get("size_vram") or 0 for model in models
+            )
+        if was_healthy is False:
+            MODEL_SERVER_LOG.info(f"Model server '{server.name}' up again.")
+
+    def status(self) -> Dict:
+        # The models volume the servers share, as a hint of room for new models.
+        disk = shutil.disk_usage(get_ollama_models_dir() or get_models_folder())
+        with self.lock:
+            servers = [server.status() for server in self.servers.values()]
+        return {
+            "placement": get_model_server_placement(),
+            "interval": get_model_server_health_interval(),
+            "disk_free": disk.free,
+            "servers": servers,
+        }
+
+
+MODEL_SERVERS = ModelServerPool()
+on_reload(MODEL_SERVERS.resize)
+
+
+def _server_samples(field: str):
+    return [
+        ((server.name,), float(getattr(server, field) or 0))
+        for server in MODEL_SERVERS.all()
+    ]
+
+
+REGISTRY.gauge(
+    "model_handler_model_server_up",
+    "Whether the last check of each model server succeeded.",
+    ("server",),
+    lambda: _server_samples("healthy"),
+)
+REGISTRY.gauge(
+    "model_handler_model_server_creating",
+    "Creates running on each model server in this worker.",
+    ("server",),
+    lambda: _server_samples("creating"),
+)
+REGISTRY.gauge(
+    "model_handler_model_server_loaded_bytes",
+    "Memory of the models loaded on each model server at its last check.",
+    ("server",),
+    lambda: _server_samples("loaded_bytes"),
+)
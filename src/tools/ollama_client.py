@@ -0,0 +1,58 @@
+import time
+from typing import Optional
+
+import httpx
+
+from tools.connect import get_model_server_url, get_warmup_timeout
+
+from .metrics import OLLAMA_REQUESTS, OLLAMA_SECONDS
+
+
+def ollama_name(name: str) -> str:
+    # Ollama reports "model" as "model:latest".
+    return name if ":" in name else f"{name}:latest"
+
+
+def keep_alive_value(keep_alive: str):
+    # Ollama reads a number as seconds and a string as a Go duration.
+    try:
+        return float(keep_alive) if "." in keep_alive else int(keep_alive)
+    except ValueError:
+        return keep_alive
+
+
+async def load_model(
+    client: httpx.AsyncClient,
+    name: str,
+    keep_alive: str,
+    server_url: Optional[str] = None,
+) -> float:
+    # A generate request without a prompt only loads the model.
+    start = time.perf_counter()
+    response = await client.post(
+        (server_url or get_model_server_url()) + "api/generate",
+        json={
+            "model": name,
+            "keep_alive": keep_alive_value(keep_alive),
+            "stream": False,
+        },
+        timeout=get_warmup_timeout(),
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+class OllamaClient(httpx.AsyncClient):
+    """``httpx.AsyncClient`` that records model server latency and errors."""
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        endpoint = request.url.path
+        start = time.perf_counter()
+        try:
+            response = await super().send(request, **kwargs)
+        except httpx.HTTPError:
+            OLLAMA_REQUESTS.inc(endpoint=endpoint, code="error")
+            raise
+        OLLAMA_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        OLLAMA_REQUESTS.inc(endpoint=endpoint, code=response.status_code)
+        return response
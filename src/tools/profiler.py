@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional
+
+PROFILE_INTERVAL = 0.01
+SLOW_CALLBACK_SECONDS = 0.1
+MAX_SLOW_CALLBACKS = 200
+
+# Event loops of this process: the server's and one per running task.
+_LOOPS = weakref.WeakSet()
+
+
+class ProfileRunning(Exception):
+    """Raised when a profile is requested while another one runs."""
+
+
+class _SlowCallbacks(logging.Handler):
+    # asyncio debug mode logs "Executing <handle> took 0.123 seconds".
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records: List[Dict] = []
+
+    def emit(self, record: logging.LogRecord):
+        if not str(record.msg).startswith("Executing") or len(record.args) != 2:
+            return
+        callback, seconds = record.args
+        if len(self.records) < MAX_SLOW_CALLBACKS:
+            self.records.append(
+                {
+                    "thread": record.threadName,
+                    "callback": str(callback),
+                    "seconds": round(seconds, 4),
+                }
+            )
+
+
+class SamplingProfiler:
+    """On-demand sampling profiler of the running process.
+
+    A thread samples the stack of every other thread each ``interval`` and
+    counts them in the collapsed format of ``flamegraph.pl`` and speedscope.
+    While it runs, the event loops are in asyncio debug mode, so callbacks
+    blocking a loop longer than ``slow_callback`` are reported too. Both are
+    only switched on for the length of a profile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slow_callback: Optional[float] = None
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop):
+        # Loops started during a profile are put in debug mode right away.
+        _LOOPS.add(loop)
+        if self.slow_callback is not None:
+            self._debug(loop, self.slow_callback)
+
+    @staticmethod
+    def _debug(loop: asyncio.AbstractEventLoop, slow_callback: Optional[float]):
+        def apply():
+            loop.slow_callback_duration = slow_callback or SLOW_CALLBACK_SECONDS
+            loop.set_debug(slow_callback is not None)
+
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(apply)
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float = PROFILE_INTERVAL,
+        slow_callback: float = SLOW_CALLBACK_SECONDS,
+    ) -> Dict:
+        if not self.lock.acquire(blocking=False):
+            raise ProfileRunning("A profile is already running.")
+        handler = _SlowCallbacks()
+        asyncio_logger = logging.getLogger("asyncio")
+        try:
+            self.watch_loop(asyncio.get_running_loop())
+            asyncio_logger.addHandler(handler)
+            self.slow_callback = slow_callback
+            for loop in list(_LOOPS):
+                self._debug(loop, slow_callback)
+            stacks, samples = await asyncio.to_thread(self._sample, seconds, interval)
+        finally:
+            self.slow_callback = None
+            for loop in list(_LOOPS):
+                self._debug(loop, None)
+            asyncio_logger.removeHandler(handler)
+            self.lock.release()
+
+        return {
+            "seconds": seconds,
+            "interval": interval,
+            "samples": samples,
+            "slow_callbacks": sorted(
+                handler.records, key=lambda record: record["seconds"], reverse=True
+            ),
+            "stacks": [
+                f"{stack} {count}"
+                for stack, count in sorted(
+                    stacks.items(), key=lambda item: item[1], reverse=True
+                )
+            ],
+        }
+
+    def _sample(self, seconds: float, interval: float):
+        stacks: Dict[str, int] = {}
+        samples = 0
+        me = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = self._collapse(names.get(ident, str(ident)), frame)
+                stacks[stack] = stacks.get(stack, 0) + 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        # Root first, one "function (file:line)" per frame.
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(name.replace(";", ":") for name in reversed(frames))
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,363 @@
+import asyncio
+import fcntl
+import json
+import os
+import posixpath
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from tools.connect import (
+    get_models_folder,
+    get_replication_connections,
+    get_replication_part_size,
+    get_replication_timeout,
+)
+from utils import config_logger
+
+from .metrics import REPLICATED_BYTES
+from .model_export import FILE_DIGESTS, hash_file
+from .model_registry import get_model_registry
+
+REPLICATION_LOG = config_logger(
+    file_name="replication.log",
+    write_mode="a",
+    level="info",
+    logger_name="replication_logger",
+)
+
+CHUNK_SIZE = 1024 * 1024
+PART_ATTEMPTS = 3
+FICLONE = 0x40049409  # linux/fs.h
+
+
+class SyncError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def peer_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(get_replication_timeout()),
+        follow_redirects=True,
+        **kwargs,
+    )
+
+
+def check_name(name: str):
+    # A peer only names files inside the folder.
+    normalized = posixpath.normpath(name)
+    if normalized != name or name.startswith(("/", "../")) or name == "..":
+        raise SyncError(f"Invalid file name '{name}' in the peer manifest.")
+
+
+def find_local(model: str, entry: Dict) -> Optional[Tuple[str, int]]:
+    # A local file with the content of a manifest entry: its path and CRC32.
+    registry = get_model_registry()
+    candidates = [(model, entry["name"])] + registry.find_files(entry["sha256"])
+    for folder, name in candidates:
+        path = os.path.join(get_models_folder(), folder, name)
+        try:
+            with open(path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                if stat.st_size != entry["size"]:
+                    continue
+                if (folder, name) == (model, entry["name"]):
+                    digest = FILE_DIGESTS.get(folder, name, file)
+                else:
+                    digest = registry.file_digest(folder, name, stat)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if digest is not None and digest[0] == entry["sha256"]:
+            return path, digest[1]
+    return None
+
+
+def local_names(model: str) -> List[str]:
+    folder = os.path.join(get_models_folder(), model)
+    names = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            path = os.path.join(root, file)
+            names.append(os.path.relpath(path, folder).replace(os.sep, "/"))
+    return sorted(names)
+
+
+async def fetch_manifest(client: httpx.AsyncClient, peer: str, model: str) -> Dict:
+    url = f"{peer}model/{quote(model, safe='')}/files/"
+    try:
+        response = await client.get(url)
+    except httpx.HTTPError as e:
+        raise SyncError(f"Peer '{peer}' not reachable. Details : {e!r}")
+    if response.status_code == 404:
+        raise SyncError(f"Model '{model}' not found on peer '{peer}'.", 404)
+    if response.status_code != 200:
+        raise SyncError(
+            f"Peer '{peer}' answered {response.status_code} to the manifest of '{model}'."
+        )
+    manifest = response.json()
+    for entry in manifest["files"]:
+        check_name(entry["name"])
+    return manifest
+
+
+def plan_folder(model: str, manifest: Dict) -> Dict:
+    # Which files of the manifest are already here, and which to fetch.
+    local = {entry["name"]: find_local(model, entry) for entry in manifest["files"]}
+    fetch = [entry for entry in manifest["files"] if local[entry["name"]] is None]
+    own = os.path.join(get_models_folder(), model)
+    up_to_date = (
+        not fetch
+        and os.path.isdir(own)
+        and local_names(model) == sorted(local)
+        and all(path == os.path.join(own, name) for name, (path, _) in local.items())
+        and get_model_registry().base_of(model) == manifest["base"]
+    )
+    return {
+        "model": model,
+        "manifest": manifest,
+        "local": {name: found for name, found in local.items() if found},
+        "fetch": fetch,
+        "bytes": sum(entry["size"] for entry in fetch),
+        "up_to_date": up_to_date,
+    }
+
+
+async def plan_sync(peer: str, model: str) -> Dict:
+    """What a sync of ``model`` from ``peer`` fetches.
+
+    The base folder of an adapter is planned first, it is synced too unless
+    an identical copy is already here.
+    """
+    async with peer_client() as client:
+        manifest = await fetch_manifest(client, peer, model)
+        plan = await asyncio.to_thread(plan_folder, model, manifest)
+        plan["base_plan"] = None
+        if manifest["base"] is not None:
+            base_manifest = await fetch_manifest(client, peer, manifest["base"])
+            base_plan = await asyncio.to_thread(
+                plan_folder, manifest["base"], base_manifest
+            )
+            if not base_plan["up_to_date"]:
+                plan["base_plan"] = base_plan
+    plan["peer"] = peer
+    plan["size"] = plan["bytes"] + (plan["base_plan"] or {}).get("bytes", 0)
+    return plan
+
+
+def clone_or_copy(source: str, target: Path):
+    # Never a hard link: the storage GC truncates a replaced or deleted file
+    # in place, which would cut every folder sharing its inode. A reflink
+    # shares the blocks copy-on-write, where the filesystem supports it.
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass  # Not a reflink filesystem, or another one.
+    shutil.copyfile(source, target)
+
+
+async def gather_or_cancel(*coroutines):
+    # The first failure cancels the other downloads.
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class FolderDownload:
+    """Fills a staging folder with the files of a folder plan.
+
+    Files found locally are copied, the others are fetched from the peer in
+    ``REPLICATION_PART_BYTES`` ranges, ``REPLICATION_CONNECTIONS`` at once
+    across the files, each bound to the manifest ``ETag`` by ``If-Range``.
+    A part cut short is resumed from where it stopped. Fetched files are
+    checked against the manifest sha256 before the folder is committed.
+    """
+
+    def __init__(self, plan: Dict, peer: str, staging: Path):
+        self.plan = plan
+        self.peer = peer
+        self.staging = staging
+        self.fetched = 0
+        self.digests: Dict[str, Tuple[str, int]] = {}
+
+    async def run(self):
+        model = self.plan["model"]
+        self.staging.mkdir(parents=True, exist_ok=True)
+        sha256 = {
+            entry["name"]: entry["sha256"] for entry in self.plan["manifest"]["files"]
+        }
+        for name, (path, crc32) in self.plan["local"].items():
+            await asyncio.to_thread(clone_or_copy, path, self.staging / name)
+            self.digests[name] = (sha256[name], crc32)
+            REPLICATED_BYTES.inc(os.stat(path).st_size, source="local")
+
+        semaphore = asyncio.Semaphore(get_replication_connections())
+        async with peer_client(
+            limits=httpx.Limits(max_connections=get_replication_connections())
+        ) as client:
+            await gather_or_cancel(
+                *(
+                    self.download(client, semaphore, entry)
+                    for entry in self.plan["fetch"]
+                )
+            )
+        REPLICATION_LOG.info(
+            f"Synced '{model}' from '{self.peer}': {len(self.plan['local'])} files "
+            f"local, {len(self.plan['fetch'])} files and {self.fetched} bytes fetched."
+        )
+
+    async def download(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, entry: Dict
+    ):
+        name, size = entry["name"], entry["size"]
+        url = (
+            f"{self.peer}model/{quote(self.plan['model'], safe='')}/files/"
+            f"{quote(name)}"
+        )
+        etag = f'"{entry["sha256"]}"'
+        target = self.staging / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            part = get_replication_part_size()
+            await gather_or_cancel(
+                *(
+                    self.download_part(
+                        client,
+                        semaphore,
+                        url,
+                        etag,
+                        fd,
+                        start,
+                        min(start + part, size) - 1,
+                    )
+                    for start in range(0, size, part)
+                )
+            )
+            await asyncio.to_thread(os.fsync, fd)
+        finally:
+            os.close(fd)
+
+        with open(target, "rb") as file:
+            digest = await asyncio.to_thread(hash_file, file)
+        if digest[0] != entry["sha256"]:
+            raise SyncError(
+                f"'{name}' of '{self.plan['model']}' has sha256 {digest[0]}, "
+                f"the peer manifest says {entry['sha256']}."
+            )
+        self.digests[name] = digest
+
+    async def download_part(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        url: str,
+        etag: str,
+        fd: int,
+        start: int,
+        end: int,
+    ):
+        position, attempts = start, 0
+        async with semaphore:
+            while position <= end:
+                headers = {"Range": f"bytes={position}-{end}", "If-Range": etag}
+                try:
+                    async with client.stream("GET", url, headers=headers) as response:
+                        if response.status_code != 206:
+                            raise SyncError(
+                                f"Peer answered {response.status_code} to a range of "
+                                f"'{url}', the file changed or is gone."
+                            )
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            chunk = chunk[: end + 1 - position]
+                            await asyncio.to_thread(os.pwrite, fd, chunk, position)
+                            position += len(chunk)
+                            self.fetched += len(chunk)
+                            REPLICATED_BYTES.inc(len(chunk), source="peer")
+                except httpx.HTTPError as e:
+                    error = repr(e)
+                else:
+                    if position > end:
+                        break
+                    error = "The response ended early."
+                attempts += 1
+                if attempts >= PART_ATTEMPTS:
+                    raise SyncError(
+                        f"Fetch '{url}' failed at byte {position}. Details : {error}"
+                    )
+                REPLICATION_LOG.warning(
+                    f"Resume '{url}' at byte {position}, attempt {attempts}. "
+                    f"Details : {error}"
+                )
+                await asyncio.sleep(attempts)
+
+
+def split_targets(targets: List[str], fanout: int) -> List[Tuple[str, List[str]]]:
+    # The first targets are seeded by this node, each seeds a share of the rest.
+    children = targets[:fanout]
+    rest = targets[fanout:]
+    return [
+        (child, rest[index :: len(children)]) for index, child in enumerate(children)
+    ]
+
+
+async def seed_target(
+    peer: str,
+    target: str,
+    model: str,
+    model_name_on_ollama: Optional[str],
+    targets: List[str],
+    fanout: int,
+) -> Dict:
+    # Asks target to sync from this node, and waits for its subtree.
+    payload = {
+        "model": model,
+        "peer": peer,
+        "model_name_on_ollama": model_name_on_ollama,
+        "targets": targets,
+        "fanout": fanout,
+    }
+    result = {"target": target, "status": None, "action": None, "details": {}}
+    timeout = httpx.Timeout(get_replication_timeout(), read=None)
+    try:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            async with client.stream(
+                "POST", target + "model/sync/", json=payload
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    result.update(
+                        status=response.status_code,
+                        action="Sync request rejected.",
+                        details={"response": body.decode(errors="replace")[:1000]},
+                    )
+                    return result
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        message = json.loads(line)
+                        result.update(
+                            status=message["status"],
+                            action=message["message"]["action"],
+                            details=message["message"]["details"],
+                        )
+    except Exception as e:
+        REPLICATION_LOG.warning(
+            f"Seed '{target}' with '{model}' failed. Details : {e!r}"
+        )
+        result.update(
+            status=502, action="Target not reachable.", details={"error": repr(e)}
+        )
+    return result
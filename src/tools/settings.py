@@ -0,0 +1,340 @@
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from utils import config_logger
+
+SETTINGS_LOG = config_logger(
+    file_name="settings.log",
+    write_mode="a",
+    level="info",
+    logger_name="settings_logger",
+)
+
+# Settings only read when the process starts, a reload keeps their old value.
+RESTART_REQUIRED = (
+    "MODEL_HANDLER_PORT",
+    "MODEL_HANDLER_WORKERS",
+    "UPLOAD_DIR",
+    "STATE_DIR",
+    "UPLOAD_SPOOL_DIR",
+    "STATE_BACKEND",
+    "INTERACTIVE_WORKERS",
+    "BULK_WORKERS",
+    "BACKGROUND_WORKERS",
+    "WEBHOOK_CONCURRENCY",
+)
+SECRETS = ("ADMIN_TOKEN", "WEBHOOK_SECRET")
+# Ollama keep_alive: seconds, or a Go duration such as "10m" or "1h30m".
+KEEP_ALIVE_PATTERN = r"^-?(\d+(\.\d+)?|(\d+(\.\d+)?(ns|us|ms|s|m|h))+)$"
+HOT_MODEL_PATTERN = re.compile(r"^([^@\s]+)(@(\d\d):(\d\d)-(\d\d):(\d\d))?$")
+MODEL_SERVER_PATTERN = re.compile(r"^https?://[^/\s,=]+(/\S*)?$")
+
+
+class Settings(BaseModel):
+    """Configuration of the handler, validated once and then served from memory.
+
+    Fields are named after their environment variable. ``SETTINGS_FILE``
+    points to an optional file of ``NAME=value`` lines that overrides the
+    environment, and is read again on reload.
+    """
+
+    model_config = ConfigDict(frozen=True, populate_by_name=True)
+
+    MODEL_HANDLER_PORT: int = Field(default=5000, ge=1, le=65535)
+    MODEL_HANDLER_WORKERS: int = 1
+    UPLOAD_DIR: str = "/workspace/models/inno"
+    STATE_DIR: str = ""
+    UPLOAD_SPOOL_DIR: str = ""
+    STATE_BACKEND: str = ""
+    MODEL_SERVER_IP: str = "127.0.0.1"
+    MODEL_SERVER_PORT: int = Field(default=11434, ge=1, le=65535)
+    MODEL_SERVERS: str = ""
+    MODEL_SERVER_PLACEMENT: str = "least_loaded"
+    MODEL_SERVER_PINS: str = ""
+    MODEL_SERVER_HEALTH_INTERVAL: float = Field(default=10, gt=0)
+    DISK_HEADROOM_BYTES: int = Field(default=1024 * 1024 * 1024, ge=0)
+    DISK_QUOTA_BYTES: int = Field(default=0, ge=0)
+    OLLAMA_MODELS_DIR: str = ""
+    DISK_EVICTION: bool = False
+    PINNED_MODELS: str = ""
+    ADMISSION_QUEUE_TIMEOUT: float = Field(default=0, ge=0)
+    ZIP_RETENTION: str = "hours"
+    ZIP_RETENTION_HOURS: float = Field(default=24, ge=0)
+    GC_INTERVAL: float = Field(default=600, gt=0)
+    GC_IO_BUDGET: int = Field(default=256 * 1024 * 1024, gt=0)
+    INGEST_IO_MODE: str = "dontneed"
+    INGEST_SYNC_BYTES: int = Field(default=64 * 1024 * 1024, gt=0)
+    INGEST_FSYNC: bool = True
+    INGEST_QUEUE_DEPTH: int = 4
+    INGEST_MAX_CHUNK_BYTES: int = Field(default=16 * 1024 * 1024, gt=0)
+    SAVE_CONCURRENCY: int = 4
+    EXTRACT_CONCURRENCY: int = 2
+    CREATE_CONCURRENCY: int = 1
+    INTERACTIVE_WORKERS: int = 4
+    BULK_WORKERS: int = 8
+    BACKGROUND_WORKERS: int = 1
+    INSTANCE_TIMEOUT: float = Field(default=30, gt=0)
+    TASK_RETENTION_HOURS: float = Field(default=24, gt=0)
+    TASK_TRACES: bool = True
+    ADMIN_TOKEN: Optional[str] = None
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_MAX_ATTEMPTS: int = Field(default=8, ge=1)
+    WEBHOOK_TIMEOUT: float = Field(default=10, gt=0)
+    WEBHOOK_CONCURRENCY: int = Field(default=16, ge=1)
+    WARMUP_ON_DEPLOY: bool = False
+    WARMUP_KEEP_ALIVE: str = Field(default="5m", pattern=KEEP_ALIVE_PATTERN)
+    WARMUP_TIMEOUT: float = Field(default=300, gt=0)
+    HOT_MODELS: str = ""
+    HOT_MODELS_KEEP_ALIVE: str = Field(default="15m", pattern=KEEP_ALIVE_PATTERN)
+    HOT_MODELS_INTERVAL: float = Field(default=60, gt=0)
+    HOT_RECENT_MODELS: int = Field(default=0, ge=0)
+    HOT_RECENT_HOURS: float = Field(default=24, gt=0)
+    INVENTORY_TTL: float = Field(default=5, gt=0)
+    PEER_URL: str = ""
+    REPLICATION_CONNECTIONS: int = Field(default=4, ge=1)
+    REPLICATION_PART_BYTES: int = Field(default=64 * 1024 * 1024, gt=0)
+    REPLICATION_FANOUT: int = Field(default=2, ge=1)
+    REPLICATION_TIMEOUT: float = Field(default=300, gt=0)
+
+    @field_validator(
+        "MODEL_HANDLER_WORKERS",
+        "INGEST_QUEUE_DEPTH",
+        "SAVE_CONCURRENCY",
+        "EXTRACT_CONCURRENCY",
+        "CREATE_CONCURRENCY",
+        "INTERACTIVE_WORKERS",
+        "BULK_WORKERS",
+        "BACKGROUND_WORKERS",
+    )
+    @classmethod
+    def at_least_one(cls, value: int) -> int:
+        return max(value, 1)
+
+    @field_validator(
+        "STATE_BACKEND", "ZIP_RETENTION", "INGEST_IO_MODE", "MODEL_SERVER_PLACEMENT"
+    )
+    @classmethod
+    def lower(cls, value: str) -> str:
+        return value.lower()
+
+    @field_validator("ADMIN_TOKEN", "WEBHOOK_SECRET")
+    @classmethod
+    def empty_is_unset(cls, value: Optional[str]) -> Optional[str]:
+        return value or None
+
+    @model_validator(mode="after")
+    def check(self) -> "Settings":
+        if not os.path.exists(self.UPLOAD_DIR):
+            raise ValueError(f"Models folder '{self.UPLOAD_DIR}' not found.")
+        if self.OLLAMA_MODELS_DIR and not os.path.isdir(self.OLLAMA_MODELS_DIR):
+            raise ValueError(
+                f"Ollama models folder '{self.OLLAMA_MODELS_DIR}' not found."
+            )
+        if self.STATE_BACKEND not in ("", "memory", "sqlite"):
+            raise ValueError(f"Unsupported state backend '{self.STATE_BACKEND}'.")
+        if self.ZIP_RETENTION not in ("delete", "hours", "until_create"):
+            raise ValueError(
+                f"Unsupported zip retention policy '{self.ZIP_RETENTION}'."
+            )
+        if self.INGEST_IO_MODE not in ("buffered", "dontneed", "direct"):
+            raise ValueError(f"Unsupported ingest io mode '{self.INGEST_IO_MODE}'.")
+        if self.PEER_URL and not self.PEER_URL.startswith(("http://", "https://")):
+            raise ValueError(f"Peer url '{self.PEER_URL}' must be an http(s) url.")
+        if self.MODEL_SERVER_PLACEMENT not in ("least_loaded", "pinned", "all"):
+            raise ValueError(
+                f"Unsupported model server placement '{self.MODEL_SERVER_PLACEMENT}'."
+            )
+        self.hot_models  # Parsed once here, so a bad entry fails the load.
+        self.model_server_pins
+        return self
+
+    @property
+    def state_folder(self) -> str:
+        return self.STATE_DIR or os.path.join(self.UPLOAD_DIR, ".model_handler")
+
+    @property
+    def spool_folder(self) -> str:
+        return self.UPLOAD_SPOOL_DIR or os.path.join(self.state_folder, "spool")
+
+    @property
+    def trash_folder(self) -> str:
+        return os.path.join(self.UPLOAD_DIR, ".trash")
+
+    @property
+    def state_backend(self) -> str:
+        # Multi-worker deployments must share state through the models volume.
+        if self.STATE_BACKEND:
+            return self.STATE_BACKEND
+        return "sqlite" if self.MODEL_HANDLER_WORKERS > 1 else "memory"
+
+    @property
+    def model_server_url(self) -> str:
+        return f"http://{self.MODEL_SERVER_IP}:{self.MODEL_SERVER_PORT}/"
+
+    @property
+    def model_servers(self) -> List[Tuple[str, str]]:
+        # "name=url" or "url" entries, MODEL_SERVER_IP:PORT alone when empty.
+        servers = []
+        for entry in self.MODEL_SERVERS.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, url = "", entry
+            if "=" in entry and "://" not in entry.split("=", 1)[0]:
+                name, url = (part.strip() for part in entry.split("=", 1))
+            if "://" not in url:
+                url = "http://" + url
+            if not MODEL_SERVER_PATTERN.match(url):
+                raise ValueError(f"Invalid model server '{entry}'.")
+            url = url.rstrip("/") + "/"
+            name = name or url.split("://", 1)[1].rstrip("/")
+            if name in dict(servers):
+                raise ValueError(f"Duplicate model server '{name}'.")
+            servers.append((name, url))
+        return servers or [("default", self.model_server_url)]
+
+    @property
+    def model_server_pins(self) -> Dict[str, str]:
+        # "folder=server" entries, for the pinned placement.
+        servers = dict(self.model_servers)
+        pins = {}
+        for entry in self.MODEL_SERVER_PINS.split(","):
+            if not entry.strip():
+                continue
+            folder, _, server = (part.strip() for part in entry.partition("="))
+            if not folder or server not in servers:
+                raise ValueError(
+                    f"Invalid model server pin '{entry.strip()}', expected "
+                    "folder=server of MODEL_SERVERS."
+                )
+            pins[folder] = server
+        return pins
+
+    @property
+    def peer_url(self) -> str:
+        return self.PEER_URL and self.PEER_URL.rstrip("/") + "/"
+
+    @property
+    def pinned_models(self) -> List[str]:
+        return [name.strip() for name in self.PINNED_MODELS.split(",") if name.strip()]
+
+    @property
+    def hot_models(self) -> List[Tuple[str, Optional[Tuple[int, int]]]]:
+        # "name" or "name@HH:MM-HH:MM", the window in minutes of the local day.
+        entries = []
+        for entry in self.HOT_MODELS.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            match = HOT_MODEL_PATTERN.match(entry)
+            if match is None:
+                raise ValueError(
+                    f"Invalid hot model '{entry}', expected name or name@HH:MM-HH:MM."
+                )
+            window = None
+            if match.group(2):
+                hours = [int(match.group(index)) for index in range(3, 7)]
+                if hours[0] > 23 or hours[2] > 23 or hours[1] > 59 or hours[3] > 59:
+                    raise ValueError(f"Invalid time window in hot model '{entry}'.")
+                window = (hours[0] * 60 + hours[1], hours[2] * 60 + hours[3])
+            entries.append((match.group(1), window))
+        return entries
+
+    def public(self) -> Dict:
+        # Settings as reported by the admin endpoints.
+        return {
+            name: "***" if name in SECRETS and value else value
+            for name, value in self.model_dump().items()
+        }
+
+
+def read_settings_file(path: str) -> Dict[str, str]:
+    values = {}
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, sep, value = line.partition("=")
+            if not sep:
+                raise ValueError(f"'{path}' line {number}: expected NAME=value.")
+            values[name.strip()] = value.strip().strip("'\"")
+    return values
+
+
+def read_settings(environ: Mapping[str, str] = os.environ) -> Settings:
+    values = {name: environ[name] for name in Settings.model_fields if name in environ}
+    settings_file = environ.get("SETTINGS_FILE")
+    if settings_file:
+        values.update(read_settings_file(settings_file))
+    unknown = set(values) - set(Settings.model_fields)
+    if unknown:
+        raise ValueError(f"Unknown settings {sorted(unknown)} in '{settings_file}'.")
+    return Settings(**values)
+
+
+def make_folders(settings: Settings):
+    # Made once at startup, their settings are kept on reload.
+    for folder in (settings.state_folder, settings.spool_folder, settings.trash_folder):
+        os.makedirs(folder, exist_ok=True)
+
+
+_SETTINGS: Optional[Settings] = None
+_SETTINGS_LOCK = threading.Lock()
+_LISTENERS: List[Callable[[Settings], None]] = []
+
+
+def get_settings() -> Settings:
+    # Loaded on first use, then swapped as a whole by reload_settings.
+    global _SETTINGS
+    settings = _SETTINGS
+    if settings is None:
+        with _SETTINGS_LOCK:
+            if _SETTINGS is None:
+                _SETTINGS = read_settings()
+            settings = _SETTINGS
+    return settings
+
+
+def on_reload(listener: Callable[[Settings], None]):
+    # Called with the new settings after each reload that changed something.
+    _LISTENERS.append(listener)
+
+
+def reload_settings() -> Dict:
+    """Read the settings again and swap them in if they are all valid.
+
+    Raises on an invalid value, the running settings then stay in place.
+    Settings in ``RESTART_REQUIRED`` keep their value until a restart.
+    """
+    global _SETTINGS
+    with _SETTINGS_LOCK:
+        current = _SETTINGS or read_settings()
+        loaded = read_settings()
+        restart_required = [
+            name
+            for name in RESTART_REQUIRED
+            if getattr(loaded, name) != getattr(current, name)
+        ]
+        new = loaded.model_copy(
+            update={name: getattr(current, name) for name in RESTART_REQUIRED}
+        )
+        old, old_public, new_public = (
+            current.model_dump(),
+            current.public(),
+            new.public(),
+        )
+        changed = {
+            name: {"old": old_public[name], "new": new_public[name]}
+            for name, value in new.model_dump().items()
+            if value != old[name]
+        }
+        _SETTINGS = new
+    if changed:
+        for listener in _LISTENERS:
+            listener(new)
+    return {"changed": changed, "restart_required": restart_required}
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from tools.connect import (
+    get_create_concurrency,
+    get_extract_concurrency,
+    get_model_servers,
+    get_save_concurrency,
+)
+from tools.settings import on_reload
+
+from .metrics import REGISTRY, STAGE_WAIT_SECONDS
+
+STAGE_SAVE = "save"
+STAGE_EXTRACT = "extract"
+STAGE_CREATE = "create"
+# Timed in /metrics, but not limited.
+STAGE_VALIDATE = "validate"
+STAGE_DELETE = "delete"
+STAGE_WARMUP = "warmup"
+STAGE_SYNC = "sync"
+
+POLL_INTERVAL = 0.05
+
+
+class StageLimiter:
+    """Caps how many tasks run each deploy stage at once in this worker.
+
+    Saves compete for disk bandwidth, extractions for disk and CPU, creates
+    for the model servers, ``CREATE_CONCURRENCY`` for each of them. Every
+    task runs on its own event loop, so the slots are counted under a thread
+    lock and polled without blocking the loop. The limits follow a settings reload: a lowered limit lets the
+    running stages finish and holds the next ones back.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.resize()
+        self.running = {stage: 0 for stage in self.limits}
+        self.waiting = {stage: 0 for stage in self.limits}
+
+    def resize(self, *_):
+        with self.lock:
+            self.limits = {
+                STAGE_SAVE: get_save_concurrency(),
+                STAGE_EXTRACT: get_extract_concurrency(),
+                STAGE_CREATE: get_create_concurrency() * len(get_model_servers()),
+            }
+
+    def _count(self, counter: Dict[str, int], stage: str, delta: int):
+        with self.lock:
+            counter[stage] += delta
+
+    def _acquire(self, stage: str) -> bool:
+        with self.lock:
+            if self.running[stage] >= self.limits[stage]:
+                return False
+            self.running[stage] += 1
+            return True
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        self._count(self.waiting, stage, 1)
+        start = time.perf_counter()
+        try:
+            while not self._acquire(stage):
+                await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            self._count(self.waiting, stage, -1)
+            STAGE_WAIT_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        try:
+            yield
+        finally:
+            self._count(self.running, stage, -1)
+
+    def status(self) -> Dict:
+        with self.lock:
+            return {
+                stage: {
+                    "limit": limit,
+                    "running": self.running[stage],
+                    "waiting": self.waiting[stage],
+                }
+                for stage, limit in self.limits.items()
+            }
+
+
+STAGE_LIMITER = StageLimiter()
+on_reload(STAGE_LIMITER.resize)
+
+
+def _stage_samples(field: str):
+    return [
+        ((stage,), status[field]) for stage, status in STAGE_LIMITER.status().items()
+    ]
+
+
+REGISTRY.gauge(
+    "model_handler_stage_running",
+    "Tasks running each limited stage.",
+    ("stage",),
+    lambda: _stage_samples("running"),
+)
+REGISTRY.gauge(
+    "model_handler_stage_waiting",
+    "Tasks waiting for a slot of each limited stage.",
+    ("stage",),
+    lambda: _stage_samples("waiting"),
+)
+REGISTRY.gauge(
+    "model_handler_stage_limit",
+    "Concurrency limit of each stage.",
+    ("stage",),
+    lambda: _stage_samples("limit"),
+)
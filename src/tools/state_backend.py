@@ -0,0 +1,762 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+from tools.connect import (
+    get_instance_timeout,
+    get_state_backend_name,
+    get_state_folder,
+    get_task_retention_hours,
+)
+from tools.settings import SETTINGS_LOG, reload_settings
+from utils import config_logger, get_uuid
+
+from .metrics import MODEL_LOCKS, REGISTRY
+
+STATE_LOG = config_logger(
+    file_name="state.log",
+    write_mode="a",
+    level="info",
+    logger_name="state_backend_logger",
+)
+
+TASK_RUNNING = "running"
+TASK_SUCCESS = "success"
+TASK_FAILED = "failed"
+TASK_CANCELLED = "cancelled"
+TASK_FINISHED = (TASK_SUCCESS, TASK_FAILED, TASK_CANCELLED)
+HOST = socket.gethostname()
+
+
+class StateBackend(ABC):
+    """Holds model locks, task records and progress events.
+
+    Every method must be safe to call from any thread, since each task runs
+    in its own event loop on a ``TaskExecutor`` thread.
+    """
+
+    # Model locks
+    @abstractmethod
+    def acquire_model(self, model: str, owner: str) -> bool: ...
+
+    @abstractmethod
+    def release_model(self, model: str, owner: str):
+        """Release a model lock, only if still held by ``owner``."""
+
+    @abstractmethod
+    def model_owner(self, model: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def list_models(self) -> Dict[str, str]: ...
+
+    # Task records
+    @abstractmethod
+    def create_task(self, uuid: str, action: str, details: Dict): ...
+
+    @abstractmethod
+    def update_task(
+        self, uuid: str, status: Optional[str] = None, progress: Optional[float] = None
+    ): ...
+
+    @abstractmethod
+    def get_task(self, uuid: str) -> Optional[Dict]: ...
+
+    # Progress events
+    @abstractmethod
+    def append_event(self, uuid: str, event: Dict): ...
+
+    @abstractmethod
+    def get_events(self, uuid: str, after: int = 0) -> List[Tuple[int, Dict]]: ...
+
+    # Disk reservations
+    @abstractmethod
+    def reserve_space(self, uuid: str, model: str, size: int, capacity: int) -> bool:
+        """Reserve ``size`` bytes if all reservations still fit in ``capacity``."""
+
+    @abstractmethod
+    def update_reservation(self, uuid: str, size: int): ...
+
+    @abstractmethod
+    def release_space(self, uuid: str): ...
+
+    @abstractmethod
+    def list_reservations(self) -> List[Dict]: ...
+
+    # Cancellation
+    @abstractmethod
+    def request_cancel(self, uuid: str) -> bool:
+        """Flag a running task to stop, False if it is unknown or finished."""
+
+    @abstractmethod
+    def cancel_requested(self, uuid: str) -> bool: ...
+
+    @abstractmethod
+    def add_subscriber(self, uuid: str, delta: int) -> int:
+        """Count the progress streams of a task, returns the new count."""
+
+    # Settings
+    @abstractmethod
+    def publish_settings(self) -> int:
+        """Have the other workers reload, returns the new settings generation."""
+
+    @abstractmethod
+    def settings_generation(self) -> int: ...
+
+    def follow_settings(self):
+        # Reload when another worker published settings since the last look.
+        generation = self.settings_generation()
+        if generation == self.settings_seen:
+            return
+        self.settings_seen = generation
+        try:
+            result = reload_settings()
+        except Exception as e:
+            SETTINGS_LOG.error(
+                f"Reload published settings failed, keep the running ones. Details : {e}"
+            )
+            return
+        SETTINGS_LOG.info(f"Reload published settings. Details : {result}")
+
+    # Housekeeping
+    @abstractmethod
+    def prune_tasks(self, before: float) -> int:
+        """Forget the tasks finished before ``before`` and their events."""
+
+    def heartbeat(self):
+        # Only a shared backend outlives the workers writing to it.
+        pass
+
+    def reap(self):
+        """Release what dead instances held and fail their running tasks."""
+        pass
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self._loop, name="state_backend", daemon=True
+        )
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.heartbeat()
+                self.reap()
+                pruned = self.prune_tasks(
+                    time.time() - get_task_retention_hours() * 3600
+                )
+                if pruned:
+                    STATE_LOG.info(f"Pruned {pruned} finished tasks.")
+                self.follow_settings()
+            except Exception as e:
+                STATE_LOG.error(f"State backend housekeeping failed. Details : {e}")
+            time.sleep(get_instance_timeout() / 3)
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend, only correct with a single worker."""
+
+    def __init__(self):
+        self.thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._models: Dict[str, str] = {}
+        self._tasks: Dict[str, Dict] = {}
+        self._events: Dict[str, List[Dict]] = defaultdict(list)
+        self._reservations: Dict[str, Dict] = {}
+        self._cancels: Dict[str, float] = {}
+        self._subscribers: Dict[str, int] = defaultdict(int)
+        self._settings_generation = 0
+        self.settings_seen = 0
+
+    def acquire_model(self, model: str, owner: str) -> bool:
+        with self._lock:
+            current = self._models.get(model)
+            if current is not None and current != owner:
+                return False
+            self._models[model] = owner
+            return True
+
+    def release_model(self, model: str, owner: str):
+        with self._lock:
+            if self._models.get(model) == owner:
+                self._models.pop(model, None)
+
+    def model_owner(self, model: str) -> Optional[str]:
+        return self._models.get(model)
+
+    def list_models(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._models)
+
+    def create_task(self, uuid: str, action: str, details: Dict):
+        now = time.time()
+        with self._lock:
+            self._tasks[uuid] = {
+                "uuid": uuid,
+                "action": action,
+                "status": TASK_RUNNING,
+                "progress": 0,
+                "details": details,
+                "created": now,
+                "updated": now,
+            }
+
+    def update_task(
+        self, uuid: str, status: Optional[str] = None, progress: Optional[float] = None
+    ):
+        with self._lock:
+            task = self._tasks.get(uuid)
+            if task is None:
+                return
+            if status is not None:
+                task["status"] = status
+            if progress is not None:
+                task["progress"] = progress
+            task["updated"] = time.time()
+
+    def get_task(self, uuid: str) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(uuid)
+            return dict(task) if task else None
+
+    def append_event(self, uuid: str, event: Dict):
+        with self._lock:
+            self._events[uuid].append(event)
+
+    def get_events(self, uuid: str, after: int = 0) -> List[Tuple[int, Dict]]:
+        with self._lock:
+            events = self._events.get(uuid, [])
+            return [(seq, events[seq - 1]) for seq in range(after + 1, len(events) + 1)]
+
+    def reserve_space(self, uuid: str, model: str, size: int, capacity: int) -> bool:
+        with self._lock:
+            reserved = sum(item["size"] for item in self._reservations.values())
+            if reserved + size > capacity:
+                return False
+            self._reservations[uuid] = {
+                "uuid": uuid,
+                "model": model,
+                "size": size,
+                "created": time.time(),
+            }
+            return True
+
+    def update_reservation(self, uuid: str, size: int):
+        with self._lock:
+            if uuid in self._reservations:
+                self._reservations[uuid]["size"] = size
+
+    def release_space(self, uuid: str):
+        with self._lock:
+            self._reservations.pop(uuid, None)
+
+    def list_reservations(self) -> List[Dict]:
+        with self._lock:
+            return [dict(item) for item in self._reservations.values()]
+
+    def request_cancel(self, uuid: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(uuid)
+            if task is None or task["status"] in TASK_FINISHED:
+                return False
+            self._cancels[uuid] = time.time()
+            return True
+
+    def cancel_requested(self, uuid: str) -> bool:
+        with self._lock:
+            return uuid in self._cancels
+
+    def add_subscriber(self, uuid: str, delta: int) -> int:
+        with self._lock:
+            self._subscribers[uuid] = max(self._subscribers[uuid] + delta, 0)
+            count = self._subscribers[uuid]
+            if count == 0:
+                del self._subscribers[uuid]
+            return count
+
+    def prune_tasks(self, before: float) -> int:
+        with self._lock:
+            expired = [
+                uuid
+                for uuid, task in self._tasks.items()
+                if task["status"] in TASK_FINISHED and task["updated"] < before
+            ]
+            for uuid in expired:
+                del self._tasks[uuid]
+                self._events.pop(uuid, None)
+                self._cancels.pop(uuid, None)
+            return len(expired)
+
+    def publish_settings(self) -> int:
+        with self._lock:
+            self._settings_generation += 1
+            self.settings_seen = self._settings_generation
+            return self._settings_generation
+
+    def settings_generation(self) -> int:
+        return self._settings_generation
+
+
+class SQLiteStateBackend(StateBackend):
+    """Backend stored in a SQLite file on the shared models volume.
+
+    SQLite's own file locking serialises writers, so every uvicorn worker (or
+    every container mounting the same volume) sees the same locks and tasks.
+    Each instance keeps a heartbeat: the locks and disk reservations of an
+    instance that stopped beating for ``INSTANCE_TIMEOUT``, or whose process
+    is gone from this host, are released and its running tasks marked failed.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.instance = get_uuid()
+        self.thread: Optional[threading.Thread] = None
+        # One connection per thread, opened on its first query.
+        self.local = threading.local()
+        with self._connect() as conn:
+            # Readers no longer wait for a writer, nor writers for readers.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS model_lock (
+                    model TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    pid INTEGER,
+                    created REAL,
+                    instance TEXT
+                );
+                CREATE TABLE IF NOT EXISTS task (
+                    uuid TEXT PRIMARY KEY,
+                    action TEXT,
+                    status TEXT,
+                    progress REAL,
+                    details TEXT,
+                    created REAL,
+                    updated REAL,
+                    instance TEXT
+                );
+                CREATE TABLE IF NOT EXISTS task_event (
+                    uuid TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (uuid, seq)
+                );
+                CREATE TABLE IF NOT EXISTS disk_reservation (
+                    uuid TEXT PRIMARY KEY,
+                    model TEXT,
+                    size INTEGER NOT NULL,
+                    created REAL,
+                    instance TEXT
+                );
+                CREATE TABLE IF NOT EXISTS task_control (
+                    uuid TEXT PRIMARY KEY,
+                    subscribers INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested REAL
+                );
+                CREATE TABLE IF NOT EXISTS instance (
+                    instance TEXT PRIMARY KEY,
+                    host TEXT,
+                    pid INTEGER,
+                    heartbeat REAL
+                );
+                CREATE TABLE IF NOT EXISTS settings_generation (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    generation INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS task_updated ON task (status, updated);
+                """)
+            for table in (
+                "model_lock",
+                "task",
+                "disk_reservation",
+            ):  # State files of earlier versions.
+                columns = [
+                    row["name"] for row in conn.execute(f"PRAGMA table_info({table})")
+                ]
+                if "instance" not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN instance TEXT")
+        # The settings just read at startup are the published ones.
+        self.settings_seen = self.settings_generation()
+        self.heartbeat()
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None
+            )
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return ReusedConnection(conn)
+
+    def acquire_model(self, model: str, owner: str) -> bool:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT owner FROM model_lock WHERE model = ?", (model,)
+            ).fetchone()
+            if row is not None and row["owner"] != owner:
+                # Held by someone else, unless its instance is dead.
+                self._reap(conn)
+                row = conn.execute(
+                    "SELECT owner FROM model_lock WHERE model = ?", (model,)
+                ).fetchone()
+                if row is not None and row["owner"] != owner:
+                    conn.execute("COMMIT")
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO model_lock VALUES (?, ?, ?, ?, ?)",
+                (model, owner, os.getpid(), time.time(), self.instance),
+            )
+            conn.execute("COMMIT")
+            return True
+
+    def release_model(self, model: str, owner: str):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM model_lock WHERE model = ? AND owner = ?", (model, owner)
+            )
+
+    def model_owner(self, model: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner FROM model_lock WHERE model = ?", (model,)
+            ).fetchone()
+        return row["owner"] if row else None
+
+    def list_models(self) -> Dict[str, str]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT model, owner FROM model_lock").fetchall()
+        return {row["model"]: row["owner"] for row in rows}
+
+    def create_task(self, uuid: str, action: str, details: Dict):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    uuid,
+                    action,
+                    TASK_RUNNING,
+                    0,
+                    json.dumps(details),
+                    now,
+                    now,
+                    self.instance,
+                ),
+            )
+
+    def update_task(
+        self, uuid: str, status: Optional[str] = None, progress: Optional[float] = None
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE task SET status = COALESCE(?, status), "
+                "progress = COALESCE(?, progress), updated = ? WHERE uuid = ?",
+                (status, progress, time.time(), uuid),
+            )
+
+    def get_task(self, uuid: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM task WHERE uuid = ?", (uuid,)).fetchone()
+        if row is None:
+            return None
+        task = dict(row)
+        task.pop("instance")
+        task["details"] = json.loads(task["details"] or "{}")
+        return task
+
+    def append_event(self, uuid: str, event: Dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO task_event SELECT ?, COALESCE(MAX(seq), 0) + 1, ? "
+                "FROM task_event WHERE uuid = ?",
+                (uuid, json.dumps(event), uuid),
+            )
+
+    def get_events(self, uuid: str, after: int = 0) -> List[Tuple[int, Dict]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, event FROM task_event WHERE uuid = ? AND seq > ? "
+                "ORDER BY seq",
+                (uuid, after),
+            ).fetchall()
+        return [(row["seq"], json.loads(row["event"])) for row in rows]
+
+    def reserve_space(self, uuid: str, model: str, size: int, capacity: int) -> bool:
+        reserved = "SELECT COALESCE(SUM(size), 0) FROM disk_reservation"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(reserved).fetchone()[0] + size > capacity:
+                # Unless dead instances still hold the space.
+                self._reap(conn)
+                if conn.execute(reserved).fetchone()[0] + size > capacity:
+                    conn.execute("COMMIT")
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO disk_reservation VALUES (?, ?, ?, ?, ?)",
+                (uuid, model, size, time.time(), self.instance),
+            )
+            conn.execute("COMMIT")
+            return True
+
+    def update_reservation(self, uuid: str, size: int):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE disk_reservation SET size = ? WHERE uuid = ?", (size, uuid)
+            )
+
+    def release_space(self, uuid: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM disk_reservation WHERE uuid = ?", (uuid,))
+
+    def list_reservations(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT uuid, model, size, created FROM disk_reservation "
+                "ORDER BY created"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def request_cancel(self, uuid: str) -> bool:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT status FROM task WHERE uuid = ?", (uuid,)
+            ).fetchone()
+            if row is None or row["status"] in TASK_FINISHED:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO task_control (uuid, cancel_requested) VALUES (?, ?) "
+                "ON CONFLICT (uuid) DO UPDATE SET cancel_requested = excluded.cancel_requested",
+                (uuid, time.time()),
+            )
+            conn.execute("COMMIT")
+            return True
+
+    def cancel_requested(self, uuid: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cancel_requested FROM task_control WHERE uuid = ?", (uuid,)
+            ).fetchone()
+        return row is not None and row["cancel_requested"] is not None
+
+    def add_subscriber(self, uuid: str, delta: int) -> int:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO task_control (uuid, subscribers) VALUES (?, MAX(?, 0)) "
+                "ON CONFLICT (uuid) DO UPDATE SET subscribers = MAX(subscribers + ?, 0)",
+                (uuid, delta, delta),
+            )
+            count = conn.execute(
+                "SELECT subscribers FROM task_control WHERE uuid = ?", (uuid,)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+            return count
+
+    def heartbeat(self):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO instance VALUES (?, ?, ?, ?)",
+                (self.instance, HOST, os.getpid(), time.time()),
+            )
+
+    def reap(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reap(conn)
+            conn.execute("COMMIT")
+
+    def _reap(self, conn: sqlite3.Connection):
+        # In a write transaction. Locks, disk reservations and running tasks
+        # are released when their instance is dead, or unknown, as after an
+        # earlier version.
+        expire = time.time() - get_instance_timeout()
+        dead = [
+            row["instance"]
+            for row in conn.execute(
+                "SELECT * FROM instance WHERE instance != ?", (self.instance,)
+            )
+            if row["heartbeat"] < expire
+            or (row["host"] == HOST and not pid_alive(row["pid"]))
+        ]
+        conn.executemany(
+            "DELETE FROM instance WHERE instance = ?", [(item,) for item in dead]
+        )
+        orphaned = "instance IS NULL OR instance NOT IN (SELECT instance FROM instance)"
+        locks = conn.execute(f"DELETE FROM model_lock WHERE {orphaned}").rowcount
+        conn.execute(f"DELETE FROM disk_reservation WHERE {orphaned}")
+        tasks = conn.execute(
+            f"UPDATE task SET status = ?, updated = ? WHERE status = ? AND ({orphaned})",
+            (TASK_FAILED, time.time(), TASK_RUNNING),
+        ).rowcount
+        if locks or tasks:
+            STATE_LOG.warning(
+                f"Took over {locks} locks and failed {tasks} tasks of dead instances {dead}."
+            )
+
+    def prune_tasks(self, before: float) -> int:
+        expired = "SELECT uuid FROM task WHERE status IN (?, ?, ?) AND updated < ?"
+        params = (*TASK_FINISHED, before)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DELETE FROM task_event WHERE uuid IN ({expired})", params)
+            conn.execute(f"DELETE FROM task_control WHERE uuid IN ({expired})", params)
+            pruned = conn.execute(
+                "DELETE FROM task WHERE status IN (?, ?, ?) AND updated < ?", params
+            ).rowcount
+            conn.execute("COMMIT")
+        return pruned
+
+    def publish_settings(self) -> int:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO settings_generation VALUES (0, 0)")
+            conn.execute(
+                "UPDATE settings_generation SET generation = generation + 1 WHERE id = 0"
+            )
+            generation = conn.execute(
+                "SELECT generation FROM settings_generation WHERE id = 0"
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        self.settings_seen = generation
+        return generation
+
+    def settings_generation(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT generation FROM settings_generation WHERE id = 0"
+            ).fetchone()
+        return row[0] if row else 0
+
+
+class ClosingConnection:
+    # sqlite3.Connection's context manager commits but never closes.
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self.conn.close()
+
+
+class ReusedConnection:
+    # Like ClosingConnection, for a connection kept open by its thread.
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Alive under another user, or unknown.
+    return True
+
+
+class ModelStatus(Mapping):
+    """Read-only view of the model locks, kept for the ``MODEL_STATUS`` callers.
+
+    Locks are only taken and dropped through ``acquire`` and ``release``,
+    which never take over or drop the lock of another owner.
+    """
+
+    @property
+    def backend(self) -> StateBackend:
+        return get_state_backend()
+
+    def acquire(self, model: str, owner: str) -> bool:
+        acquired = self.backend.acquire_model(model, owner)
+        MODEL_LOCKS.inc(result="acquired" if acquired else "busy")
+        return acquired
+
+    def release(self, model: str, owner: str):
+        self.backend.release_model(model, owner)
+
+    def __getitem__(self, model: str) -> str:
+        owner = self.backend.model_owner(model)
+        if owner is None:
+            raise KeyError(model)
+        return owner
+
+    def __contains__(self, model: object) -> bool:
+        return isinstance(model, str) and self.backend.model_owner(model) is not None
+
+    def __iter__(self):
+        return iter(self.backend.list_models())
+
+    def __len__(self) -> int:
+        return len(self.backend.list_models())
+
+
+_STATE_BACKEND: Optional[StateBackend] = None
+_STATE_BACKEND_LOCK = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    global _STATE_BACKEND
+    with _STATE_BACKEND_LOCK:
+        if _STATE_BACKEND is None:
+            name = get_state_backend_name()
+            if name == "sqlite":
+                db_path = os.path.join(get_state_folder(), "state.db")
+                _STATE_BACKEND = SQLiteStateBackend(db_path)
+            elif name == "memory":
+                _STATE_BACKEND = MemoryStateBackend()
+            else:
+                raise ValueError(f"Unsupported state backend '{name}'.")
+            STATE_LOG.info(f"Use '{name}' state backend.")
+        return _STATE_BACKEND
+
+
+REGISTRY.gauge(
+    "model_handler_model_locks_held",
+    "Model locks held across the workers sharing the state backend.",
+    collect=lambda: [((), len(get_state_backend().list_models()))],
+)
+
+
+def reload_workers() -> Dict:
+    """Reload the settings of this worker, then publish them to the others.
+
+    Raises like ``reload_settings``, nothing is published then. The other
+    workers sharing the state backend reload on their next heartbeat.
+    """
+    result = reload_settings()
+    result["generation"] = get_state_backend().publish_settings()
+    return result
+
+
+def reload_on_signal(*_):
+    # SIGHUP handler, nobody waits for the answer so it is logged.
+    try:
+        result = reload_workers()
+    except Exception as e:
+        SETTINGS_LOG.error(
+            f"Reload settings failed, keep the running ones. Details : {e}"
+        )
+        return
+    SETTINGS_LOG.info(f"Reload settings. Details : {result}")
@@ -0,0 +1,173 @@
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from tools.connect import (
+    get_gc_interval,
+    get_gc_io_budget,
+    get_models_folder,
+    get_spool_folder,
+    get_trash_folder,
+    get_zip_retention,
+    get_zip_retention_hours,
+)
+from utils import config_logger, get_uuid
+
+from .ingest_journal import get_ingest_journal
+from .state_backend import ModelStatus
+from .task_lanes import LANE_BACKGROUND, get_lane
+
+GC_LOG = config_logger(
+    file_name="gc.log",
+    write_mode="a",
+    level="info",
+    logger_name="storage_gc_logger",
+)
+
+GC_LOCK = ".gc"
+SPOOL_STALE_SECONDS = 3600
+TEMP_PATTERNS = (".*.part", ".*.part.link", ".*.extract")
+
+
+class StorageGC:
+    """Background reclaimer of uploaded zips and other dead files.
+
+    Paths are removed under an I/O budget: large files are truncated step by
+    step before being unlinked, so a 40 GB zip never stalls the volume that
+    Ollama is serving from.
+    """
+
+    def __init__(self):
+        self.uuid = get_uuid()
+        self.model_status = ModelStatus()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self._loop, name="storage_gc", daemon=True
+        )
+        self.thread.start()
+
+    def schedule(self, path):
+        # Reclaim a path on the background lane instead of in the request task.
+        get_lane(LANE_BACKGROUND).run_in_background(
+            self._guard, self.remove, Path(path)
+        )
+
+    @staticmethod
+    def _guard(work: Callable, *args):
+        try:
+            work(*args)
+        except Exception as e:
+            GC_LOG.error(f"Storage GC {work.__name__} {args} failed. Details : {e}")
+
+    def _loop(self):
+        # Only the timer lives here, the work runs on the background lane.
+        lane = get_lane(LANE_BACKGROUND)
+        lane.run_in_background(self._guard, self.cleanup_orphans)
+        while True:
+            time.sleep(get_gc_interval())
+            lane.run_in_background(self._guard, self.sweep)
+
+    def _is_busy(self, zip_path: Path) -> bool:
+        return zip_path.name in self.model_status or zip_path.stem in self.model_status
+
+    def _zip_files(self):
+        root_path = Path(get_models_folder())
+        return [path for path in root_path.glob("*.zip") if path.is_file()]
+
+    def sweep(self):
+        if get_zip_retention() != "hours":
+            return
+        if not self.model_status.acquire(GC_LOCK, self.uuid):
+            return  # Another worker is sweeping.
+        try:
+            expire = time.time() - get_zip_retention_hours() * 3600
+            for zip_path in self._zip_files():
+                if self._is_busy(zip_path) or zip_path.stat().st_mtime > expire:
+                    continue
+                GC_LOG.info(f"Zip retention expired for '{zip_path.name}'.")
+                self.remove(zip_path)
+        finally:
+            self.model_status.release(GC_LOCK, self.uuid)
+
+    def cleanup_orphans(self):
+        # Truncated zips and temporary files left by a restart. Extractions
+        # are swapped in whole, a model folder is never half written.
+        if not self.model_status.acquire(GC_LOCK, self.uuid):
+            return
+        try:
+            for zip_path in self._zip_files():
+                if self._is_busy(zip_path):
+                    continue
+                if not zipfile.is_zipfile(zip_path):
+                    GC_LOG.warning(f"Remove partial upload '{zip_path.name}'.")
+                    self.remove(zip_path)
+
+            # Temporary names of ingests that are not journaled anymore. A sync
+            # is not journaled, the lock on its model tells it is running.
+            journal = get_ingest_journal()
+            for pattern in TEMP_PATTERNS:
+                for temp_path in Path(get_models_folder()).glob(pattern):
+                    if self._temp_busy(temp_path):
+                        continue
+                    if journal.get(self._temp_uuid(temp_path)) is None:
+                        GC_LOG.warning(f"Remove stale ingest '{temp_path.name}'.")
+                        self.remove(temp_path)
+
+            # Deleted folders whose reclaim was interrupted.
+            for trash_path in Path(get_trash_folder()).iterdir():
+                self.remove(trash_path)
+
+            # Spool files of requests that died with their process.
+            expire = time.time() - SPOOL_STALE_SECONDS
+            for spool_path in Path(get_spool_folder()).iterdir():
+                if spool_path.is_file() and spool_path.stat().st_mtime < expire:
+                    GC_LOG.warning(f"Remove stale spool file '{spool_path.name}'.")
+                    self.remove(spool_path)
+        finally:
+            self.model_status.release(GC_LOCK, self.uuid)
+
+    @staticmethod
+    def _temp_uuid(temp_path: Path) -> str:
+        # ".<name>.<uuid>.part" or ".<name>.<uuid>.extract"
+        return temp_path.name.removesuffix(".link").rsplit(".", 2)[1]
+
+    def _temp_busy(self, temp_path: Path) -> bool:
+        model = temp_path.name.removesuffix(".link").rsplit(".", 2)[0][1:]
+        model = model.removesuffix(".zip")
+        return model in self.model_status or f"{model}.zip" in self.model_status
+
+    def remove(self, path: Path):
+        if path.is_dir():
+            for root, _, files in os.walk(path):
+                for file in files:
+                    self._remove_file(Path(root) / file)
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.exists():
+            self._remove_file(path)
+        GC_LOG.info(f"Reclaimed '{path}'.")
+
+    @staticmethod
+    def _remove_file(path: Path):
+        budget = get_gc_io_budget()
+        try:
+            stat = path.stat()
+            # Truncating a hard linked file would cut its other names too.
+            size = stat.st_size if stat.st_nlink == 1 else 0
+            while size > budget:
+                size -= budget
+                os.truncate(path, size)
+                time.sleep(1)
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Already reclaimed by another worker.
+
+
+STORAGE_GC = StorageGC()
@@ -0,0 +1,92 @@
+import os
+import threading
+from typing import Dict
+
+from tools.connect import (
+    get_background_workers,
+    get_bulk_workers,
+    get_interactive_workers,
+)
+from utils import TaskExecutor
+
+from .metrics import REGISTRY
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANE_BACKGROUND = "background"
+
+BACKGROUND_NICENESS = 19
+
+_LANES: Dict[str, TaskExecutor] = {}
+_LANES_LOCK = threading.Lock()
+
+
+def _lower_priority():
+    # Linux applies PRIO_PROCESS to the calling thread only.
+    if hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+        try:
+            os.setpriority(
+                os.PRIO_PROCESS, threading.get_native_id(), BACKGROUND_NICENESS
+            )
+        except OSError:
+            pass
+
+
+def get_lane(name: str) -> TaskExecutor:
+    """Shared executor of a priority lane.
+
+    Quick requests never queue behind multi-GB ingests: ``interactive`` has
+    its own threads, ``bulk`` caps the ingests running at once, and
+    ``background`` runs reclaim work on low priority threads.
+    """
+    with _LANES_LOCK:
+        if name not in _LANES:
+            if name == LANE_INTERACTIVE:
+                lane = TaskExecutor(get_interactive_workers(), name=name)
+            elif name == LANE_BULK:
+                lane = TaskExecutor(get_bulk_workers(), name=name)
+            elif name == LANE_BACKGROUND:
+                lane = TaskExecutor(
+                    get_background_workers(), name=name, initializer=_lower_priority
+                )
+            else:
+                raise ValueError(f"Unsupported task lane '{name}'.")
+            _LANES[name] = lane
+        return _LANES[name]
+
+
+def lane_metrics() -> Dict:
+    return {
+        name: get_lane(name).metrics()
+        for name in (LANE_INTERACTIVE, LANE_BULK, LANE_BACKGROUND)
+    }
+
+
+def _lane_samples(field: str):
+    return [((name,), metrics[field]) for name, metrics in lane_metrics().items()]
+
+
+REGISTRY.gauge(
+    "model_handler_lane_queued",
+    "Tasks queued on each priority lane.",
+    ("lane",),
+    lambda: _lane_samples("queued"),
+)
+REGISTRY.gauge(
+    "model_handler_lane_running",
+    "Tasks running on each priority lane.",
+    ("lane",),
+    lambda: _lane_samples("running"),
+)
+REGISTRY.gauge(
+    "model_handler_lane_workers",
+    "Threads of each priority lane.",
+    ("lane",),
+    lambda: _lane_samples("workers"),
+)
+REGISTRY.gauge(
+    "model_handler_lane_max_wait_seconds",
+    "Longest time a task waited on each priority lane.",
+    ("lane",),
+    lambda: _lane_samples("max_wait_seconds"),
+)
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from tools.connect import get_task_traces
+from utils import log_folder
+
+TRACE_THREAD = "task"
+
+
+class TaskTrace:
+    """Span timings of one task.
+
+    Spans are timed with ``time.perf_counter``, which all threads share, so
+    work done before the task started (the upload spool) or beside it (the
+    hasher thread of a copy) lands on the same timeline. The summary goes in
+    the final event of the task and the spans are written as a Chrome trace
+    file, which ``chrome://tracing`` and Perfetto open.
+    """
+
+    def __init__(self, uuid: str):
+        self.uuid = uuid
+        self.origin = time.perf_counter()
+        self.started = time.time()
+        self.spans: List[Dict] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.add(name, start, time.perf_counter() - start, **args)
+
+    def add(self, name: str, start: float, seconds: float, thread=TRACE_THREAD, **args):
+        # start is a perf_counter value, seconds may be time spent in parallel.
+        with self.lock:
+            self.spans.append(
+                {
+                    "name": name,
+                    "start": start,
+                    "seconds": seconds,
+                    "thread": thread,
+                    "args": args,
+                }
+            )
+
+    def summary(self) -> Dict[str, float]:
+        # Seconds per span name, a stage that ran twice is summed.
+        with self.lock:
+            spans = list(self.spans)
+        timings = {}
+        for span in spans:
+            timings[span["name"]] = timings.get(span["name"], 0) + span["seconds"]
+        timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+        timings["total"] = round(time.perf_counter() - self.origin, 4)
+        return timings
+
+    def to_chrome(self, action: str, status: Optional[str] = None) -> Dict:
+        with self.lock:
+            spans = list(self.spans)
+        origin = min([self.origin] + [span["start"] for span in spans])
+        threads = {TRACE_THREAD: 0}
+        events = []
+        for span in spans:
+            tid = threads.setdefault(span["thread"], len(threads))
+            events.append(
+                {
+                    "name": span["name"],
+                    "ph": "X",
+                    "ts": round((span["start"] - origin) * 1e6),
+                    "dur": round(span["seconds"] * 1e6),
+                    "pid": 0,
+                    "tid": tid,
+                    "args": span["args"],
+                }
+            )
+        events += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for name, tid in threads.items()
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "task_uuid": self.uuid,
+                "action": action,
+                "status": status,
+                "started": self.started,
+                "timings": self.summary(),
+            },
+        }
+
+    def export(self, action: str, status: Optional[str] = None) -> Optional[str]:
+        # Written next to the task log, under log/<date>/traces/<uuid>.json.
+        if not get_task_traces():
+            return None
+        path = os.path.join(log_folder("traces"), f"{self.uuid}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_chrome(action, status), file, default=str)
+        return path
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from tools.connect import (
+    get_state_folder,
+    get_webhook_concurrency,
+    get_webhook_max_attempts,
+    get_webhook_secret,
+    get_webhook_timeout,
+)
+from utils import config_logger
+
+from .state_backend import ClosingConnection
+
+WEBHOOK_LOG = config_logger(
+    file_name="webhooks.log",
+    write_mode="a",
+    level="info",
+    logger_name="webhooks_logger",
+)
+
+SIGNATURE_HEADER = "X-Model-Handler-Signature"
+TIMESTAMP_HEADER = "X-Model-Handler-Timestamp"
+DELIVERY_HEADER = "X-Model-Handler-Delivery"
+EVENT_HEADER = "X-Model-Handler-Event"
+
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 600
+# A claimed delivery is sent again if its sender died before finishing it.
+CLAIM_SECONDS = 60
+IDLE_POLL_SECONDS = 5
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    # HMAC-SHA256 of "<timestamp>.<body>", the timestamp bounds replays.
+    message = timestamp.encode() + b"." + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_permanent(status_code: int) -> bool:
+    # The receiver refused the payload itself, sending it again will not help.
+    return 400 <= status_code < 500 and status_code not in (408, 409, 425, 429)
+
+
+class WebhookOutbox:
+    """Persistent outbox of task completion callbacks.
+
+    A callback is written to SQLite on the models volume before it is sent,
+    and removed once the receiver answered with a 2xx. Failed sends are
+    retried with exponential backoff up to ``WEBHOOK_MAX_ATTEMPTS``. One
+    sender thread per worker sends the due callbacks of every worker through
+    a single pooled client; a callback is claimed for ``CLAIM_SECONDS`` so
+    two senders never post it at once, and one left by a stopped worker is
+    picked up once its claim expires.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.thread: Optional[threading.Thread] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_uuid TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    created REAL
+                );
+                CREATE INDEX IF NOT EXISTS outbox_next ON outbox (next_attempt);
+                """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return ClosingConnection(conn)
+
+    def enqueue(self, task_uuid: str, url: str, event: str, payload: Dict) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            delivery = conn.execute(
+                "INSERT INTO outbox (task_uuid, url, event, payload, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (task_uuid, url, event, json.dumps(payload, default=str), now, now),
+            ).lastrowid
+        WEBHOOK_LOG.info(f"'{task_uuid}' Queue {event} callback {delivery} to {url}.")
+        self._wake()
+        return delivery
+
+    def pending(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, task_uuid, url, event, attempts, next_attempt, last_error "
+                "FROM outbox ORDER BY id"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, limit: int) -> List[Dict]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                [(now + CLAIM_SECONDS, row["id"]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        return [dict(row) for row in rows]
+
+    def next_due(self) -> Optional[float]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()
+        return row[0]
+
+    def delivered(self, delivery: int):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (delivery,))
+
+    def failed(self, row: Dict, error: str, permanent: bool):
+        attempts = row["attempts"] + 1
+        if permanent or attempts >= get_webhook_max_attempts():
+            WEBHOOK_LOG.error(
+                f"'{row['task_uuid']}' Drop {row['event']} callback {row['id']} to "
+                f"{row['url']} after {attempts} attempts. Details : {error}"
+            )
+            self.delivered(row["id"])
+            return
+        delay = retry_delay(attempts)
+        WEBHOOK_LOG.warning(
+            f"'{row['task_uuid']}' Callback {row['id']} attempt {attempts} failed, "
+            f"retry in {round(delay, 1)} seconds. Details : {error}"
+        )
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, error, row["id"]),
+            )
+
+    # Sender
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self._loop()), name="webhooks", daemon=True
+        )
+        self.thread.start()
+
+    def _wake(self):
+        if self.loop is not None and self.wakeup is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def _loop(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        limits = httpx.Limits(max_connections=get_webhook_concurrency())
+        async with httpx.AsyncClient(limits=limits) as client:
+            while True:
+                # Cleared before looking, so a callback queued meanwhile wakes it.
+                self.wakeup.clear()
+                try:
+                    rows = await asyncio.to_thread(
+                        self.claim, get_webhook_concurrency()
+                    )
+                    if rows:
+                        await asyncio.gather(*(self._send(client, row) for row in rows))
+                        continue
+                    next_due = await asyncio.to_thread(self.next_due)
+                except Exception as e:
+                    WEBHOOK_LOG.error(f"Webhook outbox failed. Details : {e}")
+                    next_due = None
+                wait = IDLE_POLL_SECONDS
+                if next_due is not None:
+                    wait = min(max(next_due - time.time(), 0), wait)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _send(self, client: httpx.AsyncClient, row: Dict):
+        if get_webhook_secret() is None:
+            await asyncio.to_thread(self.failed, row, "WEBHOOK_SECRET is unset.", True)
+            return
+        body = row["payload"].encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign(get_webhook_secret(), timestamp, body),
+            DELIVERY_HEADER: str(row["id"]),
+            EVENT_HEADER: row["event"],
+        }
+        try:
+            response = await client.post(
+                row["url"], content=body, headers=headers, timeout=get_webhook_timeout()
+            )
+        except httpx.HTTPError as e:
+            await asyncio.to_thread(self.failed, row, repr(e), False)
+            return
+        if response.is_success:
+            WEBHOOK_LOG.info(
+                f"'{row['task_uuid']}' Delivered {row['event']} callback {row['id']}."
+            )
+            await asyncio.to_thread(self.delivered, row["id"])
+        else:
+            await asyncio.to_thread(
+                self.failed,
+                row,
+                f"HTTP {response.status_code}",
+                is_permanent(response.status_code),
+            )
+
+
+_WEBHOOK_OUTBOX: Optional[WebhookOutbox] = None
+_WEBHOOK_OUTBOX_LOCK = threading.Lock()
+
+
+def get_webhook_outbox() -> WebhookOutbox:
+    global _WEBHOOK_OUTBOX
+    with _WEBHOOK_OUTBOX_LOCK:
+        if _WEBHOOK_OUTBOX is None:
+            _WEBHOOK_OUTBOX = WebhookOutbox(
+                os.path.join(get_state_folder(), "webhooks.db")
+            )
+        return _WEBHOOK_OUTBOX
@@ -1,18 +1,31 @@
 import json
 import os
+import shutil
 import zipfile
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from typing import Callable, Optional
 
-from tools.connect import get_models_folder
-from utils import ResponseErrorHandler
+from tools.connect import get_models_folder, get_trash_folder
+from utils import ResponseErrorHandler, get_uuid
+
+from .ingest_io import IngestWriter
+
+COPY_CHUNK_SIZE = 1024 * 1024
 
 
 class ZipOperator:
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, uuid: Optional[str] = None):
         self.root_path = get_models_folder()
         self.filename = filename
         self.zip_path = Path(self.root_path) / self.filename
         self.extract_path = Path(self.root_path) / self.filename.replace(".zip", "")
+        # Written under hidden names, renamed into place once complete.
+        self.uuid = uuid or get_uuid()
+        self.part_path = Path(self.root_path) / f".{self.filename}.{self.uuid}.part"
+        self.extract_tmp_path = (
+            Path(self.root_path) / f".{self.extract_path.name}.{self.uuid}.extract"
+        )
+        self.zip_committed = False
         self.error_handler = ResponseErrorHandler()
 
     def save_zip(self, file: bytes):
@@ -29,11 +42,34 @@ class ZipOperator:
             )
             raise Exception(json.dumps(self.error_handler.errors))
 
-    def extract(self):
+    @staticmethod
+    def uncompressed_size(file) -> int:
+        # Only the central directory is read, the members are not decompressed.
+        with zipfile.ZipFile(file, "r") as zip_ref:
+            return sum(info.file_size for info in zip_ref.infolist())
+
+    def extract(
+        self,
+        should_stop: Optional[Callable[[], bool]] = None,
+        start: int = 0,
+        on_member: Optional[Callable[[int], None]] = None,
+    ) -> bool:
+        # Extracts into extract_tmp_path from member ``start`` on, on_member
+        # gets the count of members done. Returns False when should_stop
+        # interrupted the extraction.
         try:
             with zipfile.ZipFile(self.zip_path, "r") as zip_ref:
-                os.makedirs(self.extract_path, exist_ok=True)
-                zip_ref.extractall(self.extract_path)
+                os.makedirs(self.extract_tmp_path, exist_ok=True)
+                for index, info in enumerate(zip_ref.infolist()):
+                    if index < start:
+                        continue
+                    if should_stop is not None and should_stop():
+                        return False
+                    if not self.extract_member(zip_ref, info, should_stop):
+                        return False
+                    if on_member is not None:
+                        on_member(index + 1)
+            return True
         except zipfile.BadZipFile as e:
             self.error_handler.add(
                 type=self.error_handler.ERR_UNEXPECTED,
@@ -42,3 +78,57 @@ class ZipOperator:
                 input=dict(),
             )
             raise Exception(json.dumps(self.error_handler.errors))
+
+    def member_path(self, info: zipfile.ZipInfo) -> Path:
+        # Same sanitizing as ZipFile.extractall: no absolute paths, no "..".
+        parts = [
+            part
+            for part in PurePosixPath(info.filename.replace("\\", "/")).parts
+            if part not in ("", "/", ".", "..")
+        ]
+        return self.extract_tmp_path.joinpath(*parts)
+
+    def extract_member(
+        self,
+        zip_ref: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> bool:
+        target = self.member_path(info)
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            return True
+        os.makedirs(target.parent, exist_ok=True)
+        with zip_ref.open(info) as source, IngestWriter(
+            target, size=info.file_size
+        ) as buffer:
+            # A single member can be tens of GB, check between chunks too.
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                if should_stop is not None and should_stop():
+                    return False
+                buffer.write(chunk)
+        return True
+
+    def commit_zip(self):
+        os.replace(self.part_path, self.zip_path)
+        self.zip_committed = True
+
+    def commit_extract(self) -> Optional[Path]:
+        # Swap the extracted folder in. Returns the replaced folder, moved to
+        # the trash for the caller to reclaim.
+        replaced = None
+        if self.extract_path.exists():
+            replaced = (
+                Path(get_trash_folder()) / f"{self.extract_path.name}.{self.uuid}"
+            )
+            os.rename(self.extract_path, replaced)
+        os.rename(self.extract_tmp_path, self.extract_path)
+        return replaced
+
+    def cleanup(self):
+        # Drop what a failed ingest left behind, committed folders are kept.
+        if self.part_path.exists():
+            os.remove(self.part_path)
+        if self.zip_committed and self.zip_path.exists():
+            os.remove(self.zip_path)
+        shutil.rmtree(self.extract_tmp_path, ignore_errors=True)
@@ -1,5 +1,5 @@
 from .background_excutor import TaskExecutor
 from .error import ResponseErrorHandler
-from .log_handler import config_logger
+from .log_handler import close_logger, config_logger, log_folder
 from .uuid_helper import get_uuid
 # from .ws_server import manager
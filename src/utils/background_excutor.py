@@ -1,12 +1,30 @@
 import asyncio
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Optional
 
 
 class TaskExecutor:
-    def __init__(self, max_workers: int = 4):
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.loop = asyncio.get_event_loop()
+    def __init__(
+        self,
+        max_workers: int = 4,
+        name: str = "",
+        initializer: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name, initializer=initializer
+        )
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
 
     def run_in_background(self, task: Callable, *args: Any, **kwargs: Any):
         try:
@@ -16,12 +34,51 @@ class TaskExecutor:
             #     )
             # else:
             #     self.loop.run_in_executor(self.executor, lambda: task(*args, **kwargs))
-            self.loop.run_in_executor(
-                self.executor, lambda: asyncio.run(task(*args, **kwargs))
-            )
+            # Sync routes run outside the event loop, so submit directly.
+            with self.lock:
+                self.queued += 1
+            return self.executor.submit(self._run, time.monotonic(), task, args, kwargs)
         except Exception as e:
+            with self.lock:
+                self.queued -= 1
             raise Exception(e)
 
+    def _run(self, submitted: float, task: Callable, args, kwargs):
+        start = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += start - submitted
+            self.max_wait_seconds = max(self.max_wait_seconds, start - submitted)
+        failed = True
+        try:
+            if asyncio.iscoroutinefunction(task):
+                result = asyncio.run(task(*args, **kwargs))
+            else:
+                result = task(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+                self.run_seconds += time.monotonic() - start
+
+    def metrics(self) -> Dict:
+        with self.lock:
+            started = self.running + self.completed
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_seconds": round(self.wait_seconds / max(started, 1), 4),
+                "max_wait_seconds": round(self.max_wait_seconds, 4),
+                "avg_run_seconds": round(self.run_seconds / max(self.completed, 1), 4),
+            }
+
     def shutdown(self):
         try:
             self.executor.shutdown()
@@ -16,6 +16,18 @@ LOG_LEVEL = {
 
 
 # ===============================================================================================
+def log_folder(sub_folder=None):
+    # Folder of today's logs, created if needed.
+    create_day = datetime.now().strftime("%y-%m-%d")
+    log_root_path = os.path.join(DEFAULT_FOLDER, create_day)
+
+    if sub_folder:  # 如果指定了子目錄
+        log_root_path = os.path.join(log_root_path, sub_folder)
+
+    os.makedirs(log_root_path, exist_ok=True)
+    return log_root_path
+
+
 def config_logger(
     file_name=None,
     write_mode="a",
@@ -44,14 +56,7 @@ def config_logger(
         logger.addHandler(stream_handler)
 
         # 創建日志目錄
-        create_day = datetime.now().strftime("%y-%m-%d")
-        log_root_path = os.path.join(DEFAULT_FOLDER, create_day)
-
-        if sub_folder:  # 如果指定了子目錄
-            log_root_path = os.path.join(log_root_path, sub_folder)
-
-        if not os.path.isdir(log_root_path):
-            os.makedirs(log_root_path)
+        log_root_path = log_folder(sub_folder)
 
         # 添加文件處理器
         if file_name:
@@ -74,6 +79,14 @@ def config_logger(
     return logger
 
 
+def close_logger(logger: logging.Logger):
+    # Per task loggers are named after the task, release their file once it ends.
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logging.Logger.manager.loggerDict.pop(logger.name, None)
+
+
 # ===============================================================================================
 if __name__ == "__main__":
     import test